@@ -1,14 +1,23 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.utils import timezone
-from django.db.models import Count, Sum
+from django.db.models import Count, Sum, Max, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from . import orders as order_flow, shifts, sync
 from .models import (
     User, Category, Restaurant, Product, Cart, CartItem,
     Order, OrderItem, DriverSchedule, Banner, AppSettings
 )
+from .search import index_products
+from .signals import invalidate_catalog
 
 
 # ==================== CUSTOM ADMIN SITE ====================
@@ -18,12 +27,132 @@ admin.site.site_title = "BeninEats Admin"
 admin.site.index_title = "Tableau de Bord"
 
 
+# ==================== CHANGELIST SCALING ====================
+
+# Below this many rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_LIMIT = 10000
+
+
+def estimated_rows(model, using='default'):
+    """Approximate row count of ``model``'s table, without scanning it."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    # Ids only grow, so the highest one is a single index seek and close to the row count
+    return model._default_manager.using(using).aggregate(top=Max('pk'))['top'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for big changelists: an unfiltered list of a large table shows
+    an estimated total instead of running COUNT(*) over every row.
+    Filtered lists keep the exact count.
+    """
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate > EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class FilterAutocompleteSelect(AutocompleteSelect):
+    def __init__(self, field, admin_site, placeholder):
+        super().__init__(field, admin_site)
+        self.placeholder = placeholder
+    
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-placeholder'] = self.placeholder
+        return attrs
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Foreign key filter searching the related model through the admin
+    autocomplete view, instead of listing every related row in the filter
+    bar. The related ModelAdmin must define ``search_fields``.
+    """
+    template = 'admin/api/autocomplete_filter.html'
+    
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        # A cleared select submits an empty value, meaning "all"
+        if self.lookup_kwarg in params and not any(params[self.lookup_kwarg]):
+            params.pop(self.lookup_kwarg)
+        self.lookup_val = (params.get(self.lookup_kwarg) or [None])[-1]
+        super().__init__(field, request, params, model, model_admin, field_path)
+        form_field = forms.ModelChoiceField(
+            queryset=field.related_model._default_manager.all(),
+            widget=FilterAutocompleteSelect(field, model_admin.admin_site, str(self.title)),
+            required=False,
+        )
+        self.form_field = form_field
+    
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+    
+    def has_output(self):
+        return True
+    
+    def widget(self):
+        """The select, holding only the selected object (one query, if any)."""
+        return self.form_field.widget.render(self.lookup_kwarg, self.lookup_val,
+                                             attrs={'id': f'filter_{self.lookup_kwarg}', 'data-width': '100%'})
+    
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'Tous',
+        }
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow with traffic."""
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) behind "N total"
+    show_full_result_count = False
+    
+    @property
+    def media(self):
+        # Scripts for AutocompleteFilter; they only depend on the language
+        return super().media + FilterAutocompleteSelect(None, self.admin_site, '').media
+
+
+def related_aggregate(model, field, aggregate):
+    """Correlated subquery computing ``aggregate`` over the ``model`` rows pointing at the outer row."""
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return Coalesce(Subquery(rows.annotate(value=aggregate).values('value')), 0)
+
+
 # ==================== USER ADMIN ====================
 
+class OnShiftFilter(admin.SimpleListFilter):
+    title = 'En service'
+    parameter_name = 'on_shift'
+    
+    def lookups(self, request, model_admin):
+        return [('now', 'Maintenant')]
+    
+    def queryset(self, request, queryset):
+        if self.value() == 'now':
+            return queryset.filter(pk__in=shifts.on_shift().values('pk'))
+        return queryset
+
+
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     list_display = ['username', 'email', 'role_badge', 'phone', 'availability_status', 'is_active', 'date_joined']
-    list_filter = ['role', 'is_available', 'is_active', 'date_joined']
+    list_filter = ['role', 'is_available', OnShiftFilter, 'is_active', 'date_joined']
     search_fields = ['username', 'email', 'phone', 'first_name', 'last_name']
     ordering = ['-date_joined']
     list_per_page = 25
@@ -85,6 +214,10 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ['is_active']
     ordering = ['order', 'name']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            restaurant_total=related_aggregate(Restaurant.categories.through, 'category', Count('pk')))
+    
     def icon_preview(self, obj):
         return format_html('<i class="fas fa-{}"></i> {}', obj.icon, obj.icon)
     icon_preview.short_description = 'Icône'
@@ -96,9 +229,9 @@ class CategoryAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Image'
     
     def restaurant_count(self, obj):
-        count = obj.restaurants.count()
-        return format_html('<span class="badge badge-info">{}</span>', count)
+        return format_html('<span class="badge badge-info">{}</span>', obj.restaurant_total)
     restaurant_count.short_description = 'Restaurants'
+    restaurant_count.admin_order_field = 'restaurant_total'
 
 
 # ==================== RESTAURANT ADMIN ====================
@@ -112,7 +245,7 @@ class ProductInline(admin.TabularInline):
 
 
 @admin.register(Restaurant)
-class RestaurantAdmin(admin.ModelAdmin):
+class RestaurantAdmin(LargeTableAdmin):
     list_display = ['image_preview', 'name', 'manager_link', 'rating_display', 
                     'product_count', 'order_count', 'status_badge', 'is_active']
     list_filter = ['is_open', 'is_active', 'categories', 'created_at']
@@ -121,6 +254,8 @@ class RestaurantAdmin(admin.ModelAdmin):
     list_editable = ['is_active']
     ordering = ['-created_at']
     list_per_page = 20
+    list_select_related = ['manager']
+    autocomplete_fields = ['manager']
     inlines = [ProductInline]
     
     fieldsets = (
@@ -132,13 +267,13 @@ class RestaurantAdmin(admin.ModelAdmin):
             'classes': ('collapse',),
         }),
         ('📍 Localisation & Contact', {
-            'fields': ('address', 'phone'),
+            'fields': ('address', 'latitude', 'longitude', 'phone'),
         }),
         ('⭐ Évaluations', {
             'fields': ('rating', 'rating_count'),
         }),
         ('🚚 Livraison', {
-            'fields': ('delivery_time', 'delivery_fee', 'minimum_order'),
+            'fields': ('delivery_time', 'delivery_fee', 'delivery_radius', 'minimum_order'),
         }),
         ('🏷️ Catégories', {
             'fields': ('categories',),
@@ -148,6 +283,13 @@ class RestaurantAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # Counted per displayed row through the (restaurant, ...) indexes, not by joining
+        return super().get_queryset(request).annotate(
+            product_total=related_aggregate(Product, 'restaurant', Count('pk')),
+            order_total=related_aggregate(Order, 'restaurant', Count('pk')),
+        )
+    
     def image_preview(self, obj):
         if obj.image:
             return format_html(
@@ -170,16 +312,16 @@ class RestaurantAdmin(admin.ModelAdmin):
     rating_display.short_description = 'Note'
     
     def product_count(self, obj):
-        count = obj.products.count()
         url = reverse('admin:api_product_changelist') + f'?restaurant__id__exact={obj.id}'
-        return format_html('<a href="{}" class="badge badge-primary">{} produits</a>', url, count)
+        return format_html('<a href="{}" class="badge badge-primary">{} produits</a>', url, obj.product_total)
     product_count.short_description = 'Produits'
+    product_count.admin_order_field = 'product_total'
     
     def order_count(self, obj):
-        count = obj.orders.count()
         url = reverse('admin:api_order_changelist') + f'?restaurant__id__exact={obj.id}'
-        return format_html('<a href="{}" class="badge badge-success">{} commandes</a>', url, count)
+        return format_html('<a href="{}" class="badge badge-success">{} commandes</a>', url, obj.order_total)
     order_count.short_description = 'Commandes'
+    order_count.admin_order_field = 'order_total'
     
     def status_badge(self, obj):
         if obj.is_open:
@@ -192,25 +334,31 @@ class RestaurantAdmin(admin.ModelAdmin):
     @admin.action(description='🟢 Ouvrir les restaurants sélectionnés')
     def open_restaurants(self, request, queryset):
         queryset.update(is_open=True)
+        invalidate_catalog(Restaurant)
+        sync.catalog_changed(Restaurant, list(queryset.values_list('pk', flat=True)))
         self.message_user(request, f'{queryset.count()} restaurant(s) ouvert(s)')
     
     @admin.action(description='🔴 Fermer les restaurants sélectionnés')
     def close_restaurants(self, request, queryset):
         queryset.update(is_open=False)
+        invalidate_catalog(Restaurant)
+        sync.catalog_changed(Restaurant, list(queryset.values_list('pk', flat=True)))
         self.message_user(request, f'{queryset.count()} restaurant(s) fermé(s)')
 
 
 # ==================== PRODUCT ADMIN ====================
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ['image_preview', 'name', 'restaurant_link', 'category', 
                     'price_display', 'is_available', 'is_popular', 'is_featured']
-    list_filter = ['restaurant', 'category', 'is_available', 'is_popular', 'is_featured', 'created_at']
+    list_filter = [('restaurant', AutocompleteFilter), 'category', 'is_available', 'is_popular',
+                   'is_featured', 'created_at']
     search_fields = ['name', 'description', 'restaurant__name']
     list_editable = ['is_available', 'is_popular', 'is_featured']
     ordering = ['-created_at']
     list_per_page = 25
+    list_select_related = ['restaurant', 'category']
     autocomplete_fields = ['restaurant', 'category']
     
     fieldsets = (
@@ -270,18 +418,28 @@ class ProductAdmin(admin.ModelAdmin):
     @admin.action(description='✅ Marquer comme disponible')
     def mark_available(self, request, queryset):
         queryset.update(is_available=True)
+        invalidate_catalog(Product)
+        sync.catalog_changed(Product, list(queryset.values_list('pk', flat=True)))
+        index_products(queryset.select_related('category'))
     
     @admin.action(description='❌ Marquer comme indisponible')
     def mark_unavailable(self, request, queryset):
         queryset.update(is_available=False)
+        invalidate_catalog(Product)
+        sync.catalog_changed(Product, list(queryset.values_list('pk', flat=True)))
+        index_products(queryset.select_related('category'))
     
     @admin.action(description='🔥 Marquer comme populaire')
     def mark_popular(self, request, queryset):
         queryset.update(is_popular=True)
+        invalidate_catalog(Product)
+        sync.catalog_changed(Product, list(queryset.values_list('pk', flat=True)))
     
     @admin.action(description='⭐ Marquer à la une')
     def mark_featured(self, request, queryset):
         queryset.update(is_featured=True)
+        invalidate_catalog(Product)
+        sync.catalog_changed(Product, list(queryset.values_list('pk', flat=True)))
 
 
 # ==================== ORDER ADMIN ====================
@@ -292,6 +450,10 @@ class OrderItemInline(admin.TabularInline):
     readonly_fields = ['product', 'product_name', 'product_price', 'quantity', 'subtotal_display']
     can_delete = False
     
+    def get_queryset(self, request):
+        # Product.__str__ shows the restaurant name
+        return super().get_queryset(request).select_related('product__restaurant')
+    
     def subtotal_display(self, obj):
         return format_html('<strong>{} FCFA</strong>', f'{obj.subtotal:,}')
     subtotal_display.short_description = 'Sous-total'
@@ -301,15 +463,17 @@ class OrderItemInline(admin.TabularInline):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ['order_id', 'customer_info', 'restaurant_link', 'items_count', 
                     'total_display', 'status_badge', 'driver_info', 'time_ago']
-    list_filter = ['status', 'restaurant', 'created_at']
+    list_filter = ['status', ('restaurant', AutocompleteFilter), ('driver', AutocompleteFilter), 'created_at']
     search_fields = ['id', 'user__username', 'customer_name', 'customer_phone', 'restaurant__name']
     readonly_fields = ['created_at', 'updated_at', 'total']
-    date_hierarchy = 'created_at'
     ordering = ['-created_at']
     list_per_page = 30
+    # The row's __str__ (used by the changelist) names the customer
+    list_select_related = ['user', 'restaurant', 'driver']
+    autocomplete_fields = ['user', 'restaurant', 'driver']
     inlines = [OrderItemInline]
     
     fieldsets = (
@@ -317,7 +481,8 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('user', 'restaurant', 'status'),
         }),
         ('👤 Client', {
-            'fields': ('customer_name', 'customer_phone', 'delivery_address'),
+            'fields': ('customer_name', 'customer_phone', 'delivery_address',
+                       'delivery_latitude', 'delivery_longitude'),
         }),
         ('💰 Paiement', {
             'fields': ('total', 'delivery_fee'),
@@ -331,6 +496,10 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            item_total=related_aggregate(OrderItem, 'order', Count('pk')))
+    
     def order_id(self, obj):
         return format_html('<strong>#{}</strong>', str(obj.id)[-6:].upper())
     order_id.short_description = 'N° Commande'
@@ -348,9 +517,9 @@ class OrderAdmin(admin.ModelAdmin):
     restaurant_link.short_description = 'Restaurant'
     
     def items_count(self, obj):
-        count = obj.items.count()
-        return format_html('<span class="badge badge-info">{} article(s)</span>', count)
+        return format_html('<span class="badge badge-info">{} article(s)</span>', obj.item_total)
     items_count.short_description = 'Articles'
+    items_count.admin_order_field = 'item_total'
     
     def total_display(self, obj):
         total_with_delivery = obj.total + obj.delivery_fee
@@ -392,27 +561,54 @@ class OrderAdmin(admin.ModelAdmin):
         return format_html('<small style="color: #666;">Il y a {}</small>', timesince(obj.created_at))
     time_ago.short_description = 'Créée'
     
+    def get_readonly_fields(self, request, obj=None):
+        # Rollups are kept per restaurant: an order cannot move to another one
+        return self.readonly_fields + ['restaurant'] if obj else self.readonly_fields
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            with transaction.atomic():
+                super().save_model(request, obj, form, change)
+                order_flow.record_placed([obj], [])
+            return
+        stored = Order.objects.values('status', 'driver_id').get(pk=obj.pk)
+        if (obj.status, obj.driver_id) == (stored['status'], stored['driver_id']):
+            order_flow.update(obj)
+            return
+        status, driver_id = obj.status, obj.driver_id
+        obj.status, obj.driver_id = stored['status'], stored['driver_id']
+        order_flow.set_status(obj, status, driver_id=driver_id)
+    
+    def has_delete_permission(self, request, obj=None):
+        # Deleting would leave the order in the rollups; cancel it instead
+        return False
+    
     actions = ['accept_orders', 'mark_preparing', 'mark_ready', 'mark_delivered', 'cancel_orders']
     
     @admin.action(description='✓ Accepter les commandes')
     def accept_orders(self, request, queryset):
-        queryset.filter(status='pending').update(status='accepted')
+        for order in queryset.filter(status='pending'):
+            order_flow.set_status(order, 'accepted')
     
     @admin.action(description='👨‍🍳 Marquer en préparation')
     def mark_preparing(self, request, queryset):
-        queryset.filter(status='accepted').update(status='preparing')
+        for order in queryset.filter(status='accepted'):
+            order_flow.set_status(order, 'preparing')
     
     @admin.action(description='📦 Marquer comme prêt')
     def mark_ready(self, request, queryset):
-        queryset.filter(status='preparing').update(status='ready')
+        for order in queryset.filter(status='preparing'):
+            order_flow.set_status(order, 'ready')
     
     @admin.action(description='✅ Marquer comme livré')
     def mark_delivered(self, request, queryset):
-        queryset.update(status='delivered')
+        for order in queryset.exclude(status='delivered'):
+            order_flow.set_status(order, 'delivered')
     
     @admin.action(description='❌ Annuler les commandes')
     def cancel_orders(self, request, queryset):
-        queryset.update(status='cancelled')
+        for order in queryset.exclude(status='cancelled'):
+            order_flow.set_status(order, 'cancelled')
 
 
 # ==================== CART ADMIN ====================
@@ -421,6 +617,10 @@ class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
     readonly_fields = ['subtotal_display']
+    autocomplete_fields = ['product']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product__restaurant')
     
     def subtotal_display(self, obj):
         return format_html('{} FCFA', f'{obj.subtotal:,}')
@@ -428,30 +628,41 @@ class CartItemInline(admin.TabularInline):
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     list_display = ['user', 'items_count', 'total_display', 'updated_at']
     search_fields = ['user__username', 'user__email']
     readonly_fields = ['updated_at']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
     inlines = [CartItemInline]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            item_total=related_aggregate(CartItem, 'cart', Count('pk')),
+            amount=related_aggregate(CartItem, 'cart', Sum(F('quantity') * F('product__price'))),
+        )
+    
     def items_count(self, obj):
-        return obj.items.count()
+        return obj.item_total
     items_count.short_description = 'Articles'
+    items_count.admin_order_field = 'item_total'
     
     def total_display(self, obj):
-        total = sum(item.subtotal for item in obj.items.all())
-        return format_html('{} FCFA', f'{total:,}')
+        return format_html('{} FCFA', f'{obj.amount:,}')
     total_display.short_description = 'Total'
+    total_display.admin_order_field = 'amount'
 
 
 # ==================== DRIVER SCHEDULE ADMIN ====================
 
 @admin.register(DriverSchedule)
-class DriverScheduleAdmin(admin.ModelAdmin):
+class DriverScheduleAdmin(LargeTableAdmin):
     list_display = ['driver', 'day_display', 'schedule_display', 'status_badge']
-    list_filter = ['driver', 'day', 'is_enabled']
+    list_filter = [('driver', AutocompleteFilter), 'day', 'is_enabled']
     search_fields = ['driver__username']
     ordering = ['driver', 'day']
+    list_select_related = ['driver']
+    autocomplete_fields = ['driver']
     
     def day_display(self, obj):
         days_fr = {
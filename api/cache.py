@@ -0,0 +1,122 @@
+"""
+Versioned cache for the public catalog endpoints.
+
+Every catalog model has a version counter stored in the cache. Cached
+responses are keyed on the versions of the models they were built from, so
+bumping a counter (see ``signals.py``) makes every dependent entry unreachable
+without having to know which keys exist.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+VERSION_PREFIX = 'catalog:version:'
+RESPONSE_PREFIX = 'catalog:response:'
+
+
+def _version_key(model):
+    return VERSION_PREFIX + model._meta.label_lower
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def get_versions(*models):
+    """
+    Current version of each model, fetched in a single cache round trip.
+    A plain callable may stand in for a model to version data that changes
+    on a schedule rather than on writes.
+    """
+    sources = models
+    models = [source for source in sources if hasattr(source, '_meta')]
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # Seed from the clock rather than 1 so an evicted counter can never
+        # collide with a version that stale entries were stored under.
+        seed = time.time_ns()
+        for key in missing:
+            cache.add(key, seed, timeout=None)
+        versions.update(cache.get_many(missing))
+    return [
+        versions[_version_key(source)] if hasattr(source, '_meta') else source()
+        for source in sources
+    ]
+
+
+def bump_version(*models):
+    for model in models:
+        key = _version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def make_etag(*parts):
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def catalog_etag(*models, per_user=False):
+    """
+    ETag function for ``django.views.decorators.http.condition`` built from
+    model versions, so a 304 costs no database query. ``per_user`` is for
+    endpoints whose payload depends on who is asking.
+    """
+    def etag(request, *args, **kwargs):
+        parts = [*get_versions(*models), *kwargs.values()]
+        if per_user and request.user.is_authenticated:
+            parts.append(f'u{request.user.pk}')
+        return make_etag(*parts)
+    return etag
+
+
+def cached_data(request, models, build):
+    """
+    Return ``build()`` for this request, reusing a previous result while none of
+    ``models`` has changed. The key includes the absolute URI since responses
+    embed absolute media URLs and pagination links.
+    """
+    versions = get_versions(*models)
+    uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    key = RESPONSE_PREFIX + uri + ':' + '.'.join(map(str, versions))
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        if data is not None:
+            cache.set(key, data, _timeout())
+    return data
+
+
+def catalog_cached(*models):
+    """
+    Cache a read-only view whose response is the same for every user.
+    Use ``method_decorator`` to apply it to viewset actions.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+
+            failed = []
+
+            def build():
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    failed.append(response)
+                    return None
+                return response.data
+
+            data = cached_data(request, models, build)
+            if failed:
+                return failed[0]
+            return Response(data)
+        return wrapper
+    return decorator
@@ -0,0 +1,79 @@
+"""
+Automatic dispatch of ready orders to drivers.
+
+Each run reads a snapshot of the ready, unassigned orders (through a partial
+index on that pool) and of the drivers who can take work: available, on
+shift now according to the shift index (see shifts.py), and below
+``MAX_ACTIVE`` deliveries in progress. The assignment is planned in memory
+and applied in one transaction by ``orders.assign_planned``, with the same
+conditional UPDATE as a driver's claim, so an order claimed in the meantime
+is skipped rather than taken away.
+
+Planning is greedy: restaurants are served in order of their oldest ready
+order, each time by the least loaded driver, who takes up to ``MAX_BATCH``
+orders from that restaurant in one pickup.
+"""
+import heapq
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from . import orders as order_flow, shifts
+from .models import Order
+
+MAX_ACTIVE = 3
+MAX_BATCH = 3
+ACTIVE_STATUSES = ('assigned', 'picked_up', 'delivering')
+
+
+def ready_orders():
+    """The unassigned ready orders, oldest first; rows being claimed elsewhere are skipped."""
+    return (
+        Order.objects.select_for_update(skip_locked=True, of=('self',))
+        .filter(status='ready', driver__isnull=True).order_by('ready_at', 'pk')
+    )
+
+
+def driver_loads(now=None, capacity=MAX_ACTIVE):
+    """{driver id: active deliveries} for the drivers who can take an order at ``now``."""
+    rows = (
+        shifts.available(now).order_by().values('pk')
+        .annotate(load=Count('deliveries', filter=Q(deliveries__status__in=ACTIVE_STATUSES)))
+        .values_list('pk', 'load')
+    )
+    return {driver_id: load for driver_id, load in rows if load < capacity}
+
+
+def plan(orders, loads, batch_size=MAX_BATCH, capacity=MAX_ACTIVE):
+    """
+    Map driver ids to the ``orders`` (oldest first) they should take, given
+    each driver's current ``loads``.
+    """
+    drivers = [(load, driver_id) for driver_id, load in loads.items() if load < capacity]
+    heapq.heapify(drivers)
+    by_restaurant = {}
+    for order in orders:
+        by_restaurant.setdefault(order.restaurant_id, []).append(order)
+
+    assignments = {}
+    for pending in by_restaurant.values():
+        while pending and drivers:
+            load, driver_id = heapq.heappop(drivers)
+            take = min(batch_size, capacity - load, len(pending))
+            assignments.setdefault(driver_id, []).extend(pending[:take])
+            pending = pending[take:]
+            if load + take < capacity:
+                heapq.heappush(drivers, (load + take, driver_id))
+        if not drivers:
+            break
+    return assignments
+
+
+def run(now=None, batch_size=MAX_BATCH, capacity=MAX_ACTIVE):
+    """Assign what can be assigned now; returns the orders assigned."""
+    with transaction.atomic():
+        orders = list(ready_orders())
+        if not orders:
+            return []
+        loads = driver_loads(now, capacity)
+        return order_flow.assign_planned(plan(orders, loads, batch_size, capacity))
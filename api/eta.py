@@ -0,0 +1,161 @@
+"""
+Delivery ETA estimates learned from order history.
+
+``RestaurantEtaStats`` keeps running totals per restaurant and local hour,
+updated the first time each order reaches ``ready`` (preparation sample)
+and ``delivered`` (travel sample). Reading an estimate is a lookup of at most two
+rows, normally served from a prefetch.
+"""
+import re
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, RestaurantEtaStats
+
+ALL_HOURS = RestaurantEtaStats.ALL_HOURS
+MIN_SAMPLES = 5
+# Samples beyond this are forgotten orders, not slow kitchens
+MAX_SAMPLE_SECONDS = 4 * 3600
+DELIVERY_TIME_RE = re.compile(r'(\d+)\s*(?:-\s*(\d+))?')
+
+
+def local_hour(when=None):
+    return timezone.localtime(when or timezone.now()).hour
+
+
+def window():
+    """Changes once an hour; lets cached restaurant payloads pick up the next hour's ETA."""
+    return timezone.localtime().strftime('%Y%m%d%H')
+
+
+def _add_sample(restaurant_id, hour, count_field, seconds_field, seconds):
+    for bucket in (hour, ALL_HOURS):
+        increments = {count_field: F(count_field) + 1, seconds_field: F(seconds_field) + seconds}
+        rows = RestaurantEtaStats.objects.filter(restaurant_id=restaurant_id, hour=bucket)
+        if rows.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                RestaurantEtaStats.objects.create(
+                    restaurant_id=restaurant_id, hour=bucket,
+                    **{count_field: 1, seconds_field: seconds},
+                )
+        except IntegrityError:
+            # Another transition created the row first
+            rows.update(**increments)
+
+
+def record(order, milestones):
+    """
+    Fold the samples completed by ``milestones``, the milestone fields the
+    order's last change set for the first time, into the stats.
+    """
+    if 'ready_at' in milestones:
+        seconds = (order.ready_at - order.created_at).total_seconds()
+        if 0 < seconds <= MAX_SAMPLE_SECONDS:
+            _add_sample(order.restaurant_id, local_hour(order.created_at),
+                        'prep_count', 'prep_seconds', seconds)
+    if 'delivered_at' in milestones and order.ready_at:
+        seconds = (order.delivered_at - order.ready_at).total_seconds()
+        if 0 < seconds <= MAX_SAMPLE_SECONDS:
+            _add_sample(order.restaurant_id, local_hour(order.ready_at),
+                        'travel_count', 'travel_seconds', seconds)
+
+
+def _stats_by_hour(restaurant):
+    # Uses the eta_stats prefetch when the caller set one up
+    return {row.hour: row for row in restaurant.eta_stats.all()}
+
+
+def _average(rows, hour, count_field, seconds_field):
+    for bucket in (hour, ALL_HOURS):
+        row = rows.get(bucket)
+        if row and getattr(row, count_field) >= MIN_SAMPLES:
+            return getattr(row, seconds_field) / getattr(row, count_field)
+    return None
+
+
+def durations(restaurant, hour=None):
+    """(prep_seconds, travel_seconds) for the hour, or None when history is too thin."""
+    return durations_from(_stats_by_hour(restaurant), hour)
+
+
+def durations_from(rows, hour=None):
+    """``durations`` over stats rows already keyed by hour."""
+    hour = local_hour() if hour is None else hour
+    prep = _average(rows, hour, 'prep_count', 'prep_seconds')
+    travel = _average(rows, hour, 'travel_count', 'travel_seconds')
+    if prep is None or travel is None:
+        return None
+    return prep, travel
+
+
+def static_minutes(delivery_time):
+    """Midpoint of a hand-typed range such as '30-45 min'."""
+    match = DELIVERY_TIME_RE.search(delivery_time or '')
+    if not match:
+        return None
+    low = int(match.group(1))
+    high = int(match.group(2) or low)
+    return round((low + high) / 2)
+
+
+def restaurant_minutes(restaurant, hour=None):
+    """Expected minutes from ordering now to delivery."""
+    return minutes_from(_stats_by_hour(restaurant), restaurant.delivery_time, hour)
+
+
+def minutes_from(rows, delivery_time, hour=None):
+    """``restaurant_minutes`` over stats rows keyed by hour and the restaurant's delivery_time."""
+    learned = durations_from(rows, hour)
+    if learned is None:
+        return static_minutes(delivery_time)
+    return round(sum(learned) / 60)
+
+
+def order_delivery_at(order):
+    """Estimated delivery time of an order still in progress."""
+    if order.status in ('delivered', 'cancelled'):
+        return None
+    learned = durations(order.restaurant, local_hour(order.created_at))
+    if learned is None:
+        minutes = static_minutes(order.restaurant.delivery_time)
+        return order.created_at + timedelta(minutes=minutes) if minutes is not None else None
+    prep, travel = learned
+    if order.ready_at:
+        return order.ready_at + timedelta(seconds=travel)
+    ready_at = max(order.created_at + timedelta(seconds=prep), timezone.now())
+    return ready_at + timedelta(seconds=travel)
+
+
+def rebuild(batch_size=2000):
+    """Recompute every restaurant's stats from order history."""
+    totals = {}
+
+    def add(restaurant_id, hour, kind, seconds):
+        if not 0 < seconds <= MAX_SAMPLE_SECONDS:
+            return
+        for bucket in (hour, ALL_HOURS):
+            row = totals.setdefault((restaurant_id, bucket), {
+                'prep_count': 0, 'prep_seconds': 0.0, 'travel_count': 0, 'travel_seconds': 0.0,
+            })
+            row[f'{kind}_count'] += 1
+            row[f'{kind}_seconds'] += seconds
+
+    orders = Order.objects.filter(ready_at__isnull=False).values_list(
+        'restaurant_id', 'created_at', 'ready_at', 'delivered_at')
+    for restaurant_id, created_at, ready_at, delivered_at in orders.iterator(chunk_size=batch_size):
+        add(restaurant_id, local_hour(created_at), 'prep', (ready_at - created_at).total_seconds())
+        if delivered_at:
+            add(restaurant_id, local_hour(ready_at), 'travel', (delivered_at - ready_at).total_seconds())
+
+    with transaction.atomic():
+        RestaurantEtaStats.objects.all().delete()
+        RestaurantEtaStats.objects.bulk_create([
+            RestaurantEtaStats(restaurant_id=restaurant_id, hour=hour, **row)
+            for (restaurant_id, hour), row in totals.items()
+        ], batch_size=batch_size)
+    return len(totals)
@@ -0,0 +1,163 @@
+"""
+Order events pushed to clients over Server-Sent Events.
+
+Order changes are published on commit to channels named after who may see the
+order, mirroring ``orders_visible_to``: ``orders`` (admins), ``user:<id>``
+(the customer), ``restaurant:<id>`` (its managers), ``driver:<id>`` (the
+assigned driver, and the previous one when it changes) and ``missions``
+(drivers, while an order is ready and unassigned and when it leaves that
+pool). A client subscribes to the channels of its role through
+``GET /api/orders/events/`` and refetches what changed instead of polling.
+
+Fan-out goes through the broker named by ``ORDER_EVENTS_BROKER``.
+``LocalBroker`` delivers within one process, which is enough for a single
+ASGI server and for tests; running several processes needs a broker shared
+between them with the same ``publish``/``subscribe`` interface.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Restaurant
+
+MAX_PENDING = 100
+
+
+class Subscription:
+    """Messages for one client; iterate with ``await get()`` until it returns None."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=MAX_PENDING)
+        self.overflowed = False
+
+    def deliver(self, message):
+        # Runs on the subscriber's loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client this far behind resynchronises by reconnecting
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout=None):
+        """Next message; raises TimeoutError after ``timeout`` seconds, None once closed."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub; ``publish`` may be called from any thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def subscribe(self, channels):
+        """Subscribe to ``channels``; call from the event loop that will read the messages."""
+        subscription = Subscription(self, channels)
+        with self.lock:
+            for channel in channels:
+                self.subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers[channel].discard(subscription)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+
+    def publish(self, channels, message):
+        with self.lock:
+            # A subscriber of several of the channels gets the message once
+            targets = set().union(*(self.subscribers.get(channel, ()) for channel in channels))
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # Its loop is closed; the stream's cleanup will unsubscribe it
+                pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'ORDER_EVENTS_BROKER', 'api.events.LocalBroker'))()
+    return _broker
+
+
+def channels_for(user):
+    """The channels carrying the orders ``user`` may see."""
+    if user.role == 'admin':
+        return ['orders']
+    if user.role == 'manager':
+        return [f'restaurant:{pk}' for pk in Restaurant.objects.filter(manager=user).values_list('pk', flat=True)]
+    if user.role == 'driver':
+        return [f'driver:{user.pk}', 'missions']
+    return [f'user:{user.pk}']
+
+
+def order_channels(order, previous_status=None, previous_driver_id=None):
+    channels = ['orders', f'user:{order.user_id}', f'restaurant:{order.restaurant_id}']
+    for driver_id in (order.driver_id, previous_driver_id):
+        if driver_id is not None:
+            channels.append(f'driver:{driver_id}')
+    if (order.status == 'ready' and order.driver_id is None) or previous_status == 'ready':
+        channels.append('missions')
+    return list(dict.fromkeys(channels))
+
+
+def _message(order, previous_status):
+    return json.dumps({
+        'type': 'order.created' if previous_status is None else 'order.updated',
+        'id': order.pk,
+        'checkout': order.checkout_id,
+        'restaurant': order.restaurant_id,
+        'driver': order.driver_id,
+        'status': order.status,
+        'previous_status': previous_status,
+        'updated_at': order.updated_at.isoformat(),
+    })
+
+
+def orders_changed(changes):
+    """
+    Publish the new state of orders given as ``(order, previous_status,
+    previous_driver_id)`` with a single callback once the current transaction commits.
+    """
+    messages = [
+        (order_channels(order, previous_status, previous_driver_id), _message(order, previous_status))
+        for order, previous_status, previous_driver_id in changes
+    ]
+    if not messages:
+        return
+
+    def publish():
+        broker = get_broker()
+        for channels, message in messages:
+            broker.publish(channels, message)
+    transaction.on_commit(publish)
+
+
+def order_changed(order, previous_status=None, previous_driver_id=None):
+    """Publish the order's new state once the current transaction commits."""
+    orders_changed([(order, previous_status, previous_driver_id)])
@@ -0,0 +1,81 @@
+"""
+Geohash helpers for proximity queries on plain SQLite.
+
+Restaurants store the geohash of their coordinates in an indexed column. A
+radius query picks the finest geohash precision whose cells are at least as
+large as the radius, so the circle always fits in the 3x3 block of cells
+around the centre. Those nine prefixes become index range seeks, and exact
+distances are only computed for the candidates they return.
+"""
+import math
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+
+def encode(latitude, longitude, precision=MAX_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    total = 5 * precision
+    lat_bits, lng_bits = total // 2, total - total // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """Geohash prefixes whose cells together contain the circle."""
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    precision = 1
+    for p in range(MAX_PRECISION, 0, -1):
+        height, width = cell_size(p)
+        if height >= dlat and width >= dlng:
+            precision = p
+            break
+    height, width = cell_size(precision)
+    cells = set()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            lat = min(max(latitude + dy * height, -89.999999), 89.999999)
+            lng = (longitude + dx * width + 180.0) % 360.0 - 180.0
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def within_cells(cells, field='geohash'):
+    """Q matching rows whose geohash starts with one of ``cells``, as range seeks."""
+    query = Q()
+    for cell in cells:
+        query |= Q(**{f'{field}__gte': cell, f'{field}__lt': cell + '~'})
+    return query
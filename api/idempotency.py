@@ -0,0 +1,102 @@
+"""
+Idempotency-Key support for non-idempotent POST endpoints.
+
+A client that may retry a request (flaky mobile networks) sends a unique
+``Idempotency-Key`` header. The first request with a key runs normally and its
+successful response is stored in the same transaction as the work it did; a
+retry with the same key gets that response back (with ``Idempotent-Replayed``)
+at the cost of one indexed lookup, without running the view again. Keys are
+scoped to the user, expire after ``IDEMPOTENCY_KEY_TTL`` seconds and are
+purged by the ``purge_idempotency_keys`` command.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def expired_before():
+    return timezone.now() - _ttl()
+
+
+def fingerprint(request):
+    """What a retry must repeat exactly: method, path and body."""
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _replay(stored, request_hash):
+    if stored.request_hash != request_hash:
+        return Response({'error': f'{HEADER} was already used for a different request'}, status=422)
+    response = Response(json.loads(stored.response), status=stored.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _lookup(user, key):
+    stored = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if stored is not None and stored.created_at < expired_before():
+        stored.delete()
+        return None
+    return stored
+
+
+def idempotent(view_func):
+    """
+    Replay the stored response when a request repeats an ``Idempotency-Key``.
+    Only successful responses are stored, so a failed attempt can be retried
+    with the same key. Use ``method_decorator`` to apply it to view methods.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_func(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}, status=400)
+
+        request_hash = fingerprint(request)
+        stored = _lookup(request.user, key)
+        if stored is not None:
+            return _replay(stored, request_hash)
+
+        try:
+            with transaction.atomic():
+                # Claimed before the work: a concurrent duplicate blocks on the
+                # unique index until this transaction ends, then replays it
+                stored = IdempotencyKey.objects.create(user=request.user, key=key, request_hash=request_hash)
+                response = view_func(request, *args, **kwargs)
+                if not 200 <= response.status_code < 300:
+                    transaction.set_rollback(True)
+                    return response
+                stored.status_code = response.status_code
+                stored.response = JSONRenderer().render(response.data).decode()
+                stored.save(update_fields=['status_code', 'response'])
+        except IntegrityError:
+            stored = _lookup(request.user, key)
+            if stored is None:
+                raise
+            return _replay(stored, request_hash)
+        return response
+    return wrapper
+
+
+def purge_expired():
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=expired_before()).delete()
+    return deleted
@@ -0,0 +1,146 @@
+"""
+Resized image variants for uploaded photos.
+
+When a model's image changes, the original is kept as uploaded and a worker
+pool renders fixed-size variants (thumb/card/cover) in WebP and JPEG. The
+variant paths are recorded in the model's ``image_variants`` JSON, keyed by
+image field. Until they exist, serializers keep serving the original.
+"""
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from . import sync
+from .cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels; images are never upscaled
+VARIANTS = {
+    'thumb': 160,
+    'card': 480,
+    'cover': 1280,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, thread_name_prefix='image-variants')
+        return _executor
+
+
+def variant_path(name, variant, fmt):
+    stem = posixpath.splitext(name)[0]
+    return f'variants/{stem}/{variant}.{EXTENSIONS[fmt]}'
+
+
+def render(source, size, fmt):
+    image = source.copy()
+    image.thumbnail((size, size), Image.LANCZOS)
+    pil_format, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def build_variants(name):
+    """Render every variant of the stored image ``name`` and return their paths."""
+    with default_storage.open(name, 'rb') as f:
+        source = ImageOps.exif_transpose(Image.open(f))
+        source = source.convert('RGB')
+    variants = {'source': name}
+    for variant, size in VARIANTS.items():
+        variants[variant] = {}
+        for fmt in FORMATS:
+            path = variant_path(name, variant, fmt)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[variant][fmt] = default_storage.save(path, ContentFile(render(source, size, fmt)))
+    return variants
+
+
+def process(label, pk, field, name):
+    """Worker entry point: build variants and record them if the image is still current."""
+    model = apps.get_model(label)
+    try:
+        variants = build_variants(name)
+        with transaction.atomic():
+            instance = model.objects.select_for_update().filter(pk=pk).first()
+            if instance is None or getattr(instance, field).name != name:
+                return
+            stored = dict(instance.image_variants)
+            stored[field] = variants
+            model.objects.filter(pk=pk).update(image_variants=stored)
+            if model in sync.CATALOG_KINDS:
+                sync.catalog_changed(model, [pk])
+        bump_version(model)
+    except Exception:
+        logger.exception('Could not build image variants for %s #%s (%s)', label, pk, name)
+    finally:
+        if settings.IMAGE_WORKERS:
+            connections.close_all()
+
+
+def schedule(instance, field):
+    """Queue variant generation for ``instance.<field>`` once the upload is committed."""
+    name = getattr(instance, field).name
+    args = (instance._meta.label, instance.pk, field, name)
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: _get_executor().submit(process, *args))
+    else:
+        transaction.on_commit(lambda: process(*args))
+
+
+def needs_variants(instance, field):
+    name = getattr(instance, field).name
+    return bool(name) and instance.image_variants.get(field, {}).get('source') != name
+
+
+def variant_name(instance, field, variant, fmt='jpeg'):
+    """Storage name of a variant, or the original while variants are pending."""
+    file = getattr(instance, field)
+    if not file or not file.name:
+        return None
+    return stored_variant(file.name, instance.image_variants.get(field, {}), variant, fmt)
+
+
+def stored_variant(name, variants, variant, fmt='jpeg'):
+    """Pick a variant of ``name`` from one field's ``image_variants`` entry."""
+    if variants.get('source') == name and variant in variants:
+        return variants[variant].get(fmt, name)
+    return name
+
+
+def variant_url(instance, field, variant, request, fmt='jpeg'):
+    name = variant_name(instance, field, variant, fmt)
+    if name is None or request is None:
+        return None
+    return request.build_absolute_uri(default_storage.url(name))
+
+
+def request_format(request):
+    """Clients that decode WebP opt in with ?image_format=webp."""
+    params = getattr(request, 'query_params', None) or getattr(request, 'GET', {})
+    if params.get('image_format') == 'webp':
+        return 'webp'
+    return 'jpeg'
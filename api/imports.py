@@ -0,0 +1,151 @@
+"""
+Bulk menu import from CSV or JSON Lines.
+
+The upload is read line by line, each row is validated with the same field
+rules as ``ProductSerializer`` and valid products are written with
+``bulk_create`` in batches, all inside one transaction. Categories are
+matched by name (case-insensitive) from a single lookup. The import is
+all-or-nothing: if any row is invalid nothing is saved and every row error is
+reported, so a corrected file can simply be uploaded again.
+"""
+import codecs
+import csv
+import json
+
+from django.db import transaction
+from rest_framework import serializers
+
+from . import search, sync
+from .models import Category, Product
+from .serializers import ProductSerializer
+from .signals import invalidate_catalog
+
+BATCH_SIZE = 500
+MAX_ROWS = 10000
+MAX_REPORTED_ERRORS = 200
+COLUMNS = ['name', 'description', 'price', 'category', 'is_available', 'is_popular', 'is_featured']
+CSV_TYPES = {'text/csv', 'application/csv'}
+JSONL_TYPES = {'application/x-ndjson', 'application/jsonl', 'application/x-jsonlines', 'application/json-seq'}
+
+
+class ImportFileError(Exception):
+    pass
+
+
+class ProductImportSerializer(ProductSerializer):
+    """ProductSerializer's rules for one import row; the category is given by name."""
+    category = serializers.CharField(required=False, allow_blank=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = COLUMNS
+
+
+def detect_format(content_type, filename=''):
+    filename = filename.lower()
+    if content_type in CSV_TYPES or filename.endswith('.csv'):
+        return 'csv'
+    if content_type in JSONL_TYPES or filename.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+def read_rows(source, fmt):
+    """Yield (line number, row dict or None, parse error) from an iterable of byte lines."""
+    try:
+        yield from _read_rows(source, fmt)
+    except UnicodeDecodeError:
+        raise ImportFileError('The file must be UTF-8 encoded')
+    except csv.Error as exc:
+        raise ImportFileError(f'Invalid CSV: {exc}')
+
+
+def _read_rows(source, fmt):
+    lines = codecs.iterdecode(source, 'utf-8-sig')
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            extra = row.pop(None, None)
+            if extra:
+                yield reader.line_num, None, 'Too many values'
+            else:
+                yield reader.line_num, row, None
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, 'Invalid JSON'
+            continue
+        if isinstance(row, dict):
+            yield number, row, None
+        else:
+            yield number, None, 'Expected a JSON object'
+
+
+def import_products(restaurant, source, fmt):
+    """
+    Import the rows of ``source`` into ``restaurant``'s menu.
+
+    Returns a report ``{'created', 'error_count', 'errors'}`` where errors lists
+    ``{'row': line, 'errors': {...}}``; nothing is saved when there are errors.
+    """
+    categories = {category.name.lower(): category for category in Category.objects.all()}
+    # One instance for every row: building a serializer's fields costs more than validating
+    validator = ProductImportSerializer()
+    created, errors, error_count, batch = 0, [], 0, []
+
+    def flush():
+        nonlocal created, batch
+        if batch and not error_count:
+            Product.objects.bulk_create(batch)
+            search.index_products(batch)
+            sync.catalog_changed(Product, [product.pk for product in batch])
+            created += len(batch)
+        batch = []
+
+    def report(line, row_errors):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': line, 'errors': row_errors})
+
+    with transaction.atomic():
+        rows = 0
+        for line, row, parse_error in read_rows(source, fmt):
+            rows += 1
+            if rows > MAX_ROWS:
+                raise ImportFileError(f'Imports are limited to {MAX_ROWS} rows')
+            if parse_error:
+                report(line, {'non_field_errors': [parse_error]})
+                continue
+
+            # Empty CSV cells mean "use the default", like an omitted JSON key
+            data = {key: value for key, value in row.items() if value not in ('', None)}
+            try:
+                fields = validator.run_validation(data)
+            except serializers.ValidationError as exc:
+                report(line, exc.detail)
+                continue
+            category_name = fields.pop('category', '').strip()
+            category = categories.get(category_name.lower()) if category_name else None
+            if category_name and category is None:
+                report(line, {'category': [f'Unknown category "{category_name}"']})
+                continue
+            if error_count:
+                continue
+            batch.append(Product(restaurant=restaurant, category=category, **fields))
+            if len(batch) >= BATCH_SIZE:
+                flush()
+
+        if not rows:
+            raise ImportFileError('The file has no rows')
+        flush()
+        if error_count:
+            transaction.set_rollback(True)
+            created = 0
+        else:
+            invalidate_catalog(Product)
+    return {'created': created, 'error_count': error_count, 'errors': errors}
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api import orders
+from api.models import Cart, CartItem, Product, Restaurant, User
+
+DETAILS = {'delivery_address': 'Cotonou', 'customer_name': 'Benchmark', 'customer_phone': '97000000'}
+
+
+class Command(BaseCommand):
+    help = 'Time create_from_cart for small and large baskets on generated data (rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 50])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create(username='benchmark-checkout')
+            cart = Cart.objects.create(user=user)
+            restaurant = Restaurant.objects.create(name='Benchmark', address='Cotonou')
+            products = Product.objects.bulk_create([
+                Product(restaurant=restaurant, name=f'Benchmark {i}', price=1000 + i)
+                for i in range(max(options['sizes']))
+            ])
+
+            # The first order of the day also creates the rollup rows
+            self.fill(cart, products)
+            orders.create_from_cart(user, DETAILS)
+
+            self.stdout.write('Checkout (best of %d):' % options['repeat'])
+            for size in options['sizes']:
+                timings = []
+                for _ in range(options['repeat']):
+                    self.fill(cart, products[:size])
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        orders.create_from_cart(user, DETAILS)
+                        timings.append(time.perf_counter() - start)
+                self.stdout.write(f'  {size:4d} items  {min(timings) * 1000:8.2f} ms  {len(queries):3d} queries')
+            transaction.set_rollback(True)
+
+    def fill(self, cart, products):
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=2) for product in products])
@@ -0,0 +1,28 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import routes
+
+
+class Command(BaseCommand):
+    help = 'Time the route planner on random stops around Cotonou'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, nargs='+', default=[4, 10, 20])
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        self.stdout.write('Route planning (worst of %d):' % options['repeat'])
+        for size in options['stops']:
+            timings = []
+            for _ in range(options['repeat']):
+                points = [(6.35 + rng.random() / 10, 2.35 + rng.random() / 10) for _ in range(size)]
+                # Stops come in pickup/drop-off pairs
+                before = {i + 1: i for i in range(0, size - 1, 2)}
+                start = time.perf_counter()
+                routes.shortest_path(points, before, start=(6.4, 2.4))
+                timings.append(time.perf_counter() - start)
+            self.stdout.write(f'  {size:3d} stops  {max(timings) * 1000:8.2f} ms')
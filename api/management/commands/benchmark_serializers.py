@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from api.models import Category, Product, Restaurant
+from api.rows import ProductRows
+from api.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ProductSerializer with the .values() read path on generated products (rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.populate(options['products'])
+            queryset = Product.objects.filter(name__startswith='Benchmark ').select_related('restaurant', 'category')
+            request = RequestFactory().get('/api/products/')
+
+            instances = list(queryset)
+            rows = list(ProductRows(request).prepare(queryset))
+            slow = self.best(options['repeat'], lambda: ProductSerializer(
+                instances, many=True, context={'request': request}).data)
+            fast = self.best(options['repeat'], lambda: ProductRows(request).serialize(rows))
+
+            slow_total = self.best(options['repeat'], lambda: ProductSerializer(
+                list(queryset), many=True, context={'request': request}).data)
+            fast_total = self.best(options['repeat'], lambda: ProductRows(request).serialize(
+                ProductRows(request).prepare(queryset)))
+            transaction.set_rollback(True)
+
+        count = len(instances)
+        self.stdout.write(f'Serializing {count} products:')
+        self.stdout.write(f'  ProductSerializer  {slow * 1000:8.1f} ms')
+        self.stdout.write(f'  ProductRows        {fast * 1000:8.1f} ms  ({slow / fast:.1f}x)')
+        self.stdout.write('Query + serialize:')
+        self.stdout.write(f'  ProductSerializer  {slow_total * 1000:8.1f} ms')
+        self.stdout.write(f'  ProductRows        {fast_total * 1000:8.1f} ms  ({slow_total / fast_total:.1f}x)')
+
+    def populate(self, count):
+        categories = [Category.objects.create(name=f'Benchmark {i}', icon='star') for i in range(5)]
+        restaurants = [Restaurant.objects.create(name=f'Benchmark {i}', address='Cotonou') for i in range(10)]
+        Product.objects.bulk_create([
+            Product(restaurant=restaurants[i % len(restaurants)],
+                    category=categories[i % len(categories)] if i % 7 else None,
+                    name=f'Benchmark {i}', description='Plat du jour', price=1000 + i,
+                    image=f'products/benchmark-{i}.jpg' if i % 2 else None)
+            for i in range(count)
+        ], batch_size=500)
+
+    def best(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
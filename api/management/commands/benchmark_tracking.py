@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import tracking
+from api.models import User
+from api.views import driver_location
+
+
+class Command(BaseCommand):
+    help = 'Measure driver GPS ping throughput, in the tracker and through the endpoint (rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=1000)
+        parser.add_argument('--pings', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        with transaction.atomic():
+            drivers = User.objects.bulk_create([
+                User(username=f'benchmark-tracking-{i}', role='driver') for i in range(options['drivers'])
+            ])
+            pings = [
+                (rng.choice(drivers), 6.35 + rng.random() / 10, 2.4 + rng.random() / 10)
+                for _ in range(options['pings'])
+            ]
+
+            tracker = tracking.Tracker()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for driver, latitude, longitude in pings:
+                    tracker.record(driver.pk, latitude, longitude)
+                tracker.flush()
+                elapsed = time.perf_counter() - start
+            self.report('Tracker', len(pings), elapsed, len(queries))
+
+            factory = APIRequestFactory()
+            requests = []
+            for driver, latitude, longitude in pings[:options['pings'] // 10]:
+                request = factory.post('/api/driver/location/', {'latitude': latitude, 'longitude': longitude},
+                                       format='json')
+                force_authenticate(request, user=driver)
+                requests.append(request)
+            tracking.tracker = tracking.Tracker()
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for request in requests:
+                        driver_location(request)
+                    tracking.tracker.flush()
+                    elapsed = time.perf_counter() - start
+            finally:
+                tracking.tracker = tracking.Tracker()
+            self.report('Endpoint', len(requests), elapsed, len(queries))
+            transaction.set_rollback(True)
+
+    def report(self, label, pings, elapsed, queries):
+        self.stdout.write(f'  {label:8s} {pings:6d} pings  {pings / elapsed:9.0f} pings/s  {queries:4d} queries')
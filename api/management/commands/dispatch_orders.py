@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import dispatch
+
+
+class Command(BaseCommand):
+    help = 'Keep assigning ready orders to available drivers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between dispatch runs')
+        parser.add_argument('--once', action='store_true', help='Run a single dispatch and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            assigned = dispatch.run()
+            if assigned:
+                self.stdout.write(f'Assigned {len(assigned)} orders')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api import shifts
+from api.models import DriverShiftSlot
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the on-shift driver index from the driver schedules'
+
+    def handle(self, *args, **options):
+        shifts.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {DriverShiftSlot.objects.count()} driver shift slots'))
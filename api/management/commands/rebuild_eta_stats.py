@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import eta
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-restaurant delivery ETA statistics from order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = eta.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} ETA rows'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import search
+from api.models import SearchEntry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product and restaurant search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {SearchEntry.objects.count()} terms'))
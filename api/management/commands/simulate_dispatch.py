@@ -0,0 +1,98 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api import dispatch, shifts
+from api.models import DriverSchedule, Order, Restaurant, User
+
+
+class Command(BaseCommand):
+    help = 'Simulate order arrivals and deliveries against the dispatcher on generated data (rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=5000, help='Orders per hour')
+        parser.add_argument('--hours', type=float, default=1)
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument('--tick', type=int, default=30, help='Simulated seconds between dispatch runs')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            customer, restaurants = self.populate(options)
+            clock = timezone.localtime().replace(hour=10, minute=0, second=0, microsecond=0)
+            end = clock + timedelta(hours=options['hours'])
+            per_tick = options['orders'] * options['tick'] / 3600
+            arrivals, in_progress = 0.0, []
+            runs, queries, waits, placed = [], [], [], 0
+
+            while clock < end:
+                arrivals += per_tick
+                new = int(arrivals)
+                arrivals -= new
+                placed += new
+                Order.objects.bulk_create([
+                    Order(user=customer, restaurant=rng.choice(restaurants), status='ready', ready_at=clock,
+                          total=3000, delivery_address='Cotonou', customer_name='Sim', customer_phone='0')
+                    for _ in range(new)
+                ])
+
+                done = [pk for pk, finish in in_progress if finish <= clock]
+                in_progress = [(pk, finish) for pk, finish in in_progress if finish > clock]
+                if done:
+                    Order.objects.filter(pk__in=done).update(status='delivered', delivered_at=clock)
+
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    assigned = dispatch.run(now=clock)
+                    self.run_commit_callbacks()
+                    runs.append(time.perf_counter() - start)
+                queries.append(len(captured))
+                for order in assigned:
+                    waits.append((clock - order.ready_at).total_seconds() / 60)
+                    in_progress.append((order.pk, clock + timedelta(minutes=rng.uniform(15, 35))))
+                clock += timedelta(seconds=options['tick'])
+
+            waiting = Order.objects.filter(status='ready', driver__isnull=True).count()
+            transaction.set_rollback(True)
+
+        runs_ms = sorted(run * 1000 for run in runs)
+        self.stdout.write(f'{options["drivers"]} drivers, {placed} orders over {options["hours"]}h, '
+                          f'{len(runs)} dispatch runs every {options["tick"]}s:')
+        self.stdout.write(f'  assigned        {len(waits)} ({waiting} still waiting)')
+        self.stdout.write(f'  run time        mean {statistics.mean(runs_ms):.1f} ms, '
+                          f'p95 {runs_ms[int(len(runs_ms) * 0.95)]:.1f} ms, max {runs_ms[-1]:.1f} ms')
+        self.stdout.write(f'  queries per run mean {statistics.mean(queries):.1f}, max {max(queries)}')
+        if waits:
+            waits.sort()
+            self.stdout.write(f'  wait for driver mean {statistics.mean(waits):.1f} min, '
+                              f'p95 {waits[int(len(waits) * 0.95)]:.1f} min')
+
+    def run_commit_callbacks(self):
+        # The outer transaction is rolled back, so what a run queues for after
+        # its commit (sync log, events) would never run; run it here to count it
+        callbacks, connection.run_on_commit[:] = list(connection.run_on_commit), []
+        for _, callback, _ in callbacks:
+            callback()
+
+    def populate(self, options):
+        customer = User.objects.create(username='dispatch-sim')
+        restaurants = Restaurant.objects.bulk_create([
+            Restaurant(name=f'Sim {i}', address='Cotonou') for i in range(options['restaurants'])
+        ])
+        drivers = User.objects.bulk_create([
+            User(username=f'dispatch-sim-{i}', role='driver') for i in range(options['drivers'])
+        ])
+        DriverSchedule.objects.bulk_create([
+            DriverSchedule(driver=driver, day=day, start_time='00:00', end_time='23:59:59')
+            for driver in drivers for day in shifts.WEEKDAYS
+        ])
+        shifts.refresh([driver.pk for driver in drivers])
+        return customer, restaurants
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_teammember_options_alter_product_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('kind', models.CharField(choices=[('product', 'Produit'), ('restaurant', 'Restaurant')], max_length=20)),
+                ('object_id', models.IntegerField()),
+                ('weight', models.IntegerField(default=1)),
+            ],
+            options={
+                'verbose_name_plural': 'Search entries',
+                'indexes': [models.Index(fields=['object_id', 'kind'], name='api_searche_object__cfa197_idx')],
+                'unique_together': {('term', 'kind', 'object_id')},
+            },
+        ),
+    ]
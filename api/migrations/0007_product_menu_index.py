@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['restaurant', 'is_available', 'category'], name='api_product_restaur_be7da6_idx'),
+        ),
+    ]
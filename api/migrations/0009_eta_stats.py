@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_geolocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='ready_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RestaurantEtaStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('prep_count', models.IntegerField(default=0)),
+                ('prep_seconds', models.FloatField(default=0)),
+                ('travel_count', models.IntegerField(default=0)),
+                ('travel_seconds', models.FloatField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eta_stats', to='api.restaurant')),
+            ],
+            options={
+                'verbose_name_plural': 'Restaurant ETA stats',
+                'unique_together': {('restaurant', 'hour')},
+            },
+        ),
+    ]
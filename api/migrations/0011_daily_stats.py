@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('cancelled', models.IntegerField(default=0)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='api.restaurant')),
+            ],
+            options={
+                'verbose_name_plural': 'Restaurant daily stats',
+                'unique_together': {('restaurant', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_sync_changes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driverschedule',
+            index=models.Index(fields=['day', 'start_time'], name='api_drivers_day_505533_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('driver__isnull', True), ('status', 'ready')), fields=['ready_at', 'id'], name='order_ready_pool'),
+        ),
+    ]
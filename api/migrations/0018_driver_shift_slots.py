@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_driver_locations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverShiftSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='driverschedule',
+            name='api_drivers_day_505533_idx',
+        ),
+        migrations.AddField(
+            model_name='drivershiftslot',
+            name='driver',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shift_slots', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='drivershiftslot',
+            unique_together={('slot', 'driver')},
+        ),
+    ]
@@ -1,6 +1,11 @@
+import datetime
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+
+from . import geo
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -16,6 +21,9 @@ class User(AbstractUser):
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     is_available = models.BooleanField(default=True)  # For drivers
     
+    class Meta(AbstractUser.Meta):
+        indexes = [models.Index(fields=['date_joined', 'id'])]
+    
     def __str__(self):
         return f"{self.username} ({self.role})"
 
@@ -24,6 +32,7 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     icon = models.CharField(max_length=50)  # Icon name for frontend
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
     order = models.IntegerField(default=0)
     
@@ -35,17 +44,39 @@ class Category(models.Model):
         return self.name
 
 
+class RestaurantQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Load categories and current ETA stats so list serialization is query-free."""
+        hour = timezone.localtime().hour
+        return self.prefetch_related(
+            'categories',
+            models.Prefetch('eta_stats', queryset=RestaurantEtaStats.objects.filter(
+                hour__in=[hour, RestaurantEtaStats.ALL_HOURS])),
+        )
+    
+    def for_detail(self):
+        """Listing data plus the size of the menu; the menu itself is served separately."""
+        return self.for_listing().annotate(
+            product_count=models.Count('products', filter=models.Q(products__is_available=True))
+        )
+
+
 class Restaurant(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='restaurants/')
     cover_image = models.ImageField(upload_to='restaurants/covers/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     address = models.TextField()
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     phone = models.CharField(max_length=20, blank=True)
     rating = models.DecimalField(max_digits=2, decimal_places=1, default=0)
     rating_count = models.IntegerField(default=0)
     delivery_time = models.CharField(max_length=50, default='30-45 min')
     delivery_fee = models.IntegerField(default=500)
+    delivery_radius = models.FloatField(default=5, help_text='Delivery radius in km')
     minimum_order = models.IntegerField(default=1000)
     is_open = models.BooleanField(default=True)
     is_active = models.BooleanField(default=True)
@@ -54,8 +85,21 @@ class Restaurant(models.Model):
                                 related_name='managed_restaurants', limit_choices_to={'role': 'manager'})
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = RestaurantQuerySet.as_manager()
+    
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        # Keep the proximity index in step with the coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
 
 
 class Product(models.Model):
@@ -65,11 +109,19 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.IntegerField(validators=[MinValueValidator(0)])
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_available = models.BooleanField(default=True)
     is_popular = models.BooleanField(default=False)
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['restaurant', 'created_at', 'id']),
+            models.Index(fields=['restaurant', 'is_available', 'category']),
+        ]
+    
     def __str__(self):
         return f"{self.name} - {self.restaurant.name}"
 
@@ -93,6 +145,23 @@ class CartItem(models.Model):
         return self.product.price * self.quantity
 
 
+class Checkout(models.Model):
+    """One cart checkout; a cart with dishes from several restaurants becomes one order per restaurant."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='checkouts')
+    total = models.IntegerField(default=0)
+    delivery_fee = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Checkout #{self.id} - {self.user.username}"
+
+
+class OrderQuerySet(models.QuerySet):
+    def for_display(self):
+        """Everything OrderSerializer reads, loaded in a fixed number of queries."""
+        return self.select_related('restaurant', 'driver').prefetch_related('items', 'restaurant__eta_stats')
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'En attente'),
@@ -107,6 +176,7 @@ class Order(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
+    checkout = models.ForeignKey(Checkout, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='orders')
     driver = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
                                related_name='deliveries', limit_choices_to={'role': 'driver'})
@@ -114,19 +184,113 @@ class Order(models.Model):
     total = models.IntegerField(default=0)
     delivery_fee = models.IntegerField(default=500)
     delivery_address = models.TextField()
+    delivery_latitude = models.FloatField(null=True, blank=True)
+    delivery_longitude = models.FloatField(null=True, blank=True)
     customer_name = models.CharField(max_length=200)
     customer_phone = models.CharField(max_length=20)
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = OrderQuerySet.as_manager()
     
     class Meta:
         ordering = ['-created_at']
+        # Keyset pagination seeks on (created_at, id) within each role's scope
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['restaurant', 'created_at', 'id']),
+            models.Index(fields=['driver', 'created_at', 'id']),
+            # The dispatcher's snapshot of orders waiting for a driver
+            models.Index(fields=['ready_at', 'id'], name='order_ready_pool',
+                         condition=models.Q(status='ready', driver__isnull=True)),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
 
 
+class RestaurantEtaStats(models.Model):
+    """
+    Running totals of preparation (pending -> ready) and travel (ready ->
+    delivered) durations for one restaurant and local hour of day. Hour
+    ``ALL_HOURS`` aggregates the whole day and backs sparse hours.
+    """
+    ALL_HOURS = 24
+    
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='eta_stats')
+    hour = models.PositiveSmallIntegerField()
+    prep_count = models.IntegerField(default=0)
+    prep_seconds = models.FloatField(default=0)
+    travel_count = models.IntegerField(default=0)
+    travel_seconds = models.FloatField(default=0)
+    
+    class Meta:
+        verbose_name_plural = 'Restaurant ETA stats'
+        unique_together = ['restaurant', 'hour']
+    
+    def __str__(self):
+        return f"{self.restaurant.name} - {self.hour}h"
+
+
+class RestaurantDailyStats(models.Model):
+    """
+    Order counters for one restaurant and local calendar day (the day the
+    order was placed), kept up to date as orders are created and change
+    status. The ``ALL_TIME`` row holds the same counters over every day.
+    """
+    ALL_TIME = datetime.date.min
+    
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    revenue = models.IntegerField(default=0)  # Totals of orders not cancelled
+    pending = models.IntegerField(default=0)  # Orders still pending, accepted or preparing
+    cancelled = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = 'Restaurant daily stats'
+        unique_together = ['restaurant', 'date']
+    
+    def __str__(self):
+        return f"{self.restaurant.name} - {self.date}"
+
+
+class RestaurantHourlyStats(models.Model):
+    """Orders placed per restaurant, local day and hour of day."""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='hourly_stats')
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    orders = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = 'Restaurant hourly stats'
+        unique_together = ['restaurant', 'date', 'hour']
+    
+    def __str__(self):
+        return f"{self.restaurant.name} - {self.date} {self.hour}h"
+
+
+class ProductDailyStats(models.Model):
+    """Quantity and revenue sold per product and local day, cancelled orders excluded."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_stats')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='product_stats')
+    date = models.DateField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name_plural = 'Product daily stats'
+        unique_together = ['product', 'date']
+        indexes = [models.Index(fields=['restaurant', 'date'])]
+    
+    def __str__(self):
+        return f"{self.product.name} - {self.date}"
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -173,6 +337,7 @@ class Banner(models.Model):
     title = models.CharField(max_length=200)
     subtitle = models.CharField(max_length=300, blank=True)
     image = models.ImageField(upload_to='banners/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     link_type = models.CharField(max_length=50, blank=True)
     link_id = models.IntegerField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
@@ -215,3 +380,75 @@ class TeamMember(models.Model):
     
     def __str__(self):
         return f"{self.name} - {self.role}"
+
+
+class DriverShiftSlot(models.Model):
+    """A quarter-hour of the week (Monday 00:00 is slot 0) a driver is on shift; see shifts.py."""
+    slot = models.PositiveSmallIntegerField()
+    driver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shift_slots')
+    
+    class Meta:
+        # Slot leads so "on shift at T" is one index seek returning only those drivers
+        unique_together = ['slot', 'driver']
+
+
+class SearchEntry(models.Model):
+    """Inverted index posting: one folded term pointing at a product or restaurant."""
+    KIND_CHOICES = [
+        ('product', 'Produit'),
+        ('restaurant', 'Restaurant'),
+    ]
+    
+    term = models.CharField(max_length=64)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    weight = models.IntegerField(default=1)
+    
+    class Meta:
+        verbose_name_plural = 'Search entries'
+        # Term leads the unique index so prefix ranges are index seeks; the
+        # (object_id, kind) index serves reindexing without competing for them
+        unique_together = ['term', 'kind', 'object_id']
+        indexes = [models.Index(fields=['object_id', 'kind'])]
+    
+    def __str__(self):
+        return f"{self.term} -> {self.kind}#{self.object_id}"
+
+
+class SyncChange(models.Model):
+    """One entry of the delta sync change log; the id is the clients' cursor (see sync.py)."""
+    channel = models.CharField(max_length=50)
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['channel', 'id'])]
+
+
+class DriverLocation(models.Model):
+    """A GPS point reported by a driver; written in batches by ``tracking``."""
+    driver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='locations')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    recorded_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['driver', 'recorded_at']),
+            models.Index(fields=['recorded_at']),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """A client's Idempotency-Key and the response its first request got (see idempotency.py)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(default=0)
+    response = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        unique_together = ['user', 'key']
@@ -0,0 +1,185 @@
+"""
+Checkout and order status transitions.
+
+Every order write goes through this module: ``record_placed`` for new orders,
+``set_status`` for status changes (``assign`` and ``assign_planned`` for
+driver assignments) and ``update`` for other edits. That keeps the milestone
+timestamps and what is derived from them (ETA samples, daily rollups, pushed
+order events, the sync log) consistent whichever endpoint or admin form made
+the change. Orders are cancelled, never deleted.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import eta, events, rollups, sync
+from .models import Cart, CartItem, Checkout, Order, OrderItem
+
+STATUSES = {value for value, _ in Order.STATUS_CHOICES}
+MILESTONES = {
+    'ready': 'ready_at',
+    'delivered': 'delivered_at',
+}
+
+
+def _record_all(changes):
+    """
+    Derive everything that follows from ``(order, previous status, previous
+    driver id, milestones set for the first time)`` changes; publishing and the
+    sync log take one post-commit callback each, however many orders changed.
+    """
+    notified = []
+    for order, previous, previous_driver_id, reached in changes:
+        if order.status != previous:
+            eta.record(order, reached)
+            rollups.record_transition(order, previous)
+        if order.status != previous or order.driver_id != previous_driver_id:
+            notified.append((order, previous, previous_driver_id))
+    events.orders_changed(notified)
+    sync.orders_changed(notified)
+
+
+def _record(order, previous, previous_driver_id=None, reached=()):
+    _record_all([(order, previous, previous_driver_id, reached)])
+
+
+def record_placed(orders, items):
+    """Count, publish and log newly created ``orders``; call inside the transaction that created them."""
+    rollups.record_created(orders, items)
+    events.orders_changed([(order, None, None) for order in orders])
+    sync.orders_changed([(order, None, None) for order in orders])
+
+
+def create_from_cart(user, details):
+    """
+    Turn ``user``'s cart into a Checkout with one order per restaurant, all with
+    the same ``details`` (address, contact, notes) and each with its
+    restaurant's delivery fee.
+
+    Returns None when the cart is empty. Everything happens in one transaction
+    and a fixed number of queries, whatever the number of lines or restaurants.
+    The cart lines are locked first, so a concurrent checkout of the same cart
+    finds it empty.
+    """
+    with transaction.atomic():
+        lines = list(
+            CartItem.objects.select_for_update(of=('self',))
+            .filter(cart__user=user).select_related('product__restaurant').order_by('pk')
+        )
+        if not lines:
+            return None
+
+        # Restaurants in the order their first line was added
+        by_restaurant = {}
+        for line in lines:
+            by_restaurant.setdefault(line.product.restaurant, []).append(line)
+
+        checkout = Checkout.objects.create(
+            user=user,
+            total=sum(line.subtotal for line in lines),
+            delivery_fee=sum(restaurant.delivery_fee for restaurant in by_restaurant),
+        )
+        orders = Order.objects.bulk_create([
+            Order(user=user, checkout=checkout, restaurant=restaurant,
+                  total=sum(line.subtotal for line in restaurant_lines),
+                  delivery_fee=restaurant.delivery_fee, **details)
+            for restaurant, restaurant_lines in by_restaurant.items()
+        ])
+        items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=line.product, product_name=line.product.name,
+                      product_price=line.product.price, quantity=line.quantity)
+            for order, restaurant_lines in zip(orders, by_restaurant.values())
+            for line in restaurant_lines
+        ])
+        record_placed(orders, items)
+        CartItem.objects.filter(pk__in=[line.pk for line in lines]).delete()
+        # The cart's ETag is derived from updated_at
+        Cart.objects.filter(user=user).update(updated_at=timezone.now())
+    return checkout
+
+
+def set_status(order, status, **changes):
+    """Move ``order`` to ``status``, applying any other field ``changes`` in the same save."""
+    previous, previous_driver_id = order.status, order.driver_id
+    unset = {field for field in MILESTONES.values() if getattr(order, field) is None}
+    for field, value in changes.items():
+        setattr(order, field, value)
+    order.status = status
+    milestone = MILESTONES.get(status)
+    if milestone and getattr(order, milestone) is None:
+        setattr(order, milestone, timezone.now())
+    # An order sent back to an earlier status keeps its milestones and gives no new samples
+    reached = {field for field in unset if getattr(order, field) is not None}
+
+    with transaction.atomic():
+        order.save()
+        _record(order, previous, previous_driver_id, reached)
+    return order
+
+
+def update(order, **changes):
+    """
+    Save edits to fields that feed no statistics (address, contact, notes...)
+    and tell clients; status, driver and restaurant changes go through
+    ``set_status`` and ``assign``.
+    """
+    for field, value in changes.items():
+        setattr(order, field, value)
+    with transaction.atomic():
+        order.save()
+        events.order_changed(order, order.status, order.driver_id)
+        sync.orders_changed([(order, order.status, order.driver_id)])
+    return order
+
+
+def assign(order, driver_id, status='assigned'):
+    """
+    Give the unassigned ``order`` to ``driver_id`` unless someone else got it first.
+
+    The UPDATE only matches while the row still has no driver and the status it
+    was read with, so of any number of concurrent callers exactly one gets the
+    order. The others get False, without waiting, and ``order`` is unchanged.
+    """
+    previous = order.status
+    now = timezone.now()
+    changes = {'driver_id': driver_id, 'status': status, 'updated_at': now}
+    milestone = MILESTONES.get(status)
+    if milestone and getattr(order, milestone) is None:
+        changes[milestone] = now
+
+    with transaction.atomic():
+        claimed = Order.objects.filter(pk=order.pk, driver__isnull=True, status=previous).update(**changes)
+        if not claimed:
+            return False
+        for field, value in changes.items():
+            setattr(order, field, value)
+        _record(order, previous, reached={milestone} & changes.keys())
+    return True
+
+
+def assign_planned(assignments, status='assigned'):
+    """
+    Apply ``assignments`` ({driver id: [ready, unassigned orders]}) in one
+    transaction, with one conditional UPDATE per driver like ``assign``. Orders
+    claimed or changed meanwhile are left alone; returns the orders assigned.
+    Events and sync log rows for the whole batch go out in one callback each.
+    """
+    now = timezone.now()
+    planned = {order.pk: (driver_id, order) for driver_id, orders in assignments.items() for order in orders}
+    if not planned:
+        return []
+
+    with transaction.atomic():
+        for driver_id, orders in assignments.items():
+            Order.objects.filter(pk__in=[order.pk for order in orders], driver__isnull=True, status='ready').update(
+                driver_id=driver_id, status=status, updated_at=now)
+        current = dict(
+            Order.objects.filter(pk__in=planned, status=status, updated_at=now).values_list('pk', 'driver_id'))
+        assigned, changes = [], []
+        for pk, (driver_id, order) in planned.items():
+            if current.get(pk) != driver_id:
+                continue
+            changes.append((order, order.status, None, ()))
+            order.driver_id, order.status, order.updated_at = driver_id, status, now
+            assigned.append(order)
+        _record_all(changes)
+    return assigned
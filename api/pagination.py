@@ -0,0 +1,113 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first keyset pagination on (``ordering_field``, id).
+
+    Each page is a range seek from the last row seen, so there is no COUNT and
+    no OFFSET, and rows inserted while a client pages never shift or repeat
+    entries. Responses have the same shape as the default paginator without
+    ``count``.
+    """
+    ordering_field = 'created_at'
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        field = self.ordering_field
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+
+        if cursor:
+            position, pk = cursor['p'], cursor['i']
+            if reverse:
+                queryset = queryset.filter(Q(**{f'{field}__gt': position}) | Q(**{field: position, 'id__gt': pk}))
+            else:
+                queryset = queryset.filter(Q(**{f'{field}__lt': position}) | Q(**{field: position, 'id__lt': pk}))
+
+        if reverse:
+            queryset = queryset.order_by(field, 'id')
+        else:
+            queryset = queryset.order_by(f'-{field}', '-id')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        if reverse:
+            self.has_next, self.has_previous = bool(results), has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        if isinstance(obj, dict):
+            # Rows from .values(), see rows.py
+            position, pk = obj[self.ordering_field], obj['id']
+        else:
+            position, pk = getattr(obj, self.ordering_field), obj.pk
+        payload = json.dumps({'p': position.isoformat(), 'i': pk, 'r': int(reverse)})
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            cursor['p'] = datetime.fromisoformat(cursor['p'])
+            cursor['i'] = int(cursor['i'])
+            cursor['r'] = int(cursor.get('r', 0))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+
+class UserKeysetPagination(KeysetPagination):
+    ordering_field = 'date_joined'
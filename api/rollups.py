@@ -0,0 +1,274 @@
+"""
+Order rollups per restaurant, for dashboards and analytics.
+
+Three tables are adjusted in the same transaction as the order change that
+affects them, ``record_created`` when an order is placed and
+``record_transition`` from ``orders.set_status``:
+
+- ``RestaurantDailyStats``: order counters for the day the order was placed
+  and for the ``ALL_TIME`` row;
+- ``RestaurantHourlyStats``: orders placed per day and hour;
+- ``ProductDailyStats``: quantity and revenue per product and day, without
+  cancelled orders.
+
+Dashboards and reports then read or sum a bounded number of rows instead of
+aggregating order history.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import Order, OrderItem, ProductDailyStats, RestaurantDailyStats, RestaurantHourlyStats
+
+ALL_TIME = RestaurantDailyStats.ALL_TIME
+COUNTERS = ('orders', 'revenue', 'pending', 'cancelled')
+PENDING_STATUSES = {'pending', 'accepted', 'preparing'}
+
+
+def local_date(when=None):
+    return timezone.localdate(when or timezone.now())
+
+
+def _increment(model, lookup, deltas):
+    """Add ``deltas`` to the row matching ``lookup``, creating it if needed."""
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    rows = model.objects.filter(**lookup)
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another order created the row first
+        rows.update(**increments)
+
+
+def _apply(restaurant_id, day, deltas):
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        for bucket in (day, ALL_TIME):
+            _increment(RestaurantDailyStats, {'restaurant_id': restaurant_id, 'date': bucket}, deltas)
+
+
+def _add(model, keys, totals, defaults=None):
+    """
+    Add the counter deltas ``totals[key]`` to the row whose ``keys`` fields equal
+    ``key``, creating missing rows with ``defaults[key]`` as extra fields. Takes a
+    fixed number of queries however many rows are touched.
+    """
+    if not totals:
+        return
+    lookup = Q()
+    for key in totals:
+        lookup |= Q(**dict(zip(keys, key)))
+    existing = {
+        tuple(getattr(row, field) for field in keys): row
+        for row in model.objects.filter(lookup)
+    }
+    fields = sorted({field for deltas in totals.values() for field in deltas})
+    for key, row in existing.items():
+        for field in fields:
+            setattr(row, field, F(field) + totals[key].get(field, 0))
+    if existing:
+        model.objects.bulk_update(existing.values(), fields)
+
+    missing = [key for key in totals if key not in existing]
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([
+                model(**dict(zip(keys, key)), **(defaults or {}).get(key, {}), **totals[key])
+                for key in missing
+            ])
+    except IntegrityError:
+        # A concurrent order created some of the rows; fall back to one upsert each
+        for key in missing:
+            _increment(model, dict(zip(keys, key)), totals[key])
+
+
+def _add_items(restaurant_id, day, items, sign=1):
+    """Add (or with ``sign=-1`` remove) order items to the product rows of ``day``."""
+    totals = defaultdict(lambda: {'quantity': 0, 'revenue': 0})
+    for product_id, quantity, price in items:
+        totals[product_id, day]['quantity'] += sign * quantity
+        totals[product_id, day]['revenue'] += sign * quantity * price
+    defaults = {key: {'restaurant_id': restaurant_id} for key in totals}
+    _add(ProductDailyStats, ('product_id', 'date'), totals, defaults)
+
+
+def _contribution(status, total):
+    """What one order in ``status`` adds to each counter, apart from ``orders``."""
+    cancelled = status == 'cancelled'
+    return {
+        'revenue': 0 if cancelled else total,
+        'pending': int(status in PENDING_STATUSES),
+        'cancelled': int(cancelled),
+    }
+
+
+def record_created(orders, items):
+    """
+    Count newly placed ``orders`` and their ``items``; call inside the transaction
+    that created them. The query count does not depend on how many there are.
+    """
+    daily = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    hourly = defaultdict(lambda: {'orders': 0})
+    products = defaultdict(lambda: {'quantity': 0, 'revenue': 0})
+    owners = {}
+    placed = {}
+    for order in orders:
+        when = timezone.localtime(order.created_at)
+        placed[order.pk] = when.date()
+        deltas = _contribution(order.status, order.total)
+        deltas['orders'] = 1
+        for bucket in (when.date(), ALL_TIME):
+            row = daily[order.restaurant_id, bucket]
+            for field, delta in deltas.items():
+                row[field] += delta
+        hourly[order.restaurant_id, when.date(), when.hour]['orders'] += 1
+
+    cancelled = {order.pk for order in orders if order.status == 'cancelled'}
+    for item in items:
+        if item.order_id in cancelled:
+            continue
+        key = item.product_id, placed[item.order_id]
+        products[key]['quantity'] += item.quantity
+        products[key]['revenue'] += item.quantity * item.product_price
+        owners[key] = {'restaurant_id': item.order.restaurant_id}
+
+    _add(RestaurantDailyStats, ('restaurant_id', 'date'), daily)
+    _add(RestaurantHourlyStats, ('restaurant_id', 'date', 'hour'), hourly)
+    _add(ProductDailyStats, ('product_id', 'date'), products, owners)
+
+
+def record_transition(order, previous):
+    """Move the order's contribution from status ``previous`` to its current status."""
+    day = local_date(order.created_at)
+    before = _contribution(previous, order.total)
+    after = _contribution(order.status, order.total)
+    _apply(order.restaurant_id, day, {field: after[field] - before[field] for field in after})
+    if before['cancelled'] != after['cancelled']:
+        items = order.items.values_list('product_id', 'quantity', 'product_price')
+        _add_items(order.restaurant_id, day, items, sign=-1 if after['cancelled'] else 1)
+
+
+def dashboard(restaurant_ids=None):
+    """Today's and all-time counters, summed over ``restaurant_ids`` (default: every restaurant)."""
+    today = local_date()
+    rows = RestaurantDailyStats.objects.filter(date__in=[today, ALL_TIME])
+    if restaurant_ids is not None:
+        rows = rows.filter(restaurant_id__in=restaurant_ids)
+    totals = {ALL_TIME: dict.fromkeys(COUNTERS, 0), today: dict.fromkeys(COUNTERS, 0)}
+    for row in rows.values('date').annotate(**{field: Sum(field) for field in COUNTERS}):
+        totals[row['date']].update({field: row[field] for field in COUNTERS})
+    return {'today': totals[today], 'all_time': totals[ALL_TIME]}
+
+
+# ==================== REPORTS ====================
+
+def _scoped(model, start, end, restaurant_ids):
+    rows = model.objects.filter(date__gte=start, date__lte=end)
+    if restaurant_ids is not None:
+        rows = rows.filter(restaurant_id__in=restaurant_ids)
+    return rows
+
+
+def revenue(start, end, restaurant_ids=None, period='day'):
+    """Revenue and order counts per day, or per ISO week starting on Monday."""
+    rows = (
+        _scoped(RestaurantDailyStats, start, end, restaurant_ids)
+        .values('date').annotate(orders=Sum('orders'), cancelled=Sum('cancelled'), revenue=Sum('revenue'))
+        .order_by('date')
+    )
+    buckets = {}
+    for row in rows:
+        key = row['date'] - timedelta(days=row['date'].weekday()) if period == 'week' else row['date']
+        bucket = buckets.setdefault(key, {'period': key, 'orders': 0, 'cancelled': 0, 'revenue': 0})
+        for field in ('orders', 'cancelled', 'revenue'):
+            bucket[field] += row[field]
+    return list(buckets.values())
+
+
+def orders_by_hour(start, end, restaurant_ids=None):
+    """Orders placed per hour of day over the period, all 24 hours listed."""
+    counts = dict.fromkeys(range(24), 0)
+    rows = _scoped(RestaurantHourlyStats, start, end, restaurant_ids).values('hour').annotate(total=Sum('orders'))
+    for row in rows:
+        counts[row['hour']] = row['total']
+    return [{'hour': hour, 'orders': orders} for hour, orders in counts.items()]
+
+
+def top_products(start, end, restaurant_ids=None, by='quantity', limit=10):
+    rows = (
+        _scoped(ProductDailyStats, start, end, restaurant_ids)
+        .values('product_id', 'product__name', 'restaurant_id')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .filter(quantity__gt=0)
+        .order_by(f'-{by}', 'product_id')[:limit]
+    )
+    return [
+        {'product_id': row['product_id'], 'name': row['product__name'], 'restaurant_id': row['restaurant_id'],
+         'quantity': row['quantity'], 'revenue': row['revenue']}
+        for row in rows
+    ]
+
+
+def basket(start, end, restaurant_ids=None):
+    """Average value and item count of the orders placed and not cancelled over the period."""
+    totals = _scoped(RestaurantDailyStats, start, end, restaurant_ids).aggregate(
+        orders=Sum('orders'), cancelled=Sum('cancelled'), revenue=Sum('revenue'))
+    items = _scoped(ProductDailyStats, start, end, restaurant_ids).aggregate(quantity=Sum('quantity'))
+    orders = (totals['orders'] or 0) - (totals['cancelled'] or 0)
+    return {
+        'orders': orders,
+        'revenue': totals['revenue'] or 0,
+        'average_value': round((totals['revenue'] or 0) / orders) if orders else 0,
+        'average_items': round((items['quantity'] or 0) / orders, 2) if orders else 0,
+    }
+
+
+# ==================== REBUILD ====================
+
+def rebuild(batch_size=2000):
+    """Recompute every rollup from order history."""
+    daily, hourly, products = {}, defaultdict(int), defaultdict(lambda: [0, 0])
+    orders = Order.objects.values_list('restaurant_id', 'created_at', 'status', 'total')
+    for restaurant_id, created_at, status, total in orders.iterator(chunk_size=batch_size):
+        placed = timezone.localtime(created_at)
+        deltas = _contribution(status, total)
+        deltas['orders'] = 1
+        for bucket in (placed.date(), ALL_TIME):
+            row = daily.setdefault((restaurant_id, bucket), dict.fromkeys(COUNTERS, 0))
+            for field, delta in deltas.items():
+                row[field] += delta
+        hourly[restaurant_id, placed.date(), placed.hour] += 1
+
+    items = OrderItem.objects.exclude(order__status='cancelled').values_list(
+        'order__restaurant_id', 'order__created_at', 'product_id', 'quantity', 'product_price')
+    for restaurant_id, created_at, product_id, quantity, price in items.iterator(chunk_size=batch_size):
+        row = products[product_id, restaurant_id, local_date(created_at)]
+        row[0] += quantity
+        row[1] += quantity * price
+
+    with transaction.atomic():
+        RestaurantDailyStats.objects.all().delete()
+        RestaurantHourlyStats.objects.all().delete()
+        ProductDailyStats.objects.all().delete()
+        RestaurantDailyStats.objects.bulk_create([
+            RestaurantDailyStats(restaurant_id=restaurant_id, date=day, **row)
+            for (restaurant_id, day), row in daily.items()
+        ], batch_size=batch_size)
+        RestaurantHourlyStats.objects.bulk_create([
+            RestaurantHourlyStats(restaurant_id=restaurant_id, date=day, hour=hour, orders=count)
+            for (restaurant_id, day, hour), count in hourly.items()
+        ], batch_size=batch_size)
+        ProductDailyStats.objects.bulk_create([
+            ProductDailyStats(product_id=product_id, restaurant_id=restaurant_id, date=day,
+                              quantity=quantity, revenue=revenue)
+            for (product_id, restaurant_id, day), (quantity, revenue) in products.items()
+        ], batch_size=batch_size)
+    return len(daily) + len(hourly) + len(products)
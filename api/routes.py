@@ -0,0 +1,121 @@
+"""
+Multi-drop route planning for a driver's active orders.
+
+An order still to be collected gives two stops, a pickup at its restaurant
+then a drop-off at its delivery coordinates; an order already picked up only
+its drop-off. The route starts from the driver's last known position when
+there is one. It is built by nearest neighbour and improved with 2-opt, both
+keeping every pickup before its drop-off. Legs are haversine distances times
+``ROAD_FACTOR``, driven at ``AVERAGE_SPEED_KMH`` with ``STOP_MINUTES`` spent
+at each stop. Ten stops take well under a millisecond.
+
+Stops without coordinates cannot be placed. Their orders come last, in their
+original order, without estimated times.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import geo, tracking
+from .models import Order
+
+ROAD_FACTOR = 1.3
+AVERAGE_SPEED_KMH = 20
+STOP_MINUTES = 3
+ROUTED_STATUSES = ('assigned', 'picked_up', 'delivering')
+
+
+def _location(latitude, longitude):
+    return None if latitude is None or longitude is None else (latitude, longitude)
+
+
+def stops_for(orders):
+    """(order, kind, location) of every stop of ``orders``, each pickup before its drop-off."""
+    stops = []
+    for order in orders:
+        if order.status == 'assigned':
+            restaurant = order.restaurant
+            stops.append((order, 'pickup', _location(restaurant.latitude, restaurant.longitude)))
+        stops.append((order, 'dropoff', _location(order.delivery_latitude, order.delivery_longitude)))
+    return stops
+
+
+def shortest_path(points, before, start=None):
+    """
+    Indexes of ``points`` in a short visiting order, starting from ``start``
+    if given; ``before`` maps an index to the one that must be visited first.
+    """
+    n = len(points)
+    nodes = points + [start] if start is not None else points
+    dist = [[geo.distance_km(*a, *b) for b in nodes] for a in nodes]
+
+    # Nearest neighbour among the stops whose predecessor was visited
+    route, visited = [], set()
+    current = n if start is not None else None
+    while len(route) < n:
+        candidates = [i for i in range(n) if i not in visited and (i not in before or before[i] in visited)]
+        current = candidates[0] if current is None else min(candidates, key=dist[current].__getitem__)
+        route.append(current)
+        visited.add(current)
+
+    # 2-opt on the open path: reversing route[i..j] is allowed unless it holds both ends of a pair
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            prev = route[i - 1] if i else (n if start is not None else None)
+            for j in range(i + 1, n):
+                nxt = route[j + 1] if j + 1 < n else None
+                delta = 0.0
+                if prev is not None:
+                    delta += dist[prev][route[j]] - dist[prev][route[i]]
+                if nxt is not None:
+                    delta += dist[route[i]][nxt] - dist[route[j]][nxt]
+                if delta > -1e-9:
+                    continue
+                segment = set(route[i:j + 1])
+                if any(before.get(k) in segment for k in segment):
+                    continue
+                route[i:j + 1] = reversed(route[i:j + 1])
+                improved = True
+    return route
+
+
+def plan(orders, start=None, now=None):
+    """
+    The stops of ``orders`` (with their restaurant loaded) in visiting order:
+    ``{order, kind, latitude, longitude, distance_km, eta}`` each, ``distance_km``
+    being the leg from the previous stop (or ``start``, a (lat, lng) pair).
+    """
+    now = now or timezone.now()
+    stops = stops_for(orders)
+    unplaced = {order.pk for order, kind, location in stops if location is None}
+    placed = [stop for stop in stops if stop[0].pk not in unplaced]
+    pickups = {order.pk: i for i, (order, kind, location) in enumerate(placed) if kind == 'pickup'}
+    before = {i: pickups[order.pk] for i, (order, kind, location) in enumerate(placed)
+              if kind == 'dropoff' and order.pk in pickups}
+
+    route = []
+    position, elapsed = start, timedelta()
+    for i in shortest_path([location for order, kind, location in placed], before, start):
+        order, kind, location = placed[i]
+        distance = geo.distance_km(*position, *location) * ROAD_FACTOR if position is not None else 0.0
+        elapsed += timedelta(hours=distance / AVERAGE_SPEED_KMH)
+        route.append({'order': order.pk, 'kind': kind, 'latitude': location[0], 'longitude': location[1],
+                      'distance_km': round(distance, 2), 'eta': now + elapsed})
+        elapsed += timedelta(minutes=STOP_MINUTES)
+        position = location
+
+    for order, kind, location in stops:
+        if order.pk in unplaced:
+            route.append({'order': order.pk, 'kind': kind, 'latitude': location and location[0],
+                          'longitude': location and location[1], 'distance_km': None, 'eta': None})
+    return route
+
+
+def driver_route(driver_id, now=None):
+    """The planned route through the driver's active orders."""
+    orders = Order.objects.filter(driver_id=driver_id, status__in=ROUTED_STATUSES).select_related('restaurant')
+    position = tracking.latest_position(driver_id)
+    start = (position['latitude'], position['longitude']) if position is not None else None
+    return plan(list(orders.order_by('pk')), start, now)
@@ -0,0 +1,171 @@
+"""
+Read-only serializers for the hot catalog list endpoints.
+
+Each class emits exactly the JSON of its ModelSerializer counterpart, but from
+``.values()`` rows: no model instances, no per-field serializer machinery,
+and media URLs are concatenated onto a prefix resolved once per request.
+Writes and detail views keep the regular serializers; a field added to one of
+those serializers must be added here too (the tests compare both outputs).
+"""
+from django.core.files.storage import default_storage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from . import eta, images
+from .models import Category, RestaurantEtaStats
+from .serializers import CATEGORY_EMOJI, DEFAULT_EMOJI
+
+RATING = serializers.DecimalField(max_digits=2, decimal_places=1)
+
+
+class RowSerializer:
+    values = ()
+
+    def __init__(self, request):
+        self.request = request
+        self.image_format = images.request_format(request)
+        self.media_prefix = request.build_absolute_uri(default_storage.url(''))
+
+    def prepare(self, queryset):
+        """Reduce ``queryset`` to the columns ``to_representation`` reads."""
+        return queryset.prefetch_related(None).values(*self.values)
+
+    def media_url(self, name):
+        if not name:
+            return None
+        return self.media_prefix + filepath_to_uri(name).lstrip('/')
+
+    def image_url(self, row, field, variant):
+        name = row[field]
+        if not name:
+            return None
+        variants = row['image_variants'].get(field, {})
+        return self.media_url(images.stored_variant(name, variants, variant, self.image_format))
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+    def to_representation(self, row):
+        raise NotImplementedError
+
+
+class CategoryRows(RowSerializer):
+    """Same output as CategorySerializer."""
+    values = ('id', 'name', 'icon', 'image', 'image_variants', 'is_active', 'order')
+
+    def to_representation(self, row):
+        pk, name = row['id'], row['name']
+        key = name.lower()
+        return {
+            'id': pk,
+            'name': name,
+            'icon': row['icon'],
+            'image': self.media_url(row['image']),
+            'image_url': self.image_url(row, 'image', 'thumb') or f'https://picsum.photos/seed/cat{pk}/200/200',
+            'is_active': row['is_active'],
+            'order': row['order'],
+            'filter': key,
+            'emoji': CATEGORY_EMOJI.get(key, DEFAULT_EMOJI),
+        }
+
+
+class ProductRows(RowSerializer):
+    """Same output as ProductSerializer."""
+    values = ('id', 'restaurant_id', 'restaurant__name', 'category_id', 'category__name',
+              'name', 'description', 'price', 'image', 'image_variants',
+              'is_available', 'is_popular', 'is_featured', 'created_at')
+
+    def to_representation(self, row):
+        pk = row['id']
+        data = {
+            'id': pk,
+            'restaurant': row['restaurant_id'],
+            'restaurant_name': row['restaurant__name'],
+            'category': row['category_id'],
+        }
+        # ProductSerializer skips category_name for uncategorised products
+        if row['category_id'] is not None:
+            data['category_name'] = row['category__name']
+        data.update({
+            'name': row['name'],
+            'description': row['description'],
+            'price': row['price'],
+            'image': self.media_url(row['image']),
+            'image_url': self.image_url(row, 'image', 'card') or f'https://picsum.photos/seed/food{pk}/300/300',
+            'is_available': row['is_available'],
+            'is_popular': row['is_popular'],
+            'is_featured': row['is_featured'],
+        })
+        return data
+
+
+class RestaurantRows(RowSerializer):
+    """Same output as RestaurantListSerializer; categories and ETA stats take one query each."""
+    values = ('id', 'name', 'description', 'image', 'cover_image', 'image_variants', 'address',
+              'latitude', 'longitude', 'rating', 'rating_count', 'delivery_time', 'delivery_fee',
+              'delivery_radius', 'minimum_order', 'is_open')
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.categories = CategoryRows(request)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        ids = [row['id'] for row in rows]
+        hour = eta.local_hour()
+
+        self.restaurant_categories = {pk: [] for pk in ids}
+        # Same join and ordering as the categories prefetch in for_listing()
+        for row in Category.objects.filter(restaurants__in=ids).values('restaurants', *CategoryRows.values):
+            self.restaurant_categories[row['restaurants']].append(row)
+
+        self.eta_stats = {pk: {} for pk in ids}
+        for stats in RestaurantEtaStats.objects.filter(
+                restaurant_id__in=ids, hour__in=[hour, RestaurantEtaStats.ALL_HOURS]):
+            self.eta_stats[stats.restaurant_id][stats.hour] = stats
+        self.hour = hour
+        return super().serialize(rows)
+
+    def to_representation(self, row):
+        pk = row['id']
+        categories = self.restaurant_categories[pk]
+        return {
+            'id': pk,
+            'name': row['name'],
+            'description': row['description'],
+            'image': self.media_url(row['image']),
+            'image_url': self.image_url(row, 'image', 'card') or f'https://picsum.photos/seed/resto{pk}/400/300',
+            'cover_image': self.media_url(row['cover_image']),
+            'cover_image_url': (self.image_url(row, 'cover_image', 'cover')
+                                or f'https://picsum.photos/seed/cover{pk}/800/400'),
+            'address': row['address'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'rating': RATING.to_representation(row['rating']),
+            'rating_count': row['rating_count'],
+            'delivery_time': row['delivery_time'],
+            'delivery_fee': row['delivery_fee'],
+            'delivery_radius': row['delivery_radius'],
+            'minimum_order': row['minimum_order'],
+            'is_open': row['is_open'],
+            'categories': self.categories.serialize(categories),
+            'category': categories[0]['name'].lower() if categories else None,
+            'eta_minutes': eta.minutes_from(self.eta_stats[pk], row['delivery_time'], self.hour),
+        }
+
+
+class RowListMixin:
+    """ViewSet ``list`` through a RowSerializer, keeping the view's pagination."""
+    row_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        return self.list_rows(self.filter_queryset(self.get_queryset()))
+
+    def list_rows(self, queryset):
+        rows = self.row_serializer_class(self.request)
+        queryset = rows.prepare(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page))
+        return Response(rows.serialize(queryset))
@@ -0,0 +1,151 @@
+"""
+Inverted index search over products and restaurants.
+
+Text is folded to lowercase ASCII ("Pâtes" -> "pates") and split into terms
+stored in ``SearchEntry``. Queries match every query token as a prefix of an
+indexed term through range lookups on the term index, so no table is
+scanned regardless of catalogue size.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Q, Sum, Max, Case, When, F, IntegerField
+
+from .models import Product, Restaurant, SearchEntry
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+MIN_TOKEN_LENGTH = 2
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TOKENS = 6
+STOP_WORDS = {
+    'au', 'aux', 'avec', 'de', 'des', 'du', 'en', 'et', 'la', 'le', 'les',
+    'sur', 'un', 'une', 'the', 'and', 'of',
+}
+
+PRODUCT_WEIGHTS = {'name': 5, 'category': 3, 'description': 1}
+RESTAURANT_WEIGHTS = {'name': 5, 'category': 3, 'description': 1, 'address': 1}
+
+LIGATURES = str.maketrans({'œ': 'oe', 'æ': 'ae', 'ß': 'ss'})
+
+
+def fold(text):
+    """Lowercase and strip accents so "Pâtes" and "pates" compare equal."""
+    text = unicodedata.normalize('NFKD', (text or '').lower().translate(LIGATURES))
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return [
+        token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(fold(text))
+        if len(token) >= MIN_TOKEN_LENGTH and token not in STOP_WORDS
+    ]
+
+
+def _terms(fields, weights):
+    """Merge weighted fields into {term: weight}, keeping each term's best field."""
+    terms = {}
+    for field, text in fields:
+        for token in tokenize(text):
+            terms[token] = max(terms.get(token, 0), weights[field])
+    return terms
+
+
+def product_terms(product):
+    return _terms([
+        ('name', product.name),
+        ('description', product.description),
+        ('category', product.category.name if product.category else ''),
+    ], PRODUCT_WEIGHTS)
+
+
+def restaurant_terms(restaurant):
+    return _terms([
+        ('name', restaurant.name),
+        ('description', restaurant.description),
+        ('address', restaurant.address),
+    ] + [('category', category.name) for category in restaurant.categories.all()],
+        RESTAURANT_WEIGHTS)
+
+
+def _replace_entries(kind, objects, terms_for, is_visible):
+    objects = list(objects)
+    if not objects:
+        return
+    entries = [
+        SearchEntry(term=term, kind=kind, object_id=obj.pk, weight=weight)
+        for obj in objects if is_visible(obj)
+        for term, weight in terms_for(obj).items()
+    ]
+    with transaction.atomic():
+        SearchEntry.objects.filter(kind=kind, object_id__in=[obj.pk for obj in objects]).delete()
+        SearchEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+def index_products(products):
+    """(Re)index products; unavailable ones are dropped from the index."""
+    _replace_entries('product', products, product_terms, lambda p: p.is_available)
+
+
+def index_restaurants(restaurants):
+    """(Re)index restaurants; inactive ones are dropped from the index."""
+    _replace_entries('restaurant', restaurants, restaurant_terms, lambda r: r.is_active)
+
+
+def unindex(kind, object_ids):
+    SearchEntry.objects.filter(kind=kind, object_id__in=object_ids).delete()
+
+
+def rebuild(batch_size=1000):
+    SearchEntry.objects.all().delete()
+    products = Product.objects.select_related('category').order_by('pk')
+    for start in range(0, products.count(), batch_size):
+        index_products(products[start:start + batch_size])
+    restaurants = Restaurant.objects.prefetch_related('categories').order_by('pk')
+    for start in range(0, restaurants.count(), batch_size):
+        index_restaurants(restaurants[start:start + batch_size])
+
+
+def _prefix(token):
+    # Range rather than LIKE so SQLite can seek the term index
+    return Q(term__gte=token, term__lt=token + '\uffff')
+
+
+def ranked_ids(kind, query, limit=20):
+    """
+    Ids of ``kind`` objects matching every token of ``query``, best first.
+    Whole-term matches count double compared with prefix matches.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return []
+    any_token = Q()
+    for token in tokens:
+        any_token |= _prefix(token)
+    matched = {
+        f'matched_{i}': Max(Case(When(_prefix(token), then=1), default=0, output_field=IntegerField()))
+        for i, token in enumerate(tokens)
+    }
+    rows = (
+        SearchEntry.objects.filter(any_token, kind=kind)
+        .values('object_id')
+        .annotate(
+            score=Sum(Case(When(term__in=tokens, then=F('weight') * 2), default=F('weight'))),
+            **matched,
+        )
+        .filter(**{name: 1 for name in matched})
+        .order_by('-score', 'object_id')[:limit]
+    )
+    return [row['object_id'] for row in rows]
+
+
+def search(query, limit=20):
+    """Matching products and restaurants, each list in rank order."""
+    product_ids = ranked_ids('product', query, limit)
+    restaurant_ids = ranked_ids('restaurant', query, limit)
+    products = Product.objects.select_related('restaurant', 'category').in_bulk(product_ids)
+    restaurants = Restaurant.objects.for_listing().in_bulk(restaurant_ids)
+    return {
+        'products': [products[pk] for pk in product_ids if pk in products],
+        'restaurants': [restaurants[pk] for pk in restaurant_ids if pk in restaurants],
+    }
@@ -1,10 +1,44 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.urls import reverse
+
+from . import eta, images
 from .models import (
     User, Category, Restaurant, Product, Cart, CartItem,
-    Order, OrderItem, DriverSchedule, Banner, AppSettings, TeamMember
+    Checkout, Order, OrderItem, DriverSchedule, Banner, AppSettings, TeamMember
 )
 
+CATEGORY_EMOJI = {
+    'pizza': '🍕',
+    'burger': '🍔',
+    'burgers': '🍔',
+    'sushi': '🍣',
+    'poulet': '🍗',
+    'chicken': '🍗',
+    'africain': '🍲',
+    'african': '🍲',
+    'dessert': '🍰',
+    'desserts': '🍰',
+    'boissons': '🥤',
+    'drinks': '🥤',
+    'salades': '🥗',
+    'salads': '🥗',
+    'poisson': '🐟',
+    'fish': '🐟',
+    'pâtes': '🍝',
+    'pasta': '🍝',
+    'grillades': '🥩',
+    'grill': '🥩',
+}
+DEFAULT_EMOJI = '🍽️'
+
+
+def image_url(serializer, obj, field, variant):
+    """Absolute URL of the variant suited to this context, or of the original."""
+    request = serializer.context.get('request')
+    variant = serializer.context.get('image_variant', variant)
+    return images.variant_url(obj, field, variant, request, images.request_format(request))
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -96,39 +130,13 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'icon', 'image', 'image_url', 'is_active', 'order', 'filter', 'emoji']
     
     def get_image_url(self, obj):
-        if obj.image and obj.image.name:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-        return f'https://picsum.photos/seed/cat{obj.id}/200/200'
+        return image_url(self, obj, 'image', 'thumb') or f'https://picsum.photos/seed/cat{obj.id}/200/200'
     
     def get_filter(self, obj):
         return obj.name.lower()
     
     def get_emoji(self, obj):
-        emoji_map = {
-            'pizza': '🍕',
-            'burger': '🍔',
-            'burgers': '🍔',
-            'sushi': '🍣',
-            'poulet': '🍗',
-            'chicken': '🍗',
-            'africain': '🍲',
-            'african': '🍲',
-            'dessert': '🍰',
-            'desserts': '🍰',
-            'boissons': '🥤',
-            'drinks': '🥤',
-            'salades': '🥗',
-            'salads': '🥗',
-            'poisson': '🐟',
-            'fish': '🐟',
-            'pâtes': '🍝',
-            'pasta': '🍝',
-            'grillades': '🥩',
-            'grill': '🥩',
-        }
-        return emoji_map.get(obj.name.lower(), '🍽️')
+        return CATEGORY_EMOJI.get(obj.name.lower(), DEFAULT_EMOJI)
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -150,11 +158,15 @@ class ProductSerializer(serializers.ModelSerializer):
                   'is_available', 'is_popular', 'is_featured']
     
     def get_image_url(self, obj):
-        if obj.image and obj.image.name:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-        return f'https://picsum.photos/seed/food{obj.id}/300/300'
+        return image_url(self, obj, 'image', 'card') or f'https://picsum.photos/seed/food{obj.id}/300/300'
+
+
+class ProductChangeSerializer(serializers.Serializer):
+    """One entry of a batch product update."""
+    id = serializers.IntegerField()
+    price = serializers.IntegerField(min_value=0, required=False)
+    is_available = serializers.BooleanField(required=False)
+    is_popular = serializers.BooleanField(required=False)
 
 
 class RestaurantListSerializer(serializers.ModelSerializer):
@@ -162,38 +174,62 @@ class RestaurantListSerializer(serializers.ModelSerializer):
     cover_image_url = serializers.SerializerMethodField()
     categories = CategorySerializer(many=True, read_only=True)
     category = serializers.SerializerMethodField()
+    eta_minutes = serializers.SerializerMethodField()
     
     class Meta:
         model = Restaurant
         fields = ['id', 'name', 'description', 'image', 'image_url', 
-                  'cover_image', 'cover_image_url', 'address', 'rating', 
-                  'rating_count', 'delivery_time', 'delivery_fee', 
-                  'minimum_order', 'is_open', 'categories', 'category']
+                  'cover_image', 'cover_image_url', 'address', 'latitude', 'longitude',
+                  'rating', 'rating_count', 'delivery_time', 'delivery_fee', 
+                  'delivery_radius', 'minimum_order', 'is_open', 'categories', 'category',
+                  'eta_minutes']
+    
+    def get_eta_minutes(self, obj):
+        return eta.restaurant_minutes(obj)
     
     def get_category(self, obj):
-        first_cat = obj.categories.first()
-        return first_cat.name.lower() if first_cat else None
+        # Read from the prefetched categories rather than issuing a query per row
+        categories = obj.categories.all()
+        return categories[0].name.lower() if categories else None
     
     def get_image_url(self, obj):
-        if obj.image and obj.image.name:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-        return f'https://picsum.photos/seed/resto{obj.id}/400/300'
+        return image_url(self, obj, 'image', 'card') or f'https://picsum.photos/seed/resto{obj.id}/400/300'
     
     def get_cover_image_url(self, obj):
-        if obj.cover_image and obj.cover_image.name:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.cover_image.url)
-        return f'https://picsum.photos/seed/cover{obj.id}/800/400'
+        return image_url(self, obj, 'cover_image', 'cover') or f'https://picsum.photos/seed/cover{obj.id}/800/400'
+
+
+class NearbyRestaurantSerializer(RestaurantListSerializer):
+    distance = serializers.FloatField(read_only=True)
+    
+    class Meta(RestaurantListSerializer.Meta):
+        fields = RestaurantListSerializer.Meta.fields + ['distance']
 
 
 class RestaurantDetailSerializer(RestaurantListSerializer):
-    products = ProductSerializer(many=True, read_only=True)
+    product_count = serializers.SerializerMethodField()
+    menu_url = serializers.SerializerMethodField()
     
     class Meta(RestaurantListSerializer.Meta):
-        fields = RestaurantListSerializer.Meta.fields + ['products', 'phone']
+        fields = RestaurantListSerializer.Meta.fields + ['phone', 'product_count', 'menu_url']
+    
+    def get_product_count(self, obj):
+        if hasattr(obj, 'product_count'):
+            return obj.product_count
+        return obj.products.filter(is_available=True).count()
+    
+    def get_menu_url(self, obj):
+        url = reverse('restaurant-menu', args=[obj.id])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class MenuSectionSerializer(serializers.Serializer):
+    category_id = serializers.IntegerField(allow_null=True)
+    category_name = serializers.CharField(allow_null=True)
+    product_count = serializers.IntegerField()
+    products = ProductSerializer(many=True)
+    next = serializers.CharField(allow_null=True)
 
 
 class CartItemSerializer(serializers.ModelSerializer):
@@ -236,26 +272,39 @@ class OrderSerializer(serializers.ModelSerializer):
     restaurant_image = serializers.SerializerMethodField()
     driver_name = serializers.CharField(source='driver.get_full_name', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
+    estimated_delivery_at = serializers.SerializerMethodField()
     
     class Meta:
         model = Order
-        fields = ['id', 'restaurant', 'restaurant_name', 'restaurant_image',
+        fields = ['id', 'checkout', 'restaurant', 'restaurant_name', 'restaurant_image',
                   'driver', 'driver_name', 'status', 'status_display', 
-                  'total', 'delivery_fee', 'delivery_address', 
+                  'total', 'delivery_fee', 'delivery_address',
+                  'delivery_latitude', 'delivery_longitude', 
                   'customer_name', 'customer_phone', 'notes', 
-                  'items', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'total', 'created_at', 'updated_at']
+                  'items', 'created_at', 'updated_at', 'estimated_delivery_at']
+        # Status, driver and restaurant feed the rollups: they change through orders.py only
+        read_only_fields = ['id', 'checkout', 'restaurant', 'driver', 'status', 'total', 'created_at', 'updated_at']
+    
+    def get_estimated_delivery_at(self, obj):
+        estimate = eta.order_delivery_at(obj)
+        return serializers.DateTimeField().to_representation(estimate) if estimate else None
     
     def get_restaurant_image(self, obj):
-        if obj.restaurant.image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.restaurant.image.url)
-        return None
+        return image_url(self, obj.restaurant, 'image', 'thumb')
+
+
+class CheckoutSerializer(serializers.ModelSerializer):
+    orders = OrderSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = Checkout
+        fields = ['id', 'total', 'delivery_fee', 'orders', 'created_at']
 
 
 class CreateOrderSerializer(serializers.Serializer):
     delivery_address = serializers.CharField()
+    delivery_latitude = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    delivery_longitude = serializers.FloatField(required=False, min_value=-180, max_value=180)
     customer_name = serializers.CharField()
     customer_phone = serializers.CharField()
     notes = serializers.CharField(required=False, allow_blank=True)
@@ -283,11 +332,7 @@ class BannerSerializer(serializers.ModelSerializer):
         read_only_fields = ['restaurant']
     
     def get_image_url(self, obj):
-        if obj.image and obj.image.name:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-        return f'https://picsum.photos/seed/banner{obj.id}/800/300'
+        return image_url(self, obj, 'image', 'cover') or f'https://picsum.photos/seed/banner{obj.id}/800/300'
 
 
 class AppSettingsSerializer(serializers.ModelSerializer):
@@ -0,0 +1,98 @@
+"""
+Weekly shift index: which drivers are on shift at a given time.
+
+A driver's enabled ``DriverSchedule`` days make a bitmap of the week's 672
+quarter-hour slots, with Monday 00:00 as slot 0. A slot is on shift when
+its start falls inside a shift, and a shift ending at or before its start
+runs past midnight. The set bits are stored as ``DriverShiftSlot`` rows, so
+"on shift at T" is one seek on the slot index that returns exactly the
+drivers on shift.
+
+Signals refresh a driver's slots whenever one of their schedule days
+changes. ``rebuild`` (the ``rebuild_driver_shifts`` command) covers
+schedules written without signals, such as bulk inserts.
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DriverSchedule, DriverShiftSlot, User
+
+SLOT_SECONDS = 15 * 60
+SLOTS_PER_DAY = 24 * 60 * 60 // SLOT_SECONDS
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def slot_at(when=None):
+    """The week slot containing ``when`` (default now), in local time."""
+    local = timezone.localtime(when or timezone.now())
+    seconds = local.hour * 3600 + local.minute * 60 + local.second
+    return local.weekday() * SLOTS_PER_DAY + seconds // SLOT_SECONDS
+
+
+def _first_slot_from(time):
+    # The first slot starting at or after ``time``
+    seconds = time.hour * 3600 + time.minute * 60 + time.second + (time.microsecond > 0)
+    return -(-seconds // SLOT_SECONDS)
+
+
+def bitmap(schedules):
+    """The on-shift slots of one driver's ``schedules`` as an int, bit n for slot n."""
+    bits = 0
+    for schedule in schedules:
+        if not schedule.is_enabled or schedule.day not in WEEKDAYS:
+            # Rows written around validation (raw SQL, old data) must not break the index
+            continue
+        first, end = _first_slot_from(schedule.start_time), _first_slot_from(schedule.end_time)
+        if end <= first:
+            end += SLOTS_PER_DAY
+        offset = WEEKDAYS.index(schedule.day) * SLOTS_PER_DAY
+        for slot in range(offset + first, offset + end):
+            bits |= 1 << (slot % SLOTS_PER_WEEK)
+    return bits
+
+
+def slots(bits):
+    return [slot for slot in range(SLOTS_PER_WEEK) if bits >> slot & 1]
+
+
+def refresh(driver_ids):
+    """Bring the slots of ``driver_ids`` in line with their schedules, writing only what changed."""
+    wanted = {driver_id: set() for driver_id in driver_ids}
+    schedules = {}
+    for schedule in DriverSchedule.objects.filter(driver_id__in=wanted):
+        schedules.setdefault(schedule.driver_id, []).append(schedule)
+    for driver_id, rows in schedules.items():
+        wanted[driver_id] = set(slots(bitmap(rows)))
+
+    current = {driver_id: set() for driver_id in wanted}
+    for driver_id, slot in DriverShiftSlot.objects.filter(driver_id__in=wanted).values_list('driver_id', 'slot'):
+        current[driver_id].add(slot)
+
+    stale = Q()
+    for driver_id, slot_set in current.items():
+        if slot_set - wanted[driver_id]:
+            stale |= Q(driver_id=driver_id, slot__in=slot_set - wanted[driver_id])
+    if stale:
+        DriverShiftSlot.objects.filter(stale).delete()
+    DriverShiftSlot.objects.bulk_create([
+        DriverShiftSlot(driver_id=driver_id, slot=slot)
+        for driver_id, slot_set in wanted.items() for slot in slot_set - current[driver_id]
+    ], batch_size=1000)
+
+
+def rebuild(batch_size=500):
+    DriverShiftSlot.objects.all().delete()
+    drivers = list(DriverSchedule.objects.values_list('driver_id', flat=True).distinct().order_by('driver_id'))
+    for start in range(0, len(drivers), batch_size):
+        refresh(drivers[start:start + batch_size])
+
+
+def on_shift(when=None):
+    """Drivers whose schedule covers ``when`` (default now), whether available or not."""
+    return User.objects.filter(role='driver', is_active=True, shift_slots__slot=slot_at(when))
+
+
+def available(when=None):
+    """Drivers on shift at ``when`` who are taking work."""
+    return on_shift(when).filter(is_available=True)
@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import images, search, shifts, sync
+from .cache import bump_version
+from .models import Category, Restaurant, Product, Banner, AppSettings, DriverSchedule
+
+CATALOG_MODELS = (Category, Restaurant, Product, Banner, AppSettings)
+
+
+def invalidate_catalog(model):
+    # Bump after commit so a concurrent read can't re-cache pre-commit data
+    transaction.on_commit(lambda: bump_version(model))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def catalog_changed(sender, signal, instance, **kwargs):
+    if sender in CATALOG_MODELS:
+        invalidate_catalog(sender)
+    if sender in sync.CATALOG_KINDS:
+        sync.catalog_changed(sender, [instance.pk], deleted=signal is post_delete)
+
+
+@receiver(m2m_changed, sender=Restaurant.categories.through)
+def restaurant_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_catalog(Restaurant)
+        sync.catalog_changed(Restaurant, (pk_set or []) if reverse else [instance.pk])
+
+
+# ==================== SEARCH INDEX ====================
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance])
+
+
+@receiver(post_save, sender=Restaurant)
+def restaurant_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_restaurants([instance])
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    # A renamed category changes the terms of everything filed under it
+    if not raw and not created:
+        search.index_products(instance.products.select_related('category'))
+        search.index_restaurants(instance.restaurants.prefetch_related('categories'))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.unindex('product', [instance.pk])
+
+
+@receiver(post_delete, sender=Restaurant)
+def restaurant_deleted(sender, instance, **kwargs):
+    search.unindex('restaurant', [instance.pk])
+
+
+@receiver(m2m_changed, sender=Restaurant.categories.through)
+def restaurant_categories_reindex(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.index_restaurants([instance])
+    elif pk_set:
+        search.index_restaurants(Restaurant.objects.filter(pk__in=pk_set).prefetch_related('categories'))
+
+
+# ==================== SHIFT INDEX ====================
+
+@receiver(post_save, sender=DriverSchedule)
+@receiver(post_delete, sender=DriverSchedule)
+def driver_schedule_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        shifts.refresh([instance.driver_id])
+
+
+# ==================== IMAGE VARIANTS ====================
+
+IMAGE_FIELDS = {
+    Category: ['image'],
+    Restaurant: ['image', 'cover_image'],
+    Product: ['image'],
+    Banner: ['image'],
+}
+
+
+@receiver(post_save)
+def image_saved(sender, instance, raw=False, **kwargs):
+    if raw or sender not in IMAGE_FIELDS:
+        return
+    for field in IMAGE_FIELDS[sender]:
+        if images.needs_variants(instance, field):
+            images.schedule(instance, field)
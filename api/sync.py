@@ -0,0 +1,118 @@
+"""
+Change log behind the ``?since=`` delta sync endpoint.
+
+Every change to an order or a catalog object (product, restaurant, category,
+banner) appends ``SyncChange`` rows once its transaction commits. The
+autoincrement id is the monotonic sequence clients keep as their cursor.
+Each row carries a channel, so a poll reads only what its user may see with
+one range query on the (channel, id) index:
+
+- catalog changes go to ``catalog``;
+- order changes go to the channels ``events.order_channels`` computes.
+
+Deletions are logged as tombstones. ``purge`` drops old rows and leaves a
+``reset`` marker, so clients whose cursor predates it know to reload in
+full.
+
+Ids are handed out at insert time but become visible at commit. SQLite
+commits one writer at a time, so a reader never sees id N+1 before N. On
+PostgreSQL or MySQL two log writes can commit out of id order, and a client
+advancing its cursor past the later one would miss the earlier one for good.
+So polls stop at the first row younger than ``SYNC_VISIBILITY_LAG`` seconds,
+by default 0 on SQLite and 2 elsewhere.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import events
+from .models import Banner, Category, Product, Restaurant, SyncChange
+
+CATALOG = 'catalog'
+ALL = '*'
+CATALOG_KINDS = {Product: 'product', Restaurant: 'restaurant', Category: 'category', Banner: 'banner'}
+KIND_MODELS = {kind: model for model, kind in CATALOG_KINDS.items()}
+
+
+def _log(rows):
+    if not rows:
+        return
+    # robust: the change is committed either way, so a failed log write is only logged
+    transaction.on_commit(lambda: SyncChange.objects.bulk_create(rows), robust=True)
+
+
+def catalog_changed(model, ids, deleted=False):
+    """Log catalog objects saved (or deleted) in the current transaction."""
+    kind = CATALOG_KINDS[model]
+    _log([SyncChange(channel=CATALOG, kind=kind, object_id=pk, deleted=deleted) for pk in ids])
+
+
+def orders_changed(changes):
+    """Log order changes, given as ``(order, previous_status, previous_driver_id)``."""
+    _log([
+        SyncChange(channel=channel, kind='order', object_id=order.pk)
+        for order, previous_status, previous_driver_id in changes
+        for channel in events.order_channels(order, previous_status, previous_driver_id)
+    ])
+
+
+def channels_for(user):
+    return [CATALOG, ALL, *events.channels_for(user)]
+
+
+def visibility_horizon():
+    """Rows logged at or after this time may still have uncommitted predecessors; None when there is no lag."""
+    lag = getattr(settings, 'SYNC_VISIBILITY_LAG', 0 if connection.vendor == 'sqlite' else 2)
+    return timezone.now() - timedelta(seconds=lag) if lag else None
+
+
+def changes_since(user, since, limit):
+    """
+    Changes visible to ``user`` after cursor ``since``: ``(cursor, changes, more)``
+    where changes maps kind to {object id: deleted}, or None when the log no
+    longer reaches back to ``since``.
+    """
+    rows = list(
+        SyncChange.objects.filter(channel__in=channels_for(user), pk__gt=since)
+        .order_by('pk').values_list('pk', 'kind', 'object_id', 'deleted', 'created_at')[:limit + 1]
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    horizon = visibility_horizon()
+    if horizon is not None:
+        fresh = next((i for i, row in enumerate(rows) if row[4] >= horizon), None)
+        if fresh is not None:
+            # The rest is served once the lag has passed
+            rows, more = rows[:fresh], False
+    changes = {}
+    for pk, kind, object_id, deleted, _ in rows:
+        if kind == 'reset':
+            if since < object_id:
+                return None
+            continue
+        # Later rows win: an object re-created after a delete is live
+        changes.setdefault(kind, {})[object_id] = deleted
+    cursor = rows[-1][0] if rows else since
+    return cursor, changes, more
+
+
+def current_cursor():
+    rows = SyncChange.objects.all()
+    horizon = visibility_horizon()
+    if horizon is not None:
+        rows = rows.filter(created_at__lt=horizon)
+    return rows.aggregate(cursor=Max('pk'))['cursor'] or 0
+
+
+def purge(before):
+    """Delete rows logged before ``before``; returns how many were deleted."""
+    last = SyncChange.objects.filter(created_at__lt=before).aggregate(last=Max('pk'))['last']
+    if last is None:
+        return 0
+    with transaction.atomic():
+        deleted, _ = SyncChange.objects.filter(pk__lte=last).delete()
+        SyncChange.objects.create(channel=ALL, kind='reset', object_id=last)
+    return deleted
@@ -1,3 +1,1821 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_time
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import sync_to_async
+
+from PIL import Image
+
+from . import dispatch, eta, events, geo, images, orders as order_flow, rollups, routes, search as search_index, shifts, sync, tracking
+from .rows import CategoryRows, ProductRows, RestaurantRows
+from .serializers import CategorySerializer, ProductSerializer, RestaurantListSerializer
+from .models import (
+    User, Category, Restaurant, Product, Banner, AppSettings, Order, Cart, CartItem,
+    RestaurantEtaStats, RestaurantDailyStats, RestaurantHourlyStats, ProductDailyStats, IdempotencyKey,
+    DriverSchedule, DriverLocation, DriverShiftSlot, SyncChange,
+)
+
+
+def make_restaurant(name, categories=(), **kwargs):
+    kwargs.setdefault('address', 'Cotonou')
+    restaurant = Restaurant.objects.create(name=name, **kwargs)
+    restaurant.categories.set(categories)
+    return restaurant
+
+
+class RestaurantQueryCountTests(TestCase):
+    """Restaurant endpoints must cost a fixed number of queries whatever the row count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.grill = Category.objects.create(name='Grillades', icon='flame', order=1)
+        cls.fish = Category.objects.create(name='Poissons', icon='fish', order=2)
+        cls.manager = User.objects.create_user('manager', 'manager@test.com', 'test123', role='manager')
+        cls.restaurants = [
+            make_restaurant(f'Resto {i}', [cls.grill, cls.fish], rating=4.5)
+            for i in range(12)
+        ]
+        cls.managed = cls.restaurants[0]
+        cls.managed.manager = cls.manager
+        cls.managed.save()
+        for i in range(8):
+            Product.objects.create(restaurant=cls.managed, category=cls.fish,
+                                   name=f'Plat {i}', price=1500)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list(self):
+        # COUNT for pagination, the page, then the categories and ETA prefetches
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('restaurant-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['category'], 'grillades')
+
+    def test_featured(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('restaurant-featured'))
+        self.assertEqual(len(response.data), 10)
+
+    def test_by_category(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('restaurant-by-category'), {'category_id': self.fish.id})
+        self.assertEqual(len(response.data), 12)
+
+    def test_detail(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('restaurant-detail', args=[self.managed.id]))
+        self.assertEqual(response.data['product_count'], 8)
+        self.assertNotIn('products', response.data)
+
+    def test_manager_restaurant(self):
+        self.client.force_authenticate(self.manager)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('manager-restaurant'))
+        self.assertEqual(response.data['id'], self.managed.id)
+        self.assertEqual(response.data['product_count'], 8)
+
+
+
+class MenuTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.drinks = Category.objects.create(name='Boissons', icon='cup-soda', order=4)
+        cls.grill = Category.objects.create(name='Grillades', icon='flame', order=2)
+        cls.restaurant = make_restaurant('Chez Aïcha', [cls.grill, cls.drinks])
+        for i in range(25):
+            Product.objects.create(restaurant=cls.restaurant, category=cls.grill, name=f'Brochette {i:02}', price=500)
+        for i in range(3):
+            Product.objects.create(restaurant=cls.restaurant, category=cls.drinks, name=f'Jus {i}', price=300)
+        Product.objects.create(restaurant=cls.restaurant, name='Surprise', price=1000)
+        Product.objects.create(restaurant=cls.restaurant, category=cls.drinks, name='Sodabi',
+                               price=800, is_available=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('restaurant-menu', args=[self.restaurant.id])
+
+    def test_sections_in_category_order_one_query_each(self):
+        # restaurant lookup, section counts, then one query per section
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        sections = response.data['sections']
+        self.assertEqual([s['category_name'] for s in sections], ['Grillades', 'Boissons', None])
+        self.assertEqual([s['product_count'] for s in sections], [25, 3, 1])
+        self.assertEqual(len(sections[0]['products']), 20)
+        self.assertEqual(sections[1]['products'][0]['restaurant_name'], 'Chez Aïcha')
+        self.assertIsNone(sections[1]['next'])
+
+    def test_next_page_of_a_section(self):
+        next_url = self.client.get(self.url).data['sections'][0]['next']
+        sections = self.client.get(next_url).data['sections']
+        self.assertEqual(len(sections), 1)
+        self.assertEqual([p['name'] for p in sections[0]['products']],
+                         [f'Brochette {i:02}' for i in range(20, 25)])
+        self.assertIsNone(sections[0]['next'])
+
+    def test_uncategorised_section(self):
+        sections = self.client.get(self.url, {'category': 'none'}).data['sections']
+        self.assertEqual([p['name'] for p in sections[0]['products']], ['Surprise'])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get(self.url, {'category': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 'x'}).status_code, 400)
+
+
+class CatalogCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Grillades', icon='flame')
+        cls.restaurant = make_restaurant('Chez Aïcha', [cls.category])
+        cls.product = Product.objects.create(restaurant=cls.restaurant, category=cls.category,
+                                             name='Poulet braisé', price=2500, is_popular=True)
+        Banner.objects.create(title='Promo')
+        AppSettings.objects.create(key='currency', value='FCFA')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_repeated_reads_skip_database(self):
+        urls = [
+            reverse('category-list'), reverse('restaurant-list'),
+            reverse('product-popular'), reverse('product-featured'),
+            reverse('banner-list'), reverse('app-settings'),
+        ]
+        first = [self.client.get(url).data for url in urls]
+        with self.assertNumQueries(0):
+            second = [self.client.get(url).data for url in urls]
+        self.assertEqual(first, second)
+
+    def test_save_invalidates(self):
+        url = reverse('product-popular')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Poulet bicyclette'
+            self.product.save()
+        self.assertEqual(self.client.get(url).data[0]['name'], 'Poulet bicyclette')
+
+    def test_related_rename_invalidates(self):
+        url = reverse('product-popular')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.name = 'Maquis Aïcha'
+            self.restaurant.save()
+        self.assertEqual(self.client.get(url).data[0]['restaurant_name'], 'Maquis Aïcha')
+
+    def test_m2m_change_invalidates(self):
+        url = reverse('restaurant-list')
+        self.client.get(url)
+        other = Category.objects.create(name='Poissons', icon='fish', order=-1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.categories.add(other)
+        self.assertEqual(self.client.get(url).data['results'][0]['category'], 'poissons')
+
+    def test_delete_invalidates(self):
+        url = reverse('app-settings')
+        self.assertEqual(self.client.get(url).data, {'currency': 'FCFA'})
+        with self.captureOnCommitCallbacks(execute=True):
+            AppSettings.objects.all().delete()
+        self.assertEqual(self.client.get(url).data, {})
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pasta = Category.objects.create(name='Pâtes', icon='utensils')
+        cls.restaurant = make_restaurant('Trattoria Cotonou', [cls.pasta],
+                                         description='Cuisine italienne', address='Haie Vive')
+        cls.carbonara = Product.objects.create(restaurant=cls.restaurant, category=cls.pasta,
+                                               name='Pâtes carbonara', price=3500)
+        cls.salad = Product.objects.create(restaurant=cls.restaurant, name='Salade de pâtes',
+                                           description='Fraîche', price=2000)
+        cls.hidden = Product.objects.create(restaurant=cls.restaurant, name='Pâtes au pesto',
+                                            price=3000, is_available=False)
+
+    def search(self, q):
+        return self.client.get(reverse('search'), {'q': q}).data
+
+    def test_accent_and_case_folding(self):
+        self.assertEqual(search_index.fold('PÂTES Œuf'), 'pates oeuf')
+        names = [p['name'] for p in self.search('PATES')['products']]
+        self.assertEqual(names, ['Pâtes carbonara', 'Salade de pâtes'])
+
+    def test_all_tokens_must_match_as_prefixes(self):
+        names = [p['name'] for p in self.search('carbo pât')['products']]
+        self.assertEqual(names, ['Pâtes carbonara'])
+        self.assertEqual(self.search('carbonara sushi')['products'], [])
+
+    def test_restaurant_fields_and_categories(self):
+        self.assertEqual(len(self.search('haie')['restaurants']), 1)
+        self.assertEqual(len(self.search('pates')['restaurants']), 1)
+
+    def test_index_follows_saves(self):
+        self.hidden.is_available = True
+        self.hidden.save()
+        self.assertEqual(len(self.search('pesto')['products']), 1)
+        self.carbonara.name = 'Spaghetti bolognaise'
+        self.carbonara.save()
+        self.assertEqual(self.search('carbonara')['products'], [])
+        self.carbonara.delete()
+        self.assertEqual(self.search('spaghetti')['products'], [])
+
+    def test_category_rename_reindexes(self):
+        self.pasta.name = 'Pasta'
+        self.pasta.save()
+        self.assertEqual(len(self.search('pasta')['restaurants']), 1)
+
+    def test_empty_query(self):
+        self.assertEqual(self.search('  '), {'query': '', 'restaurants': [], 'products': []})
+
+    def test_invalid_limit(self):
+        response = self.client.get(reverse('search'), {'q': 'pates', 'limit': 'many'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'limit must be an integer'})
+        self.assertEqual(len(self.client.get(reverse('search'), {'q': 'pates', 'limit': 1}).data['products']), 1)
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', 'admin@test.com', 'admin123', role='admin', is_staff=True)
+        cls.restaurant = make_restaurant('Chez Aïcha')
+        for i in range(45):
+            cls.place_order(i)
+
+    @classmethod
+    def place_order(cls, i):
+        return Order.objects.create(user=cls.admin, restaurant=cls.restaurant, total=1000 + i,
+                                    delivery_address='Cotonou', customer_name='Client',
+                                    customer_phone='97000000')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            data = self.client.get(url).data
+            self.assertNotIn('count', data)
+            ids += [order['id'] for order in data['results']]
+            url, pages = data['next'], pages + 1
+        return ids, pages
+
+    def test_pages_cover_every_order_newest_first(self):
+        ids, pages = self.walk(reverse('order-list'))
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_inserts_between_pages_do_not_shift_results(self):
+        first = self.client.get(reverse('order-list')).data
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))[20:40]
+        for i in range(5):
+            self.place_order(100 + i)
+        second = self.client.get(first['next']).data
+        self.assertEqual([order['id'] for order in second['results']], expected)
+
+    def test_previous_link_returns_same_page(self):
+        first = self.client.get(reverse('order-list')).data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(back['previous'])
+
+    def test_no_count_query(self):
+        with self.assertNumQueries(1) as ctx:
+            self.client.get(reverse('product-list'))
+        self.assertNotIn('COUNT', ctx.captured_queries[0]['sql'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('admin-users-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = User.objects.create_user('client', 'client@test.com', 'test123')
+        cls.restaurant = make_restaurant('Chez Aïcha')
+        cls.product = Product.objects.create(restaurant=cls.restaurant, name='Attiéké', price=1500)
+        cls.cart = Cart.objects.create(user=cls.client_user)
+        CartItem.objects.create(cart=cls.cart, product=cls.product, quantity=2)
+        cls.order = Order.objects.create(user=cls.client_user, restaurant=cls.restaurant, total=3000,
+                                         delivery_address='Cotonou', customer_name='Client',
+                                         customer_phone='97000000')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.client_user)
+
+    def test_catalog_revalidation_is_query_free(self):
+        url = reverse('restaurant-detail', args=[self.restaurant.id])
+        etag = self.client.get(url).headers['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_etag_changes_on_write(self):
+        url = reverse('restaurant-menu', args=[self.restaurant.id])
+        etag = self.client.get(url).headers['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 2000
+            self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sections'][0]['products'][0]['price'], 2000)
+
+    def test_cart_revalidation(self):
+        url = reverse('cart')
+        etag = self.client.get(url).headers['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.put(reverse('cart-items'), {'product_id': self.product.id, 'quantity': 5}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['item_count'], 5)
+
+    def test_cart_etag_follows_category_names(self):
+        category = Category.objects.create(name='Plats', icon='bowl')
+        Product.objects.filter(pk=self.product.pk).update(category=category)
+        url = reverse('cart')
+        etag = self.client.get(url).headers['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            category.name = 'Plats du jour'
+            category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'][0]['product']['category_name'], 'Plats du jour')
+
+    def test_order_detail_etag_and_last_modified(self):
+        Order.objects.filter(pk=self.order.pk).update(status='delivered')
+        url = reverse('order-detail', args=[self.order.id])
+        first = self.client.get(url)
+        self.assertIn('Last-Modified', first.headers)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first.headers['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_order_etag_follows_the_estimate(self):
+        url = reverse('order-detail', args=[self.order.id])
+        first = self.client.get(url)
+        # The estimate can move without the order changing, so only the ETag validates it
+        self.assertNotIn('Last-Modified', first.headers)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag']).status_code, 304)
+
+        RestaurantEtaStats.objects.create(restaurant=self.restaurant, hour=RestaurantEtaStats.ALL_HOURS,
+                                          prep_count=5, prep_seconds=5 * 600, travel_count=5,
+                                          travel_seconds=5 * 900)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first.headers['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['estimated_delivery_at'], first.data['estimated_delivery_at'])
+
+    def test_order_of_another_user_is_not_revealed(self):
+        other = User.objects.create_user('other', 'other@test.com', 'test123')
+        etag = self.client.get(reverse('order-detail', args=[self.order.id])).headers['ETag']
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse('order-detail', args=[self.order.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+
+class NearbyRestaurantTests(TestCase):
+    COTONOU = (6.3654, 2.4183)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ganhi = make_restaurant('Ganhi', latitude=6.3548, longitude=2.4301)
+        cls.haie_vive = make_restaurant('Haie Vive', latitude=6.3573, longitude=2.3920)
+        cls.porto_novo = make_restaurant('Porto-Novo', latitude=6.4969, longitude=2.6283, delivery_radius=40)
+        cls.small_radius = make_restaurant('Akpakpa', latitude=6.3622, longitude=2.4490, delivery_radius=1)
+        make_restaurant('Sans position')
+
+    def nearby(self, **params):
+        lat, lng = self.COTONOU
+        return self.client.get(reverse('restaurant-nearby'), {'lat': lat, 'lng': lng, **params})
+
+    def test_geohash(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(self.ganhi.geohash, geo.encode(6.3548, 2.4301))
+
+    def test_covering_cells_contain_the_circle(self):
+        lat, lng = self.COTONOU
+        for radius in (0.5, 3, 10, 45):
+            cells = geo.covering_cells(lat, lng, radius)
+            for bearing in range(0, 360, 15):
+                dlat = radius * 0.999 / geo.KM_PER_DEGREE * geo.math.cos(geo.math.radians(bearing))
+                dlng = (radius * 0.999 / (geo.KM_PER_DEGREE * geo.math.cos(geo.math.radians(lat)))
+                        * geo.math.sin(geo.math.radians(bearing)))
+                point = geo.encode(lat + dlat, lng + dlng)
+                self.assertTrue(any(point.startswith(cell) for cell in cells), (radius, bearing))
+
+    def test_ordered_by_distance_within_delivery_radius(self):
+        data = self.nearby(radius=5).data
+        self.assertEqual([r['name'] for r in data], ['Ganhi', 'Haie Vive'])
+        self.assertLess(data[0]['distance'], data[1]['distance'])
+
+    def test_larger_radius_reaches_restaurants_that_deliver_far(self):
+        names = [r['name'] for r in self.nearby(radius=30).data]
+        self.assertEqual(names, ['Ganhi', 'Haie Vive', 'Porto-Novo'])
+
+    def test_moving_a_restaurant_updates_the_index(self):
+        self.porto_novo.latitude, self.porto_novo.longitude = 6.3600, 2.4200
+        self.porto_novo.save(update_fields=['latitude', 'longitude'])
+        self.assertEqual(self.nearby(radius=5).data[0]['name'], 'Porto-Novo')
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(reverse('restaurant-nearby')).status_code, 400)
+        self.assertEqual(self.nearby(radius=-1).status_code, 400)
+
+
+class EtaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('client', 'client@test.com', 'test123')
+        cls.restaurant = make_restaurant('Chez Aïcha', delivery_time='30-40 min')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def place_order(self, minutes_ago):
+        order = Order.objects.create(user=self.customer, restaurant=self.restaurant, total=2000,
+                                     delivery_address='Cotonou', customer_name='Client',
+                                     customer_phone='97000000')
+        created_at = timezone.now() - timedelta(minutes=minutes_ago)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        order.created_at = created_at
+        return order
+
+    def deliver(self, prep_minutes, travel_minutes):
+        order = self.place_order(prep_minutes + travel_minutes)
+        order_flow.set_status(order, 'ready', ready_at=order.created_at + timedelta(minutes=prep_minutes))
+        order_flow.set_status(order, 'delivered')
+        return order
+
+    def test_static_fallback_without_history(self):
+        data = self.client.get(reverse('restaurant-list')).data['results'][0]
+        self.assertEqual(data['eta_minutes'], 35)
+
+    def test_learned_eta_from_transitions(self):
+        for _ in range(eta.MIN_SAMPLES):
+            self.deliver(prep_minutes=20, travel_minutes=10)
+        stats = RestaurantEtaStats.objects.get(restaurant=self.restaurant, hour=RestaurantEtaStats.ALL_HOURS)
+        self.assertEqual((stats.prep_count, stats.travel_count), (5, 5))
+        data = self.client.get(reverse('restaurant-detail', args=[self.restaurant.id])).data
+        self.assertEqual(data['eta_minutes'], 30)
+
+    def test_samples_are_taken_once_per_order(self):
+        order = self.place_order(minutes_ago=20)
+        order_flow.set_status(order, 'ready')
+        order_flow.set_status(order, 'preparing')
+        order_flow.set_status(order, 'ready')
+        order_flow.set_status(order, 'delivered')
+        order_flow.set_status(order, 'delivering')
+        order_flow.set_status(order, 'delivered')
+        stats = RestaurantEtaStats.objects.get(restaurant=self.restaurant, hour=RestaurantEtaStats.ALL_HOURS)
+        self.assertEqual((stats.prep_count, stats.travel_count), (1, 1))
+
+    def test_order_estimated_delivery(self):
+        for _ in range(eta.MIN_SAMPLES):
+            self.deliver(prep_minutes=20, travel_minutes=10)
+        order = self.place_order(minutes_ago=5)
+        order_flow.set_status(order, 'ready')
+        self.client.force_authenticate(self.customer)
+        data = self.client.get(reverse('order-detail', args=[order.id])).data
+        expected = order.ready_at + timedelta(minutes=10)
+        self.assertAlmostEqual(datetime.fromisoformat(data['estimated_delivery_at']), expected,
+                               delta=timedelta(seconds=1))
+        delivered = self.client.get(reverse('order-detail', args=[Order.objects.filter(status='delivered').first().id]))
+        self.assertIsNone(delivered.data['estimated_delivery_at'])
+
+    def test_rebuild_matches_incremental(self):
+        for prep in (12, 18, 25):
+            self.deliver(prep_minutes=prep, travel_minutes=9)
+        incremental = sorted(RestaurantEtaStats.objects.values_list(
+            'hour', 'prep_count', 'prep_seconds', 'travel_count', 'travel_seconds'))
+        eta.rebuild()
+        rebuilt = sorted(RestaurantEtaStats.objects.values_list(
+            'hour', 'prep_count', 'prep_seconds', 'travel_count', 'travel_seconds'))
+        self.assertEqual(len(rebuilt), len(incremental))
+        for a, b in zip(incremental, rebuilt):
+            self.assertEqual(a[:2] + a[3:4], b[:2] + b[3:4])
+            self.assertAlmostEqual(a[2], b[2], places=3)
+
+    def test_update_status_rejects_unknown_status(self):
+        order = self.place_order(minutes_ago=1)
+        admin = User.objects.create_user('admin', 'admin@test.com', 'admin123', role='admin')
+        self.client.force_authenticate(admin)
+        response = self.client.post(reverse('order-update-status', args=[order.id]), {'status': 'lost'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImageVariantTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root, IMAGE_WORKERS=0)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', 'admin@test.com', 'admin123', role='admin')
+        cls.restaurant = make_restaurant('Chez Aïcha')
+        cls.product = Product.objects.create(restaurant=cls.restaurant, name='Attiéké', price=1500)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def upload(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1500), 'orange').save(buffer, 'JPEG')
+        photo = SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+        url = reverse('product-upload-image', args=[self.product.id])
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(url, {'image': photo}, format='multipart')
+        return response, callbacks
+
+    def test_upload_returns_before_variants_exist(self):
+        response, callbacks = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image_variants, {})
+        self.assertIn('/media/products/', response.data['image_url'])
+
+    def test_variants_rendered_and_served(self):
+        _, callbacks = self.upload()
+        for callback in callbacks:
+            callback()
+        self.product.refresh_from_db()
+        variants = self.product.image_variants['image']
+        self.assertEqual(variants['source'], self.product.image.name)
+        for variant, size in images.VARIANTS.items():
+            with default_storage.open(variants[variant]['webp']) as f:
+                self.assertEqual(max(Image.open(f).size), size)
+
+        url = reverse('product-detail', args=[self.product.id])
+        self.assertTrue(self.client.get(url).data['image_url'].endswith('/card.jpg'))
+        webp = self.client.get(url, {'image_format': 'webp'}).data['image_url']
+        self.assertTrue(webp.endswith('/card.webp'))
+
+    def test_stale_job_does_not_overwrite_newer_image(self):
+        self.upload()
+        name = Product.objects.get(pk=self.product.pk).image.name
+        Product.objects.filter(pk=self.product.pk).update(image='products/other.jpg')
+        images.process('api.Product', self.product.pk, 'image', name)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image_variants, {})
+
+
+class RowSerializerTests(TestCase):
+    """The .values() read path must render byte-for-byte what the model serializers do."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.grill = Category.objects.create(name='Grillades', icon='flame', order=1)
+        cls.other = Category.objects.create(name='Spécialités', icon='star', order=2)
+        cls.restaurant = make_restaurant('Chez Aïcha', [cls.other, cls.grill], rating=4.5,
+                                         latitude=6.37, longitude=2.39)
+        cls.plain = make_restaurant('Maquis')
+        cls.product = Product.objects.create(restaurant=cls.restaurant, category=cls.grill,
+                                             name='Brochettes', price=2000, is_popular=True)
+        cls.loose = Product.objects.create(restaurant=cls.plain, name='Bissap', price=500)
+        variants = {'image': {
+            'source': 'products/brochettes été.jpg',
+            'card': {'jpeg': 'variants/products/brochettes été/card.jpg',
+                     'webp': 'variants/products/brochettes été/card.webp'},
+        }}
+        Product.objects.filter(pk=cls.product.pk).update(
+            image='products/brochettes été.jpg', image_variants=variants)
+        Category.objects.filter(pk=cls.grill.pk).update(image='categories/grill.png')
+        Restaurant.objects.filter(pk=cls.restaurant.pk).update(cover_image='restaurants/covers/c.jpg')
+        RestaurantEtaStats.objects.create(restaurant=cls.restaurant, hour=RestaurantEtaStats.ALL_HOURS,
+                                          prep_count=5, prep_seconds=3000,
+                                          travel_count=5, travel_seconds=1500)
+
+    def assertSameJSON(self, rows_class, serializer_class, queryset, **params):
+        request = RequestFactory().get('/api/', params)
+        fast = rows_class(request).serialize(rows_class(request).prepare(queryset))
+        slow = serializer_class(queryset, many=True, context={'request': request}).data
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(slow))
+
+    def test_products(self):
+        queryset = Product.objects.order_by('id')
+        self.assertSameJSON(ProductRows, ProductSerializer, queryset)
+        self.assertSameJSON(ProductRows, ProductSerializer, queryset, image_format='webp')
+
+    def test_categories(self):
+        self.assertSameJSON(CategoryRows, CategorySerializer, Category.objects.all())
+
+    def test_restaurants(self):
+        queryset = Restaurant.objects.for_listing().order_by('id')
+        self.assertSameJSON(RestaurantRows, RestaurantListSerializer, queryset)
+
+    def test_product_pages_follow_cursor(self):
+        response = APIClient().get(reverse('product-list'))
+        self.assertEqual([p['id'] for p in response.data['results']], [self.loose.id, self.product.id])
+        self.assertIsNone(response.data['next'])
+
+
+class BulkImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.grill = Category.objects.create(name='Grillades', icon='flame')
+        cls.manager = User.objects.create_user('manager', 'manager@test.com', 'test123', role='manager')
+        cls.restaurant = make_restaurant('Chez Aïcha', manager=cls.manager)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.url = reverse('product-bulk-import')
+
+    def upload_csv(self, text, name='menu.csv'):
+        upload = SimpleUploadedFile(name, text.encode(), content_type='text/csv')
+        return self.client.post(self.url, {'file': upload}, format='multipart')
+
+    def test_csv_upload(self):
+        response = self.upload_csv(
+            'name,price,category,description,is_popular\n'
+            'Brochettes,2000,grillades,"Bœuf, piment",true\n'
+            'Bissap,500,,,\n'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 2)
+        brochettes = Product.objects.get(name='Brochettes')
+        self.assertEqual((brochettes.restaurant, brochettes.category), (self.restaurant, self.grill))
+        self.assertTrue(brochettes.is_popular)
+        self.assertIsNone(Product.objects.get(name='Bissap').category)
+        self.assertEqual(search_index.search('brochettes')['products'][0], brochettes)
+
+    def test_jsonl_body(self):
+        body = '\n'.join(json.dumps({'name': f'Plat {i}', 'price': 1000 + i}) for i in range(5000))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 5000)
+        self.assertEqual(self.restaurant.products.count(), 5000)
+        # Multi-row INSERTs (SQLite caps their size), not one statement per product
+        self.assertLess(len(queries), 200)
+
+    def test_errors_reported_per_row_and_nothing_saved(self):
+        response = self.upload_csv(
+            'name,price,category\n'
+            'Brochettes,2000,Grillades\n'
+            ',-5,Grillades\n'
+            'Pizza,3000,Inconnue\n'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error_count'], 2)
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertEqual(set(response.data['errors'][0]['errors']), {'name', 'price'})
+        self.assertIn('category', response.data['errors'][1]['errors'])
+        self.assertFalse(Product.objects.exists())
+
+    def test_clients_cannot_import(self):
+        client = User.objects.create_user('client', 'client@test.com', 'test123')
+        self.client.force_authenticate(client)
+        self.assertEqual(self.upload_csv('name,price\nPizza,3000\n').status_code, 403)
+
+    def test_admin_needs_a_numeric_restaurant_id(self):
+        self.client.force_authenticate(User.objects.create_user('admin', 'admin@test.com', 'test123', role='admin'))
+        response = self.client.post(f'{self.url}?restaurant_id=abc', 'name,price\nPizza,3000\n',
+                                    content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'restaurant_id must be an integer'})
+        response = self.client.post(f'{self.url}?restaurant_id={self.restaurant.pk}', 'name,price\nPizza,3000\n',
+                                    content_type='text/csv')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_unknown_format(self):
+        upload = SimpleUploadedFile('menu.xlsx', b'data', content_type='application/octet-stream')
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 415)
+
+
+class BatchProductUpdateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', 'manager@test.com', 'test123', role='manager')
+        cls.restaurant = make_restaurant('Chez Aïcha', manager=cls.manager)
+        cls.other = make_restaurant('Maquis')
+        cls.products = [
+            Product.objects.create(restaurant=cls.restaurant, name=f'Plat {i}', price=1000)
+            for i in range(30)
+        ]
+        cls.foreign = Product.objects.create(restaurant=cls.other, name='Ailleurs', price=1000)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.url = reverse('product-batch-update')
+
+    def test_batch_applied_in_fixed_queries(self):
+        changes = [{'id': p.id, 'is_available': False} for p in self.products]
+        changes[0].update(price=1200, is_popular=True)
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(8):
+            response = self.client.patch(self.url, changes, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        # One cache bump and one sync log write, not one per product
+        self.assertEqual(len(callbacks), 2)
+        self.assertFalse(Product.objects.filter(restaurant=self.restaurant, is_available=True).exists())
+        first = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual((first.price, first.is_popular), (1200, True))
+        self.assertEqual(search_index.search('plat')['products'], [])
+
+    def test_products_outside_scope_reject_the_batch(self):
+        changes = [{'id': self.products[0].id, 'price': 1}, {'id': self.foreign.id, 'price': 1}]
+        response = self.client.patch(self.url, changes, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['ids'], [self.foreign.id])
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).price, 1000)
+
+    def test_invalid_change(self):
+        response = self.client.patch(self.url, [{'id': self.products[0].id, 'price': -1}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('price', response.data[0])
+
+
+class CheckoutTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('client', 'client@test.com', 'test123')
+        cls.restaurant = make_restaurant('Chez Aïcha')
+        cls.dishes = Product.objects.bulk_create([
+            Product(restaurant=cls.restaurant, name=f'Plat {i}', price=1000 + i) for i in range(50)
+        ])
+        cls.others = [make_restaurant(f'Maquis {i}', delivery_fee=300 + 100 * i) for i in range(4)]
+        cls.other_dishes = Product.objects.bulk_create([
+            Product(restaurant=restaurant, name='Alloco', price=500) for restaurant in cls.others
+        ])
+        Cart.objects.create(user=cls.customer)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def fill_cart(self, count, products=None):
+        CartItem.objects.bulk_create([
+            CartItem(cart=self.customer.cart, product=dish, quantity=2)
+            for dish in (products or self.dishes[:count])
+        ])
+
+    def checkout(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('order-create-from-cart'), {
+                'delivery_address': 'Cotonou', 'customer_name': 'Client', 'customer_phone': '97000000',
+            }, format='json')
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_basket(self):
+        # The day's first order also creates the rollup rows
+        self.fill_cart(50)
+        self.checkout()
+        self.fill_cart(1)
+        small, small_queries = self.checkout()
+        self.fill_cart(50)
+        large, large_queries = self.checkout()
+        self.assertEqual((small.status_code, large.status_code), (201, 201))
+        self.assertEqual(small_queries, large_queries)
+
+        self.assertEqual(len(large.data['orders'][0]['items']), 50)
+        self.assertEqual(large.data['total'], sum(2 * dish.price for dish in self.dishes))
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(ProductDailyStats.objects.get(product=self.dishes[0]).quantity, 6)
+
+    def test_one_order_per_restaurant(self):
+        self.fill_cart(0, [self.dishes[0], self.other_dishes[1], self.dishes[1], self.other_dishes[0]])
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        orders = response.data['orders']
+        self.assertEqual([order['restaurant'] for order in orders],
+                         [self.restaurant.pk, self.others[1].pk, self.others[0].pk])
+        self.assertEqual([order['total'] for order in orders], [2 * 1000 + 2 * 1001, 1000, 1000])
+        self.assertEqual([order['delivery_fee'] for order in orders], [500, 400, 300])
+        self.assertEqual([len(order['items']) for order in orders], [2, 1, 1])
+        self.assertEqual((response.data['total'], response.data['delivery_fee']), (6002, 1200))
+        self.assertEqual({order['checkout'] for order in orders}, {response.data['id']})
+        self.assertEqual(RestaurantDailyStats.objects.get(
+            restaurant=self.others[1], date=rollups.local_date()).revenue, 1000)
+
+    def test_query_count_does_not_grow_with_restaurants(self):
+        self.fill_cart(0, [self.dishes[0], *self.other_dishes])
+        self.checkout()
+        self.fill_cart(1)
+        _, one_restaurant = self.checkout()
+        self.fill_cart(0, [self.dishes[0], *self.other_dishes])
+        response, five_restaurants = self.checkout()
+        self.assertEqual(len(response.data['orders']), 5)
+        self.assertEqual(one_restaurant, five_restaurants)
+
+    def test_empty_cart(self):
+        response, _ = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_failure_leaves_nothing_behind(self):
+        self.fill_cart(3)
+        with mock.patch('api.rollups.record_created', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.checkout()
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 3)
+
+    def test_checkout_changes_cart_etag(self):
+        self.fill_cart(1)
+        etag = self.client.get(reverse('cart'))['ETag']
+        self.checkout()
+        response = self.client.get(reverse('cart'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'], [])
+
+
+class IdempotencyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('client', 'client@test.com', 'test123')
+        cls.dish = Product.objects.create(restaurant=make_restaurant('Chez Aïcha'), name='Brochettes', price=2000)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def add_to_cart(self, key=None, product=None, quantity=2):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(reverse('cart-items'), {
+            'product_id': product or self.dish.pk, 'quantity': quantity,
+        }, format='json', **headers)
+
+    def test_retry_replays_without_running_again(self):
+        first = self.add_to_cart('add-1')
+        with self.assertNumQueries(1):
+            retry = self.add_to_cart('add-1')
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+        self.add_to_cart('add-2')
+        self.add_to_cart()
+        self.assertEqual(CartItem.objects.get().quantity, 6)
+
+    def test_checkout_retry(self):
+        self.add_to_cart()
+        details = {'delivery_address': 'Cotonou', 'customer_name': 'Client', 'customer_phone': '97000000'}
+        responses = [
+            self.client.post(reverse('order-create-from-cart'), details, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+            for _ in range(3)
+        ]
+        self.assertEqual({response.status_code for response in responses}, {201})
+        self.assertEqual({response.data['id'] for response in responses}, {responses[0].data['id']})
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.add_to_cart('add-1')
+        self.assertEqual(self.add_to_cart('add-1', quantity=3).status_code, 422)
+
+    def test_failures_are_not_stored(self):
+        self.assertEqual(self.add_to_cart('add-1', product=999999).status_code, 404)
+        self.assertEqual(self.add_to_cart('add-1', product=999999).status_code, 404)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_keys_expire(self):
+        self.add_to_cart('add-1')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertNotIn('Idempotent-Replayed', self.add_to_cart('add-1'))
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class DailyStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', 'manager@test.com', 'test123', role='manager')
+        cls.customer = User.objects.create_user('client', 'client@test.com', 'test123')
+        cls.restaurant = make_restaurant('Chez Aïcha', manager=cls.manager)
+        cls.dish = Product.objects.create(restaurant=cls.restaurant, name='Brochettes', price=2000)
+        Cart.objects.create(user=cls.customer)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def checkout(self, quantity=1):
+        CartItem.objects.create(cart=self.customer.cart, product=self.dish, quantity=quantity)
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(reverse('order-create-from-cart'), {
+            'delivery_address': 'Cotonou', 'customer_name': 'Client', 'customer_phone': '97000000',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(pk=response.data['orders'][0]['id'])
+
+    def counters(self, day=None):
+        row = RestaurantDailyStats.objects.get(restaurant=self.restaurant, date=day or rollups.local_date())
+        return {field: getattr(row, field) for field in rollups.COUNTERS}
+
+    def test_counters_follow_orders(self):
+        first = self.checkout(quantity=2)
+        second = self.checkout()
+        self.assertEqual(self.counters(), {'orders': 2, 'revenue': 6000, 'pending': 2, 'cancelled': 0})
+
+        order_flow.set_status(first, 'preparing')
+        order_flow.set_status(first, 'ready')
+        order_flow.set_status(second, 'cancelled')
+        expected = {'orders': 2, 'revenue': 4000, 'pending': 0, 'cancelled': 1}
+        self.assertEqual(self.counters(), expected)
+        self.assertEqual(self.counters(RestaurantDailyStats.ALL_TIME), expected)
+
+    def test_dashboard_reads_rollups(self):
+        self.checkout()
+        order_flow.set_status(self.checkout(), 'delivered')
+        self.client.force_authenticate(self.manager)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('manager-dashboard'))
+        self.assertEqual(response.data, {
+            'total_orders': 2, 'pending_orders': 1, 'today_revenue': 4000, 'total_products': 1,
+        })
+
+    def test_rebuild_matches_incremental_counters(self):
+        order_flow.set_status(self.checkout(), 'cancelled')
+        self.checkout(quantity=3)
+        incremental = self.counters(), self.counters(RestaurantDailyStats.ALL_TIME)
+        rollups.rebuild()
+        self.assertEqual((self.counters(), self.counters(RestaurantDailyStats.ALL_TIME)), incremental)
+
+    def test_generic_order_endpoints_keep_rollups(self):
+        order = self.checkout()
+        url = reverse('order-detail', args=[order.pk])
+        response = self.client.patch(url, {'status': 'cancelled', 'notes': 'Sonner deux fois'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['notes']), ('pending', 'Sonner deux fois'))
+        self.assertEqual(self.client.delete(url).status_code, 405)
+        self.assertTrue(Order.objects.filter(pk=order.pk).exists())
+        self.assertEqual(self.counters(), {'orders': 1, 'revenue': 2000, 'pending': 1, 'cancelled': 0})
+
+    def admin_form(self, client, url):
+        """The change form's current values, as the browser would post them back."""
+        response = client.get(url)
+        data = {}
+        forms = [response.context['adminform'].form]
+        for inline in response.context['inline_admin_formsets']:
+            forms += [inline.formset.management_form, *inline.formset.forms]
+        for form in forms:
+            for field in form:
+                value = field.value()
+                data[field.html_name] = '' if value is None else value
+        return data
+
+    def test_admin_form_goes_through_set_status(self):
+        order = self.checkout()
+        admin = User.objects.create(username='boss', role='admin', is_staff=True, is_superuser=True)
+        client = Client()
+        client.force_login(admin)
+        url = reverse('admin:api_order_change', args=[order.pk])
+        data = self.admin_form(client, url)
+        data['status'] = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(url, data).status_code, 302)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'cancelled')
+        self.assertEqual(self.counters(), {'orders': 1, 'revenue': 0, 'pending': 0, 'cancelled': 1})
+        self.assertTrue(SyncChange.objects.filter(kind='order', object_id=order.pk, channel='orders').exists())
+        self.assertEqual(client.post(reverse('admin:api_order_delete', args=[order.pk]), {'post': 'yes'}).status_code,
+                         403)
+
+
+class MissionClaimTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        # No passwords: the clients force authentication, and hashing dominates the run time
+        self.drivers = [User.objects.create(username=f'driver{i}', role='driver') for i in range(8)]
+        customer = User.objects.create(username='client')
+        self.manager = User.objects.create(username='manager', role='manager')
+        restaurant = make_restaurant('Chez Aïcha', manager=self.manager)
+        self.order = Order.objects.create(user=customer, restaurant=restaurant, total=2000, status='ready',
+                                          delivery_address='Cotonou', customer_name='Client',
+                                          customer_phone='97000000')
+
+    def claim(self, driver):
+        self.client.force_authenticate(driver)
+        return self.client.post(reverse('driver-mission-claim', args=[self.order.pk]))
+
+    def test_claim_once(self):
+        response = self.claim(self.drivers[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status'], response.data['driver']), ('assigned', self.drivers[0].pk))
+        self.assertEqual(self.claim(self.drivers[1]).status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.driver, self.drivers[0])
+        self.assertEqual(self.claim(self.manager).status_code, 403)
+
+    def test_assignment_does_not_overwrite_a_claim(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(self.claim(self.drivers[0]).status_code, 200)
+        self.assertFalse(order_flow.assign(stale, self.drivers[1].pk))
+        self.assertIsNone(stale.driver_id)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).driver, self.drivers[0])
+
+    def test_concurrent_claims(self):
+        barrier = threading.Barrier(len(self.drivers))
+        results = []
+
+        def claim(driver):
+            try:
+                order = Order.objects.get(pk=self.order.pk)
+                barrier.wait()
+                while True:
+                    try:
+                        results.append((driver.pk, order_flow.assign(order, driver.pk)))
+                        break
+                    except OperationalError as exc:
+                        # The in-memory test database reports a table lock at once
+                        # where a file database or PostgreSQL would wait for it
+                        if 'locked' not in str(exc):
+                            raise
+                        time.sleep(0.001)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=claim, args=[driver]) for driver in self.drivers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [driver for driver, claimed in results if claimed]
+        self.assertEqual(len(results), len(self.drivers))
+        self.assertEqual(len(winners), 1)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.driver_id), ('assigned', winners[0]))
+
+
+class DispatchTests(TestCase):
+
+    def setUp(self):
+        # A Wednesday noon, local time
+        self.now = timezone.make_aware(datetime(2026, 10, 14, 12, 0))
+        self.customer = User.objects.create(username='client')
+        self.restaurants = [make_restaurant('Chez Aïcha'), make_restaurant('Maquis Le Bon Goût')]
+        self.drivers = [self.make_driver(f'driver{i}') for i in range(3)]
+
+    def make_driver(self, username, day='wednesday', **kwargs):
+        driver = User.objects.create(username=username, role='driver', **kwargs)
+        DriverSchedule.objects.create(driver=driver, day=day, start_time='08:00', end_time='18:00')
+        return driver
+
+    def make_orders(self, restaurant, count, status='ready', driver=None):
+        return [
+            Order.objects.create(user=self.customer, restaurant=restaurant, total=2000, status=status, driver=driver,
+                                 ready_at=self.now - timedelta(minutes=count - i), delivery_address='Cotonou',
+                                 customer_name='Client', customer_phone='97000000')
+            for i in range(count)
+        ]
+
+    def test_plan_batches_by_restaurant_to_the_least_loaded(self):
+        first = self.make_orders(self.restaurants[0], 4)
+        second = self.make_orders(self.restaurants[1], 1)
+        loads = {self.drivers[0].pk: 2, self.drivers[1].pk: 0, self.drivers[2].pk: 1}
+        assignments = dispatch.plan(sorted(first + second, key=lambda order: order.ready_at), loads)
+        self.assertEqual(assignments, {
+            self.drivers[1].pk: first[:3],
+            self.drivers[2].pk: first[3:],
+            # Tied at two deliveries, the lower id goes first
+            self.drivers[0].pk: second,
+        })
+
+    def test_plan_stops_at_capacity(self):
+        orders = self.make_orders(self.restaurants[0], 5)
+        assignments = dispatch.plan(orders, {self.drivers[0].pk: 1, self.drivers[1].pk: 2})
+        self.assertEqual(assignments, {self.drivers[0].pk: orders[:2], self.drivers[1].pk: orders[2:3]})
+
+    def test_run_skips_drivers_who_cannot_take_work(self):
+        off_shift = self.make_driver('weekend', day='saturday')
+        unavailable = self.make_driver('resting', is_available=False)
+        schedule = DriverSchedule.objects.get(driver=self.drivers[0])
+        schedule.is_enabled = False
+        schedule.save()
+        self.make_orders(self.restaurants[0], dispatch.MAX_ACTIVE, status='picked_up', driver=self.drivers[1])
+        orders = self.make_orders(self.restaurants[1], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            assigned = dispatch.run(now=self.now)
+        self.assertEqual(assigned, orders)
+        drivers = set(Order.objects.filter(pk__in=[order.pk for order in orders]).values_list('driver', flat=True))
+        self.assertEqual(drivers, {self.drivers[2].pk})
+        self.assertNotIn(off_shift.pk, drivers)
+        self.assertNotIn(unavailable.pk, drivers)
+        self.assertEqual(dispatch.run(now=self.now + timedelta(hours=8)), [])
+
+    def test_run_skips_orders_claimed_meanwhile(self):
+        orders = self.make_orders(self.restaurants[0], 2)
+        loads = dispatch.driver_loads(self.now)
+        claimed = Order.objects.get(pk=orders[0].pk)
+        self.assertTrue(order_flow.assign(claimed, self.drivers[0].pk))
+
+        assigned = order_flow.assign_planned(dispatch.plan(orders, loads))
+        self.assertEqual(assigned, orders[1:])
+        self.assertEqual(Order.objects.get(pk=orders[0].pk).driver, self.drivers[0])
+
+    def test_run_notifies_once_per_run(self):
+        orders = self.make_orders(self.restaurants[0], 3) + self.make_orders(self.restaurants[1], 3)
+        with self.captureOnCommitCallbacks() as callbacks:
+            dispatch.run(now=self.now)
+        # One publish and one sync log write, whatever the number of orders
+        self.assertEqual(len(callbacks), 2)
+        with mock.patch('api.events.get_broker') as broker, self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(broker().publish.call_count, len(orders))
+        self.assertEqual(SyncChange.objects.filter(kind='order', channel='missions').count(), len(orders))
+
+    def test_run_query_count(self):
+        for restaurant in self.restaurants:
+            self.make_orders(restaurant, 2)
+        # Snapshot, loads, one UPDATE per driver given work and the re-read, plus two savepoints each way
+        with self.assertNumQueries(9):
+            assigned = dispatch.run(now=self.now)
+        self.assertEqual(len(assigned), 4)
+        self.assertEqual({order.status for order in assigned}, {'assigned'})
+
+
+class ShiftTests(TestCase):
+
+    def setUp(self):
+        # A Wednesday, local time
+        self.wednesday = timezone.make_aware(datetime(2026, 10, 14))
+        self.client = APIClient()
+        self.driver = User.objects.create(username='driver', role='driver')
+        self.admin = User.objects.create(username='boss', role='admin', is_staff=True, is_superuser=True)
+
+    def schedule(self, day, start, end, is_enabled=True):
+        return DriverSchedule(driver=self.driver, day=day, start_time=parse_time(start), end_time=parse_time(end),
+                              is_enabled=is_enabled)
+
+    def at(self, days=0, hours=0, minutes=0):
+        return self.wednesday + timedelta(days=days, hours=hours, minutes=minutes)
+
+    def test_bitmap(self):
+        day = shifts.SLOTS_PER_DAY
+        self.assertEqual(shifts.slots(shifts.bitmap([self.schedule('monday', '08:00', '09:00')])), [32, 33, 34, 35])
+        # Quarter-hours starting inside the shift; the disabled day counts for nothing
+        self.assertEqual(shifts.slots(shifts.bitmap([
+            self.schedule('tuesday', '08:10', '08:45:30'),
+            self.schedule('friday', '08:00', '18:00', is_enabled=False),
+        ])), [day + 33, day + 34, day + 35])
+        # A night shift runs into the next day, Sunday into Monday
+        self.assertEqual(shifts.slots(shifts.bitmap([self.schedule('sunday', '23:30', '00:30')])),
+                         [0, 1, 7 * day - 2, 7 * day - 1])
+        self.assertEqual(shifts.slots(shifts.bitmap([self.schedule('monday', '00:00', '23:59:59')])),
+                         list(range(day)))
+
+    def test_schedule_changes_update_the_index(self):
+        self.client.force_authenticate(self.driver)
+        self.client.get(reverse('driver-schedule-my-schedule'))
+        # The default week: 08:00-18:00 on weekdays
+        self.assertEqual(DriverShiftSlot.objects.filter(driver=self.driver).count(), 5 * 40)
+        self.assertIn(self.driver, shifts.on_shift(self.at(hours=9)))
+        self.assertNotIn(self.driver, shifts.on_shift(self.at(hours=19)))
+
+        self.client.post(reverse('driver-schedule-update-day'), {'day': 'wednesday', 'end_time': '20:00'})
+        self.assertIn(self.driver, shifts.on_shift(self.at(hours=19)))
+        self.client.post(reverse('driver-schedule-update-day'), {'day': 'wednesday', 'is_enabled': False})
+        self.assertNotIn(self.driver, shifts.on_shift(self.at(hours=9)))
+        self.assertEqual(DriverShiftSlot.objects.filter(driver=self.driver).count(), 4 * 40)
+
+        DriverSchedule.objects.filter(driver=self.driver, day='thursday').delete()
+        self.assertNotIn(self.driver, shifts.on_shift(self.at(days=1, hours=9)))
+
+    def test_unknown_days_are_rejected_and_skipped(self):
+        self.client.force_authenticate(self.driver)
+        url = reverse('driver-schedule-update-day')
+        self.assertEqual(self.client.post(url, {'day': 'Monday', 'start_time': '09:00'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'day': 'monday', 'start_time': 'noon'}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('driver-schedule-list'), {'day': 'Monday'}).status_code, 400)
+        self.assertFalse(DriverSchedule.objects.exists())
+        response = self.client.post(url, {'day': 'monday', 'start_time': '09:00'})
+        self.assertEqual((response.status_code, response.data['start_time']), (200, '09:00:00'))
+
+        DriverSchedule.objects.bulk_create([self.schedule('Tuesday', '08:00', '18:00')])
+        self.assertEqual(shifts.slots(shifts.bitmap(DriverSchedule.objects.filter(day='Tuesday'))), [])
+        call_command('rebuild_driver_shifts', stdout=io.StringIO())
+        self.assertEqual(DriverShiftSlot.objects.count(), 36)
+
+    def test_on_shift_query(self):
+        for day in shifts.WEEKDAYS:
+            self.schedule(day, '08:00', '18:00').save()
+        resting = User.objects.create(username='resting', role='driver', is_available=False)
+        DriverSchedule.objects.create(driver=resting, day='wednesday', start_time='08:00', end_time='18:00')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(set(shifts.on_shift(self.at(hours=12))), {self.driver, resting})
+        self.assertEqual(list(shifts.available(self.at(hours=12))), [self.driver])
+        self.assertEqual(list(shifts.on_shift(self.at(hours=12)).filter(pk=resting.pk)), [resting])
+
+        DriverShiftSlot.objects.all().delete()
+        call_command('rebuild_driver_shifts', stdout=io.StringIO())
+        self.assertEqual(DriverShiftSlot.objects.count(), 7 * 40 + 40)
+
+    def test_admin_lists(self):
+        DriverSchedule.objects.create(driver=self.driver, day='wednesday', start_time='08:00', end_time='18:00')
+        User.objects.create(username='other', role='driver')
+        self.client.force_authenticate(self.admin)
+        url = reverse('admin-users-drivers')
+        self.assertEqual(len(self.client.get(url).data), 2)
+        response = self.client.get(url, {'on_shift': self.at(hours=12).isoformat()})
+        self.assertEqual([user['id'] for user in response.data], [self.driver.pk])
+        self.assertEqual(self.client.get(url, {'on_shift': self.at(hours=20).isoformat()}).data, [])
+        self.assertEqual(self.client.get(url, {'on_shift': 'soon'}).status_code, 400)
+
+        with mock.patch('api.shifts.timezone.now', return_value=self.at(hours=12)):
+            client = Client()
+            client.force_login(self.admin)
+            response = client.get(reverse('admin:api_user_changelist'), {'on_shift': 'now'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.driver])
+
+
+class TrackingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.driver = User.objects.create(username='driver', role='driver')
+        self.customer = User.objects.create(username='client')
+        self.order = Order.objects.create(user=self.customer, restaurant=make_restaurant('Chez Aïcha'), total=2000,
+                                          status='picked_up', driver=self.driver, delivery_address='Cotonou',
+                                          customer_name='Client', customer_phone='97000000')
+        patcher = mock.patch.object(tracking, 'tracker', tracking.Tracker(buffer_size=4, flush_size=3))
+        self.tracker = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ping(self, latitude, longitude, user=None):
+        self.client.force_authenticate(user or self.driver)
+        return self.client.post(reverse('driver-location'), {'latitude': latitude, 'longitude': longitude},
+                                format='json')
+
+    def test_ring_buffer_keeps_the_last_points(self):
+        buffer = tracking.RingBuffer(size=3)
+        self.assertIsNone(buffer.latest())
+        self.assertEqual([buffer.append(t, t, -t) for t in range(1, 6)], [True, True, True, False, False])
+        self.assertEqual(buffer.latest(), (5.0, 5.0, -5.0))
+        self.assertEqual(buffer.drain(), [(3.0, 3.0, -3.0), (4.0, 4.0, -4.0), (5.0, 5.0, -5.0)])
+        buffer.append(6, 6, -6)
+        self.assertEqual(buffer.drain(), [(6.0, 6.0, -6.0)])
+
+    def test_pings_are_written_in_batches(self):
+        with self.assertNumQueries(0):
+            for i in range(2):
+                self.tracker.record(self.driver.pk, 6.37, 2.39 + i / 1000)
+        self.assertFalse(DriverLocation.objects.exists())
+        self.tracker.record(self.driver.pk, 6.37, 2.4)
+        self.assertEqual(DriverLocation.objects.count(), 3)
+        self.assertEqual(self.tracker.flush(), 0)
+
+    def test_buffer_overflow_drops_the_oldest(self):
+        self.tracker.flush_size = 100
+        for i in range(6):
+            self.tracker.record(self.driver.pk, 6.37, i)
+        self.assertEqual(self.tracker.dropped, 2)
+        self.assertEqual(self.tracker.flush(), 4)
+        self.assertEqual(sorted(DriverLocation.objects.values_list('longitude', flat=True)), [2, 3, 4, 5])
+
+    def test_ping_endpoint(self):
+        self.assertEqual(self.ping(6.37, 2.39).status_code, 204)
+        self.assertEqual(self.tracker.latest(self.driver.pk)[1:], (6.37, 2.39))
+        self.assertEqual(self.ping(91, 2.39).status_code, 400)
+        self.assertEqual(self.ping('north', 2.39).status_code, 400)
+        self.assertEqual(self.ping(6.37, 2.39, user=self.customer).status_code, 403)
+
+    def test_order_driver_location(self):
+        url = reverse('order-driver-location', args=[self.order.pk])
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.ping(6.37, 2.39)
+        self.client.force_authenticate(self.customer)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['driver'], response.data['latitude'], response.data['longitude']),
+                         (self.driver.pk, 6.37, 2.39))
+
+        # Pings that reached another process are read back from the database
+        self.tracker.flush()
+        with mock.patch.object(tracking, 'tracker', tracking.Tracker()):
+            self.assertEqual(self.client.get(url).data['longitude'], 2.39)
+
+        self.client.force_authenticate(User.objects.create(username='stranger'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+        Order.objects.filter(pk=self.order.pk).update(status='delivered')
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class RouteTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.driver = User.objects.create(username='driver', role='driver')
+        self.customer = User.objects.create(username='client')
+        # Along one avenue, west to east
+        self.near = make_restaurant('Chez Aïcha', latitude=6.37, longitude=2.38)
+        self.far = make_restaurant('Maquis Le Bon Goût', latitude=6.37, longitude=2.46)
+        patcher = mock.patch.object(tracking, 'tracker', tracking.Tracker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_order(self, restaurant, longitude, status='assigned', latitude=6.37):
+        return Order.objects.create(user=self.customer, restaurant=restaurant, driver=self.driver, total=2000,
+                                    status=status, delivery_address='Cotonou', customer_name='Client',
+                                    customer_phone='97000000', delivery_latitude=latitude,
+                                    delivery_longitude=longitude)
+
+    def stops(self, route):
+        return [(stop['order'], stop['kind']) for stop in route]
+
+    def test_pickups_come_before_their_dropoffs(self):
+        first = self.make_order(self.near, 2.40)
+        # Delivered next to the start, but collected at the far end
+        second = self.make_order(self.far, 2.371)
+        carried = self.make_order(self.near, 2.43, status='picked_up')
+        route = routes.plan([first, second, carried], start=(6.37, 2.37), now=self.now)
+        stops = self.stops(route)
+        self.assertEqual(stops[0], (first.pk, 'pickup'))
+        self.assertEqual(stops[-1], (second.pk, 'dropoff'))
+        self.assertEqual(sorted(stops), sorted([
+            (first.pk, 'pickup'), (first.pk, 'dropoff'), (second.pk, 'pickup'), (second.pk, 'dropoff'),
+            (carried.pk, 'dropoff'),
+        ]))
+        self.assertLess(stops.index((first.pk, 'pickup')), stops.index((first.pk, 'dropoff')))
+        etas = [stop['eta'] for stop in route]
+        self.assertEqual(etas, sorted(etas))
+        self.assertGreater(etas[0], self.now)
+
+    def test_two_opt_preserves_precedence(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            restaurant = rng.choice([self.near, self.far])
+            self.make_order(restaurant, rng.uniform(2.3, 2.5), latitude=rng.uniform(6.3, 6.4))
+        route = routes.driver_route(self.driver.pk, now=self.now)
+        self.assertEqual(len(route), 40)
+        position = {stop: i for i, stop in enumerate(self.stops(route))}
+        for (pk, kind), i in position.items():
+            if kind == 'dropoff':
+                self.assertLess(position[(pk, 'pickup')], i)
+
+    def test_orders_without_coordinates_come_last(self):
+        unknown = self.make_order(self.near, None)
+        known = self.make_order(self.far, 2.45)
+        route = routes.plan([unknown, known], now=self.now)
+        self.assertEqual(self.stops(route), [
+            (known.pk, 'pickup'), (known.pk, 'dropoff'), (unknown.pk, 'pickup'), (unknown.pk, 'dropoff'),
+        ])
+        self.assertEqual(route[0]['distance_km'], 0)
+        self.assertIsNone(route[-1]['eta'])
+
+    def test_missions_include_the_route(self):
+        order = self.make_order(self.near, 2.40)
+        tracking.record(self.driver.pk, 6.37, 2.37)
+        client = APIClient()
+        client.force_authenticate(self.driver)
+        response = client.get(reverse('driver-missions'))
+        self.assertEqual([stop['kind'] for stop in response.data['route']], ['pickup', 'dropoff'])
+        self.assertEqual(response.data['route'][0]['order'], order.pk)
+        self.assertGreater(response.data['route'][0]['distance_km'], 0)
+
+
+class OrderEventTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username='client')
+        cls.manager = User.objects.create(username='manager', role='manager')
+        cls.driver = User.objects.create(username='driver', role='driver')
+        cls.restaurant = make_restaurant('Chez Aïcha', manager=cls.manager)
+        cls.order = Order.objects.create(user=cls.customer, restaurant=cls.restaurant, total=2000,
+                                         delivery_address='Cotonou', customer_name='Client',
+                                         customer_phone='97000000')
+
+    def published(self, change):
+        with mock.patch('api.events.get_broker') as broker:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+        return [(set(channels), json.loads(message)) for (channels, message), _ in broker().publish.call_args_list]
+
+    def test_channels_follow_visibility(self):
+        self.assertEqual(events.channels_for(self.customer), [f'user:{self.customer.pk}'])
+        self.assertEqual(events.channels_for(self.manager), [f'restaurant:{self.restaurant.pk}'])
+        self.assertEqual(events.channels_for(self.driver), [f'driver:{self.driver.pk}', 'missions'])
+
+        base = {'orders', f'user:{self.customer.pk}', f'restaurant:{self.restaurant.pk}'}
+        [(channels, event)] = self.published(lambda: order_flow.set_status(self.order, 'ready'))
+        self.assertEqual(channels, base | {'missions'})
+        self.assertEqual((event['type'], event['status'], event['previous_status']),
+                         ('order.updated', 'ready', 'pending'))
+
+        [(channels, event)] = self.published(lambda: order_flow.assign(self.order, self.driver.pk))
+        self.assertEqual(channels, base | {'missions', f'driver:{self.driver.pk}'})
+        self.assertEqual(event['driver'], self.driver.pk)
+
+        [(channels, _)] = self.published(lambda: order_flow.set_status(self.order, 'picked_up'))
+        self.assertEqual(channels, base | {f'driver:{self.driver.pk}'})
+        self.assertEqual(self.published(lambda: order_flow.set_status(self.order, 'picked_up')), [])
+
+    def test_checkout_publishes_created_orders(self):
+        dish = Product.objects.create(restaurant=self.restaurant, name='Brochettes', price=2000)
+        CartItem.objects.create(cart=Cart.objects.create(user=self.customer), product=dish)
+        published = self.published(lambda: order_flow.create_from_cart(
+            self.customer, {'delivery_address': 'Cotonou', 'customer_name': 'Client', 'customer_phone': '1'}))
+        self.assertEqual([event['type'] for _, event in published], ['order.created'])
+
+    def test_requires_token(self):
+        self.assertEqual(self.client.get(reverse('order-events')).status_code, 401)
+        response = self.client.get(reverse('order-events'), HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(response.status_code, 401)
+
+    def test_wsgi_is_refused(self):
+        token = str(RefreshToken.for_user(self.manager).access_token)
+        response = self.client.get(reverse('order-events'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 501)
+
+    async def test_stream_pushes_visible_changes(self):
+        token = str(RefreshToken.for_user(self.manager).access_token)
+        response = await self.async_client.get(reverse('order-events'), headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        def change():
+            with self.captureOnCommitCallbacks(execute=True):
+                order_flow.set_status(self.order, 'accepted')
+                other = make_restaurant('Maquis')
+                order_flow.set_status(Order.objects.create(user=self.customer, restaurant=other, total=1,
+                                                           delivery_address='-', customer_name='-',
+                                                           customer_phone='-'), 'accepted')
+
+        await sync_to_async(change)()
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        event, data = chunk.decode().split('\n')[:2]
+        self.assertEqual(event, 'event: order')
+        self.assertEqual(json.loads(data.removeprefix('data: '))['status'], 'accepted')
+        self.assertEqual(json.loads(data.removeprefix('data: '))['id'], self.order.pk)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(anext(stream), 0.2)
+        await response.streaming_content.aclose()
+
+
+class SyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create(username='client')
+        cls.other = User.objects.create(username='other')
+        cls.driver = User.objects.create(username='driver', role='driver')
+        cls.rival = User.objects.create(username='rival', role='driver')
+        cls.restaurant = make_restaurant('Chez Aïcha')
+        cls.dish = Product.objects.create(restaurant=cls.restaurant, name='Brochettes', price=2000)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def poll(self, user, since):
+        self.client.force_authenticate(user)
+        return self.client.get(reverse('sync'), {'since': since})
+
+    def change(self, func):
+        with self.captureOnCommitCallbacks(execute=True):
+            return func()
+
+    def place_order(self, user):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.create(cart=cart, product=self.dish)
+        checkout = self.change(lambda: order_flow.create_from_cart(user, {
+            'delivery_address': 'Cotonou', 'customer_name': 'Client', 'customer_phone': '97000000'}))
+        return checkout.orders.get()
+
+    def test_quiet_poll(self):
+        self.client.force_authenticate(self.customer)
+        cursor = self.client.get(reverse('sync')).data['cursor']
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('sync'), {'since': cursor})
+        self.assertEqual(response.data['cursor'], cursor)
+        self.assertEqual(response.data['products'], [])
+        self.assertEqual(response.data['removed']['products'], [])
+
+    def test_catalog_changes_and_tombstones(self):
+        cursor = self.poll(self.customer, 0).data['cursor']
+        dish = self.change(lambda: Product.objects.create(restaurant=self.restaurant, name='Alloco', price=500))
+        gone = self.change(lambda: Product.objects.create(restaurant=self.restaurant, name='Ablo', price=300)).pk
+        self.change(Product.objects.get(pk=gone).delete)
+        data = self.poll(self.customer, cursor).data
+        self.assertEqual([(product['id'], product['name']) for product in data['products']], [(dish.pk, 'Alloco')])
+        self.assertEqual(data['removed']['products'], [gone])
+
+        cursor = data['cursor']
+        self.client.force_authenticate(User.objects.create(username='admin', role='admin'))
+        self.change(lambda: self.client.patch(reverse('product-batch-update'), [
+            {'id': dish.pk, 'price': 600},
+        ], format='json'))
+        data = self.poll(self.customer, cursor).data
+        self.assertEqual([product['price'] for product in data['products']], [600])
+
+    def test_hidden_catalog_objects_are_removed(self):
+        cursor = self.poll(self.customer, 0).data['cursor']
+        self.restaurant.is_active = False
+        self.change(self.restaurant.save)
+        self.dish.is_available = False
+        self.change(self.dish.save)
+        data = self.poll(self.customer, cursor).data
+        self.assertEqual((data['restaurants'], data['removed']['restaurants']), ([], [self.restaurant.pk]))
+        self.assertEqual((data['products'], data['removed']['products']), ([], [self.dish.pk]))
+
+    def test_orders_follow_visibility(self):
+        cursor = self.poll(self.customer, 0).data['cursor']
+        order = self.place_order(self.customer)
+        self.place_order(self.other)
+        self.assertEqual([item['id'] for item in self.poll(self.customer, cursor).data['orders']], [order.pk])
+
+        self.change(lambda: order_flow.set_status(order, 'ready'))
+        data = self.poll(self.driver, cursor).data
+        self.assertEqual([item['id'] for item in data['orders']], [order.pk])
+
+        cursor = data['cursor']
+        self.change(lambda: order_flow.assign(order, self.rival.pk))
+        data = self.poll(self.driver, cursor).data
+        self.assertEqual((data['orders'], data['removed']['orders']), ([], [order.pk]))
+        self.assertEqual(self.poll(self.rival, cursor).data['orders'][0]['driver'], self.rival.pk)
+
+    def test_order_edits_are_synced_and_published(self):
+        order = self.place_order(self.customer)
+        cursor = self.poll(self.customer, 0).data['cursor']
+        self.client.force_authenticate(self.customer)
+        with mock.patch('api.events.get_broker') as broker:
+            response = self.change(lambda: self.client.patch(reverse('order-detail', args=[order.pk]),
+                                                             {'notes': 'Portail bleu'}, format='json'))
+        self.assertEqual(response.status_code, 200)
+        [(channels, message)] = [call.args for call in broker().publish.call_args_list]
+        self.assertIn(f'user:{self.customer.pk}', channels)
+        self.assertEqual(json.loads(message)['type'], 'order.updated')
+        self.assertEqual([item['notes'] for item in self.poll(self.customer, cursor).data['orders']],
+                         ['Portail bleu'])
+
+    @override_settings(SYNC_VISIBILITY_LAG=60)
+    def test_recent_changes_wait_for_the_visibility_lag(self):
+        self.change(lambda: Category.objects.create(name='Grillades', icon='fire'))
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get(reverse('sync')).data['cursor'], 0)
+        data = self.poll(self.customer, 0).data
+        self.assertEqual((data['cursor'], data['categories'], data['more']), (0, [], False))
+
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch('api.sync.timezone.now', return_value=later):
+            data = self.poll(self.customer, 0).data
+        self.assertEqual([category['name'] for category in data['categories']], ['Grillades'])
+
+    def test_paging_and_purged_cursor(self):
+        for i in range(3):
+            self.change(lambda: Category.objects.create(name=f'Cat {i}', icon='star'))
+        with mock.patch('api.views.MAX_SYNC_CHANGES', 2):
+            data = self.poll(self.customer, 0).data
+            self.assertTrue(data['more'])
+            self.assertEqual(len(data['categories']), 2)
+            data = self.poll(self.customer, data['cursor']).data
+            self.assertEqual((data['more'], len(data['categories'])), (False, 1))
+
+        sync.purge(timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.poll(self.customer, 0).status_code, 410)
+        self.assertEqual(self.poll(self.customer, data['cursor']).status_code, 200)
+        self.assertEqual(self.poll(self.customer, 'x').status_code, 400)
+
+
+class AnalyticsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', 'manager@test.com', 'test123', role='manager')
+        cls.admin = User.objects.create_user('admin', 'admin@test.com', 'test123', role='admin')
+        cls.customer = User.objects.create_user('client', 'client@test.com', 'test123')
+        cls.restaurant = make_restaurant('Chez Aïcha', manager=cls.manager)
+        cls.other = make_restaurant('Maquis')
+        cls.brochettes = Product.objects.create(restaurant=cls.restaurant, name='Brochettes', price=2000)
+        cls.bissap = Product.objects.create(restaurant=cls.restaurant, name='Bissap', price=500)
+        cls.attieke = Product.objects.create(restaurant=cls.other, name='Attiéké', price=1500)
+        Cart.objects.create(user=cls.customer)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def checkout(self, *lines):
+        for product, quantity in lines:
+            CartItem.objects.create(cart=self.customer.cart, product=product, quantity=quantity)
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(reverse('order-create-from-cart'), {
+            'delivery_address': 'Cotonou', 'customer_name': 'Client', 'customer_phone': '97000000',
+        }, format='json')
+        return Order.objects.get(pk=response.data['orders'][0]['id'])
+
+    def place_orders(self):
+        self.checkout((self.brochettes, 2), (self.bissap, 1))
+        self.checkout((self.bissap, 4))
+        order_flow.set_status(self.checkout((self.brochettes, 5)), 'cancelled')
+        self.checkout((self.attieke, 1))
+
+    def report(self, name, user=None, **params):
+        self.client.force_authenticate(user or self.manager)
+        return self.client.get(reverse(f'analytics-{name}'), params)
+
+    def test_top_products(self):
+        self.place_orders()
+        data = self.report('top-products').data['results']
+        self.assertEqual([(p['name'], p['quantity'], p['revenue']) for p in data],
+                         [('Bissap', 5, 2500), ('Brochettes', 2, 4000)])
+        data = self.report('top-products', by='revenue', limit=1).data['results']
+        self.assertEqual([p['name'] for p in data], ['Brochettes'])
+
+    def test_revenue_basket_and_hours(self):
+        self.place_orders()
+        today = rollups.local_date()
+        week = self.report('revenue', period='week').data['results']
+        self.assertEqual(week, [{'period': today - timedelta(days=today.weekday()),
+                                 'orders': 3, 'cancelled': 1, 'revenue': 6500}])
+        basket = self.report('basket').data['results']
+        self.assertEqual(basket, {'orders': 2, 'revenue': 6500, 'average_value': 3250, 'average_items': 3.5})
+        hours = self.report('orders-by-hour', user=self.admin).data['results']
+        self.assertEqual(len(hours), 24)
+        self.assertEqual(sum(h['orders'] for h in hours), 4)
+
+    def test_uncancelled_order_counts_again(self):
+        order = self.checkout((self.brochettes, 1))
+        order_flow.set_status(order, 'cancelled')
+        order_flow.set_status(order, 'pending')
+        row = ProductDailyStats.objects.get(product=self.brochettes)
+        self.assertEqual((row.quantity, row.revenue), (1, 2000))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.place_orders()
+
+        def snapshot():
+            return (
+                sorted(RestaurantDailyStats.objects.values_list('restaurant', 'date', 'orders', 'revenue',
+                                                                'pending', 'cancelled')),
+                sorted(RestaurantHourlyStats.objects.values_list('restaurant', 'date', 'hour', 'orders')),
+                sorted(ProductDailyStats.objects.values_list('product', 'date', 'quantity', 'revenue')),
+            )
+        incremental = snapshot()
+        rollups.rebuild()
+        self.assertEqual(snapshot(), incremental)
+
+    def test_reports_read_rollups_in_fixed_queries(self):
+        # 90 days of a busy restaurant's rollups, 40 dishes each day
+        dishes = [Product(restaurant=self.restaurant, name=f'Plat {i}', price=1000) for i in range(40)]
+        Product.objects.bulk_create(dishes)
+        today = rollups.local_date()
+        days = [today - timedelta(days=n) for n in range(90)]
+        RestaurantDailyStats.objects.bulk_create([
+            RestaurantDailyStats(restaurant=self.restaurant, date=day, orders=300, revenue=900000) for day in days])
+        RestaurantHourlyStats.objects.bulk_create([
+            RestaurantHourlyStats(restaurant=self.restaurant, date=day, hour=hour, orders=25)
+            for day in days for hour in range(10, 22)])
+        ProductDailyStats.objects.bulk_create([
+            ProductDailyStats(product=dish, restaurant=self.restaurant, date=day, quantity=i, revenue=1000 * i)
+            for day in days for i, dish in enumerate(dishes)])
+
+        # Restaurant scope, then one aggregate query per report (two for the basket)
+        for name, queries in [('revenue', 2), ('orders-by-hour', 2), ('top-products', 2), ('basket', 3)]:
+            with self.assertNumQueries(queries):
+                response = self.report(name, days=90)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.report('top-products', days=90).data['results'][0]['quantity'], 39 * 90)
+        self.assertEqual(len(self.report('revenue', days=90).data['results']), 90)
+
+    def test_scope(self):
+        self.assertEqual(self.report('basket', user=self.customer).status_code, 403)
+        self.assertEqual(self.report('basket', days=400).status_code, 400)
+        for days in ['10' * 12, '0', '-5', 'week', '2.5']:
+            self.assertEqual(self.report('basket', days=days).status_code, 400, days)
+        self.assertEqual(self.report('basket', end='0001-01-05').status_code, 400)
+        self.assertEqual(self.report('basket', start='2026-13-01').status_code, 400)
+
+
+class AdminChangelistTests(TestCase):
+    """Changelists must cost the same number of queries whatever the number of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser('root', 'root@test.com', 'test123', role='admin')
+        cls.category = Category.objects.create(name='Grillades', icon='flame')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.superuser)
+
+    def add_rows(self, count):
+        for i in range(count):
+            n = User.objects.count()
+            manager = User.objects.create_user(f'manager{n}', role='manager')
+            driver = User.objects.create_user(f'driver{n}', role='driver')
+            customer = User.objects.create_user(f'client{n}')
+            restaurant = make_restaurant(f'Resto {n}', [self.category], manager=manager)
+            product = Product.objects.create(restaurant=restaurant, category=self.category,
+                                             name=f'Plat {n}', price=1000)
+            order = Order.objects.create(user=customer, restaurant=restaurant, driver=driver, total=1000,
+                                         delivery_address='Cotonou', customer_name='Client',
+                                         customer_phone='97000000')
+            order.items.create(product=product, product_name=product.name, product_price=1000, quantity=2)
+            cart = Cart.objects.create(user=customer)
+            CartItem.objects.create(cart=cart, product=product, quantity=3)
+
+    def changelist_queries(self, model, **params):
+        url = reverse(f'admin:api_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_constant_query_budget(self):
+        models = ['order', 'restaurant', 'product', 'category', 'cart', 'driverschedule']
+        self.add_rows(2)
+        few = {model: self.changelist_queries(model) for model in models}
+        self.add_rows(10)
+        many = {model: self.changelist_queries(model) for model in models}
+        self.assertEqual(many, few)
+        for model, queries in many.items():
+            self.assertLessEqual(queries, 12, model)
+
+    def test_annotated_columns(self):
+        self.add_rows(1)
+        response = self.client.get(reverse('admin:api_cart_changelist'))
+        self.assertContains(response, '3,000 FCFA')
+        response = self.client.get(reverse('admin:api_restaurant_changelist'))
+        self.assertContains(response, '1 commandes')
+
+    def test_autocomplete_filter(self):
+        self.add_rows(2)
+        restaurant = Restaurant.objects.order_by('id').first()
+        url = reverse('admin:api_order_changelist')
+        response = self.client.get(url, {'restaurant__id__exact': restaurant.id})
+        self.assertEqual(list(response.context['cl'].result_list), list(restaurant.orders.all()))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, f'<option value="{restaurant.id}" selected>{restaurant.name}</option>',
+                            html=True)
+        # A cleared filter submits an empty value
+        response = self.client.get(url, {'restaurant__id__exact': ''})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_estimated_count_for_big_tables(self):
+        self.add_rows(1)
+        Order.objects.create(id=500, user=self.superuser, restaurant=Restaurant.objects.get(), total=1000,
+                             delivery_address='Cotonou', customer_name='Client', customer_phone='97000000')
+        url = reverse('admin:api_order_changelist')
+        with mock.patch('api.admin.EXACT_COUNT_LIMIT', 0):
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 500)
+            # Filtered lists are counted exactly
+            self.assertEqual(self.client.get(url, {'status': 'pending'}).context['cl'].result_count, 2)
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 2)
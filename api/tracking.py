@@ -0,0 +1,166 @@
+"""
+Driver GPS tracking.
+
+Pings are not written one by one. Each driver's points go into a fixed-size
+ring buffer held in memory: three interleaved ``array('d')`` columns
+(timestamp, latitude, longitude), 24 bytes a point. Pending points are
+written to ``DriverLocation`` with one bulk insert once ``FLUSH_SIZE`` of them
+are waiting, or on the first ping ``FLUSH_INTERVAL`` seconds after the last
+flush. The ping that crosses the threshold does the flush, outside the lock,
+so other pings never wait on the database. A driver pinging faster than the
+flushes overwrites their oldest unflushed points, so memory stays bounded.
+
+The latest position is read from the buffer when the driver's pings reach
+this process, and from the database otherwise (another process, or a
+restart). Points still in memory when a process stops are lost, at most
+``FLUSH_INTERVAL`` seconds of them.
+"""
+import logging
+import threading
+import time
+from array import array
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import DatabaseError
+
+from .models import DriverLocation
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 64
+FLUSH_SIZE = 2000
+FLUSH_INTERVAL = 10
+
+
+class RingBuffer:
+    """The last ``size`` points of one driver, oldest overwritten first."""
+    __slots__ = ('points', 'size', 'written', 'pending')
+
+    def __init__(self, size=BUFFER_SIZE):
+        self.points = array('d', bytes(3 * 8 * size))
+        self.size = size
+        self.written = 0
+        self.pending = 0
+
+    def append(self, timestamp, latitude, longitude):
+        """Add a point; returns False when it overwrote an unflushed one."""
+        i = 3 * (self.written % self.size)
+        self.points[i] = timestamp
+        self.points[i + 1] = latitude
+        self.points[i + 2] = longitude
+        self.written += 1
+        if self.pending == self.size:
+            return False
+        self.pending += 1
+        return True
+
+    def latest(self):
+        if not self.written:
+            return None
+        i = 3 * ((self.written - 1) % self.size)
+        return tuple(self.points[i:i + 3])
+
+    def drain(self):
+        """The unflushed points, oldest first; they are then considered flushed."""
+        points = []
+        for n in range(self.written - self.pending, self.written):
+            i = 3 * (n % self.size)
+            points.append(tuple(self.points[i:i + 3]))
+        self.pending = 0
+        return points
+
+
+class Tracker:
+    """Ring buffers of every driver seen by this process; thread-safe."""
+
+    def __init__(self, buffer_size=BUFFER_SIZE, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.buffer_size = buffer_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.pending = 0
+        self.dropped = 0
+        self.last_flush = time.monotonic()
+
+    def record(self, driver_id, latitude, longitude, timestamp=None):
+        """Buffer a ping, flushing the buffers when they are due."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            buffer = self.buffers.get(driver_id)
+            if buffer is None:
+                buffer = self.buffers[driver_id] = RingBuffer(self.buffer_size)
+            if buffer.append(timestamp, latitude, longitude):
+                self.pending += 1
+            else:
+                self.dropped += 1
+            due = (self.pending >= self.flush_size
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+            rows = self._take() if due else None
+        if rows:
+            self._write(rows)
+
+    def latest(self, driver_id):
+        """(timestamp, latitude, longitude) of the driver's last ping here, or None."""
+        with self.lock:
+            buffer = self.buffers.get(driver_id)
+            return buffer.latest() if buffer is not None else None
+
+    def flush(self):
+        """Write every pending point now; returns how many were written."""
+        with self.lock:
+            rows = self._take()
+        return self._write(rows)
+
+    def _take(self):
+        rows = [
+            DriverLocation(driver_id=driver_id, recorded_at=datetime.fromtimestamp(timestamp, dt_timezone.utc),
+                           latitude=latitude, longitude=longitude)
+            for driver_id, buffer in self.buffers.items() if buffer.pending
+            for timestamp, latitude, longitude in buffer.drain()
+        ]
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        return rows
+
+    def _write(self, rows):
+        if not rows:
+            return 0
+        try:
+            DriverLocation.objects.bulk_create(rows, batch_size=500)
+        except DatabaseError:
+            # The latest positions stay in memory; losing a batch of history only thins the track
+            logger.exception('Could not write %d driver locations', len(rows))
+            return 0
+        return len(rows)
+
+
+tracker = Tracker()
+
+
+def record(driver_id, latitude, longitude, timestamp=None):
+    tracker.record(driver_id, latitude, longitude, timestamp)
+
+
+def latest_position(driver_id):
+    """
+    {latitude, longitude, recorded_at} of the driver's last known position, or
+    None: from memory when the driver pings this process, else the database.
+    """
+    point = tracker.latest(driver_id)
+    if point is not None:
+        timestamp, latitude, longitude = point
+        recorded_at = datetime.fromtimestamp(timestamp, dt_timezone.utc)
+    else:
+        row = (DriverLocation.objects.filter(driver_id=driver_id).order_by('-recorded_at')
+               .values_list('latitude', 'longitude', 'recorded_at').first())
+        if row is None:
+            return None
+        latitude, longitude, recorded_at = row
+    return {'latitude': latitude, 'longitude': longitude, 'recorded_at': recorded_at}
+
+
+def purge(before):
+    """Delete points recorded before ``before``; returns how many were deleted."""
+    deleted, _ = DriverLocation.objects.filter(recorded_at__lt=before).delete()
+    return deleted
@@ -5,10 +5,11 @@ from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     RegisterView, LoginView, LogoutView, ProfileView,
     CategoryViewSet, RestaurantViewSet, ProductViewSet,
-    CartView, CartItemView, OrderViewSet,
-    DriverScheduleViewSet, DriverMissionsView,
-    BannerViewSet, app_settings,
+    CartView, CartItemView, OrderViewSet, order_events,
+    DriverScheduleViewSet, DriverMissionsView, claim_mission, driver_location,
+    BannerViewSet, app_settings, search, sync_changes,
     manager_dashboard, manager_restaurant, driver_dashboard,
+    revenue_report, orders_by_hour_report, top_products_report, basket_report,
     AdminUserViewSet, TeamMemberViewSet
 )
 
@@ -30,21 +31,38 @@ urlpatterns = [
     path('auth/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('auth/profile/', ProfileView.as_view(), name='profile'),
     
+    # Search
+    path('search/', search, name='search'),
+    
     # Cart
     path('cart/', CartView.as_view(), name='cart'),
     path('cart/items/', CartItemView.as_view(), name='cart-items'),
     
+    # Orders (before the router, whose detail route would match "events")
+    path('orders/events/', order_events, name='order-events'),
+    
     # Driver
     path('driver/missions/', DriverMissionsView.as_view(), name='driver-missions'),
+    path('driver/missions/<int:pk>/claim/', claim_mission, name='driver-mission-claim'),
+    path('driver/location/', driver_location, name='driver-location'),
     path('driver/dashboard/', driver_dashboard, name='driver-dashboard'),
     
     # Manager
     path('manager/dashboard/', manager_dashboard, name='manager-dashboard'),
     path('manager/restaurant/', manager_restaurant, name='manager-restaurant'),
     
+    # Analytics
+    path('analytics/revenue/', revenue_report, name='analytics-revenue'),
+    path('analytics/orders-by-hour/', orders_by_hour_report, name='analytics-orders-by-hour'),
+    path('analytics/top-products/', top_products_report, name='analytics-top-products'),
+    path('analytics/basket/', basket_report, name='analytics-basket'),
+    
     # Settings
     path('settings/', app_settings, name='app-settings'),
     
+    # Delta sync
+    path('sync/', sync_changes, name='sync'),
+    
     # Router URLs
     path('', include(router.urls)),
 ]
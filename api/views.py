@@ -2,20 +2,41 @@ from rest_framework import viewsets, status, generics, serializers
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Sum, Count
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Count, F, Prefetch
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
+from datetime import date, timedelta
+import asyncio
+
+from . import eta, events, geo, imports, orders as order_flow, rollups, routes, search as search_index, shifts, sync, tracking
+from .cache import catalog_cached, catalog_etag, get_versions, make_etag
+from .idempotency import idempotent
+from .pagination import KeysetPagination, UserKeysetPagination
+from .rows import CategoryRows, ProductRows, RestaurantRows, RowListMixin
+from .signals import invalidate_catalog
 
 from .models import (
     User, Category, Restaurant, Product, Cart, CartItem,
-    Order, OrderItem, DriverSchedule, Banner, AppSettings, TeamMember
+    Checkout, Order, DriverSchedule, Banner, AppSettings, TeamMember
 )
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, LoginSerializer,
-    CategorySerializer, RestaurantListSerializer, RestaurantDetailSerializer,
-    ProductSerializer, CartSerializer, CartItemSerializer,
-    OrderSerializer, CreateOrderSerializer, DriverScheduleSerializer,
+    CategorySerializer, RestaurantListSerializer, RestaurantDetailSerializer, MenuSectionSerializer,
+    NearbyRestaurantSerializer,
+    ProductSerializer, ProductChangeSerializer, CartSerializer, CartItemSerializer,
+    OrderSerializer, CheckoutSerializer, CreateOrderSerializer, DriverScheduleSerializer,
     BannerSerializer, AppSettingsSerializer, DashboardStatsSerializer,
     DriverStatsSerializer, TeamMemberSerializer
 )
@@ -86,28 +107,55 @@ class LogoutView(generics.GenericAPIView):
 
 # ==================== CATEGORIES ====================
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(RowListMixin, viewsets.ModelViewSet):
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
+    row_serializer_class = CategoryRows
     permission_classes = [AllowAny]
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAdminUser()]
         return [AllowAny()]
+    
+    @method_decorator([condition(etag_func=catalog_etag(Category)), catalog_cached(Category)])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @method_decorator(condition(etag_func=catalog_etag(Category)))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 # ==================== RESTAURANTS ====================
 
-class RestaurantViewSet(viewsets.ModelViewSet):
+class RestaurantViewSet(RowListMixin, viewsets.ModelViewSet):
     queryset = Restaurant.objects.filter(is_active=True)
     permission_classes = [AllowAny]
+    row_serializer_class = RestaurantRows
+    
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return self.queryset.for_detail()
+        if self.action == 'menu':
+            return self.queryset
+        return self.queryset.for_listing()
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return RestaurantDetailSerializer
         return RestaurantListSerializer
     
+    # Listings embed the current hour's ETA, hence eta.window
+    @method_decorator([condition(etag_func=catalog_etag(Restaurant, Category, eta.window)),
+                       catalog_cached(Restaurant, Category, eta.window)])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @method_decorator(condition(etag_func=catalog_etag(Restaurant, Category, Product, eta.window)))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_permissions(self):
         if self.action in ['create', 'destroy']:
             return [IsAdminUser()]
@@ -130,19 +178,54 @@ class RestaurantViewSet(viewsets.ModelViewSet):
         return super().partial_update(request, *args, **kwargs)
     
     @action(detail=False, methods=['get'])
+    @method_decorator(condition(etag_func=catalog_etag(Restaurant, Category, eta.window)))
     def by_category(self, request):
         category_id = request.query_params.get('category_id')
         if category_id:
-            restaurants = self.queryset.filter(categories__id=category_id)
-            serializer = self.get_serializer(restaurants, many=True)
-            return Response(serializer.data)
+            rows = RestaurantRows(request)
+            return Response(rows.serialize(rows.prepare(self.queryset.filter(categories__id=category_id))))
         return Response([])
     
     @action(detail=False, methods=['get'])
+    @method_decorator(condition(etag_func=catalog_etag(Restaurant, Category, eta.window)))
     def featured(self, request):
-        restaurants = self.queryset.filter(rating__gte=4.0)[:10]
-        serializer = self.get_serializer(restaurants, many=True)
-        return Response(serializer.data)
+        rows = RestaurantRows(request)
+        return Response(rows.serialize(rows.prepare(self.queryset.filter(rating__gte=4.0))[:10]))
+    
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Restaurants within ?radius km (default 10) of ?lat/?lng that also deliver
+        there, nearest first. Candidates come from the geohash index.
+        """
+        try:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+            radius = min(float(request.query_params.get('radius', 10)), 50)
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 100)
+        except (KeyError, ValueError):
+            return Response({'error': 'lat and lng are required numbers'}, status=400)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or radius <= 0:
+            return Response({'error': 'Invalid coordinates or radius'}, status=400)
+        
+        candidates = self.queryset.filter(geo.within_cells(geo.covering_cells(lat, lng, radius)))
+        distances = {}
+        for pk, r_lat, r_lng, delivery_radius in candidates.values_list(
+                'id', 'latitude', 'longitude', 'delivery_radius'):
+            distance = geo.distance_km(lat, lng, r_lat, r_lng)
+            if distance <= radius and distance <= delivery_radius:
+                distances[pk] = distance
+        
+        nearest = sorted(distances, key=distances.get)[:limit]
+        restaurants = self.get_queryset().in_bulk(nearest)
+        results = []
+        for pk in nearest:
+            restaurant = restaurants.get(pk)
+            if restaurant is None:
+                continue
+            restaurant.distance = round(distances[pk], 2)
+            results.append(restaurant)
+        return Response(NearbyRestaurantSerializer(results, many=True, context={'request': request}).data)
     
     @action(detail=True, methods=['post'])
     def toggle_open(self, request, pk=None):
@@ -165,17 +248,75 @@ class RestaurantViewSet(viewsets.ModelViewSet):
             restaurant.save()
             return Response(RestaurantListSerializer(restaurant, context={'request': request}).data)
         return Response({'error': 'No image provided'}, status=400)
+    
+    @action(detail=True, methods=['get'])
+    @method_decorator([condition(etag_func=catalog_etag(Product, Restaurant, Category)),
+                       catalog_cached(Product, Restaurant, Category)])
+    def menu(self, request, pk=None):
+        """
+        Available products grouped by category, each section built from one query.
+        ?category=<id|none>&offset=N returns the following page of a single section.
+        """
+        restaurant = self.get_object()
+        category = request.query_params.get('category')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            offset = max(int(request.query_params.get('offset', 0)), 0) if category else 0
+        except ValueError:
+            return Response({'error': 'limit and offset must be integers'}, status=400)
+        if category and category != 'none' and not category.isdigit():
+            return Response({'error': 'Invalid category'}, status=400)
+        
+        products = restaurant.products.filter(is_available=True)
+        sections = (
+            products.values('category', 'category__name')
+            .annotate(product_count=Count('id'))
+            .order_by(F('category__order').asc(nulls_last=True), 'category__name')
+        )
+        if category == 'none':
+            sections = sections.filter(category__isnull=True)
+        elif category:
+            sections = sections.filter(category=category)
+        
+        menu_url = request.build_absolute_uri(reverse('restaurant-menu', args=[restaurant.id]))
+        data = []
+        for section in sections:
+            category_id = section['category']
+            section_products = (
+                products.filter(category=category_id) if category_id
+                else products.filter(category__isnull=True)
+            )
+            page = section_products.select_related('category').order_by('-is_popular', 'name', 'id')
+            next_offset = offset + limit
+            data.append({
+                'category_id': category_id,
+                'category_name': section['category__name'],
+                'product_count': section['product_count'],
+                'products': page[offset:next_offset],
+                'next': menu_url + '?' + urlencode({
+                    'category': category_id or 'none', 'offset': next_offset, 'limit': limit,
+                }) if next_offset < section['product_count'] else None,
+            })
+        
+        return Response({
+            'restaurant_id': restaurant.id,
+            'sections': MenuSectionSerializer(data, many=True, context={'request': request}).data,
+        })
 
 
 # ==================== PRODUCTS ====================
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(RowListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_available=True)
     serializer_class = ProductSerializer
+    row_serializer_class = ProductRows
+    MAX_BATCH_UPDATE = 500
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
     
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy', 'upload_image']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'upload_image', 'bulk_import',
+                           'batch_update']:
             return [IsAuthenticated()]
         return [AllowAny()]
     
@@ -187,6 +328,15 @@ class ProductViewSet(viewsets.ModelViewSet):
                 return Product.objects.filter(restaurant=restaurant)
         return Product.objects.filter(is_available=True)
     
+    # Managers see their own unavailable products too, hence per_user
+    @method_decorator(condition(etag_func=catalog_etag(Product, Restaurant, Category, per_user=True)))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @method_decorator(condition(etag_func=catalog_etag(Product, Restaurant, Category, per_user=True)))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def perform_create(self, serializer):
         user = self.request.user
         if user.role == 'manager':
@@ -199,25 +349,27 @@ class ProductViewSet(viewsets.ModelViewSet):
             serializer.save()
     
     @action(detail=False, methods=['get'])
+    @method_decorator(condition(etag_func=catalog_etag(Product, Restaurant, Category)))
     def by_restaurant(self, request):
         restaurant_id = request.query_params.get('restaurant_id')
         if restaurant_id:
-            products = self.queryset.filter(restaurant_id=restaurant_id)
-            serializer = self.get_serializer(products, many=True)
-            return Response(serializer.data)
+            rows = ProductRows(request)
+            return Response(rows.serialize(rows.prepare(self.queryset.filter(restaurant_id=restaurant_id))))
         return Response([])
     
     @action(detail=False, methods=['get'])
+    @method_decorator([condition(etag_func=catalog_etag(Product, Restaurant, Category)),
+                       catalog_cached(Product, Restaurant, Category)])
     def popular(self, request):
-        products = self.queryset.filter(is_popular=True)[:20]
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        rows = ProductRows(request)
+        return Response(rows.serialize(rows.prepare(self.queryset.filter(is_popular=True))[:20]))
     
     @action(detail=False, methods=['get'])
+    @method_decorator([condition(etag_func=catalog_etag(Product, Restaurant, Category)),
+                       catalog_cached(Product, Restaurant, Category)])
     def featured(self, request):
-        products = self.queryset.filter(is_featured=True)[:10]
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        rows = ProductRows(request)
+        return Response(rows.serialize(rows.prepare(self.queryset.filter(is_featured=True))[:10]))
     
     @action(detail=True, methods=['post'])
     def upload_image(self, request, pk=None):
@@ -227,14 +379,128 @@ class ProductViewSet(viewsets.ModelViewSet):
             product.save()
             return Response(ProductSerializer(product, context={'request': request}).data)
         return Response({'error': 'No image provided'}, status=400)
+    
+    @action(detail=False, methods=['patch'])
+    def batch_update(self, request):
+        """
+        Apply a list of ``{id, price?, is_available?, is_popular?}`` changes at once.
+        Managers may only change their own restaurant's products; the batch is
+        rejected as a whole if any id is outside that scope.
+        """
+        user = request.user
+        if user.role not in ('manager', 'admin'):
+            return Response({'error': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+        if not isinstance(request.data, list) or not 0 < len(request.data) <= self.MAX_BATCH_UPDATE:
+            return Response({'error': f'Send a list of 1 to {self.MAX_BATCH_UPDATE} changes'}, status=400)
+        serializer = ProductChangeSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        changes = {change.pop('id'): change for change in serializer.validated_data}
+        if len(changes) != len(serializer.validated_data):
+            return Response({'error': 'Each product may appear only once'}, status=400)
+        
+        products = Product.objects.filter(id__in=changes).select_related('restaurant', 'category')
+        if user.role == 'manager':
+            products = products.filter(restaurant__manager=user)
+        products = list(products)
+        missing = set(changes) - {product.id for product in products}
+        if missing:
+            return Response({'error': 'Products not found', 'ids': sorted(missing)}, status=404)
+        
+        fields, reindex = set(), []
+        for product in products:
+            change = changes[product.id]
+            if change.get('is_available', product.is_available) != product.is_available:
+                reindex.append(product)
+            for field, value in change.items():
+                setattr(product, field, value)
+            fields.update(change)
+        with transaction.atomic():
+            if fields:
+                Product.objects.bulk_update(products, sorted(fields))
+                invalidate_catalog(Product)
+                sync.catalog_changed(Product, changes)
+            # Availability decides whether a product is searchable
+            search_index.index_products(reindex)
+        return Response(ProductSerializer(products, many=True, context={'request': request}).data)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        """
+        Import a menu from a CSV or JSON Lines file, either uploaded as ``file``
+        or sent as the request body (text/csv, application/x-ndjson). Columns:
+        name, description, price, category (by name), is_available,
+        is_popular, is_featured. Admins pass ?restaurant_id.
+        """
+        user = request.user
+        if user.role == 'manager':
+            restaurant = Restaurant.objects.filter(manager=user).first()
+        elif user.role == 'admin':
+            restaurant_id = request.query_params.get('restaurant_id', '')
+            if restaurant_id and not restaurant_id.isdigit():
+                return Response({'error': 'restaurant_id must be an integer'}, status=400)
+            restaurant = Restaurant.objects.filter(pk=restaurant_id or None).first()
+        else:
+            return Response({'error': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+        if restaurant is None:
+            return Response({'error': 'No restaurant found'}, status=400)
+        
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'error': 'No file provided'}, status=400)
+            source, fmt = upload, imports.detect_format(upload.content_type, upload.name)
+        else:
+            source, fmt = request.stream, imports.detect_format(request.content_type.split(';')[0])
+        if fmt is None:
+            return Response({'error': 'Send a CSV or JSON Lines file'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        if source is None:
+            return Response({'error': 'The file has no rows'}, status=400)
+        
+        try:
+            report = imports.import_products(restaurant, source, fmt)
+        except imports.ImportFileError as exc:
+            return Response({'error': str(exc)}, status=400)
+        return Response(report, status=status.HTTP_400_BAD_REQUEST if report['error_count'] else status.HTTP_201_CREATED)
+
+
+# ==================== SEARCH ====================
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search(request):
+    query = request.query_params.get('q', '').strip()
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=400)
+    
+    results = search_index.search(query, limit=limit)
+    context = {'request': request}
+    return Response({
+        'query': query,
+        'restaurants': RestaurantListSerializer(results['restaurants'], many=True, context=context).data,
+        'products': ProductSerializer(results['products'], many=True, context=context).data,
+    })
 
 
 # ==================== CART ====================
 
+def cart_etag(request, *args, **kwargs):
+    # Item changes touch Cart.updated_at; the nested products show restaurant and category names too
+    updated_at = Cart.objects.filter(user=request.user).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return make_etag(updated_at.isoformat(), *get_versions(Product, Restaurant, Category))
+
+
 class CartView(generics.RetrieveAPIView):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(condition(etag_func=cart_etag))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+    
     def get_object(self):
         cart, created = Cart.objects.get_or_create(user=self.request.user)
         return cart
@@ -243,6 +509,7 @@ class CartView(generics.RetrieveAPIView):
 class CartItemView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
     
+    @method_decorator(idempotent)
     def post(self, request):
         """Add item to cart"""
         cart, _ = Cart.objects.get_or_create(user=request.user)
@@ -262,6 +529,7 @@ class CartItemView(generics.GenericAPIView):
         if not created:
             cart_item.quantity += quantity
             cart_item.save()
+        cart.save(update_fields=['updated_at'])
         
         return Response(CartSerializer(cart, context={'request': request}).data)
     
@@ -280,6 +548,7 @@ class CartItemView(generics.GenericAPIView):
                 cart_item.save()
         except CartItem.DoesNotExist:
             return Response({'error': 'Item not found in cart'}, status=404)
+        cart.save(update_fields=['updated_at'])
         
         return Response(CartSerializer(cart, context={'request': request}).data)
     
@@ -292,69 +561,93 @@ class CartItemView(generics.GenericAPIView):
             CartItem.objects.filter(cart=cart, product_id=product_id).delete()
         else:
             cart.items.all().delete()
+        cart.save(update_fields=['updated_at'])
         
         return Response(CartSerializer(cart, context={'request': request}).data)
 
 
 # ==================== ORDERS ====================
 
+def orders_visible_to(user):
+    if user.role == 'admin':
+        return Order.objects.all()
+    elif user.role == 'manager':
+        return Order.objects.filter(restaurant__manager=user)
+    elif user.role == 'driver':
+        return Order.objects.filter(driver=user)
+    return Order.objects.filter(user=user)
+
+
+def order_state(request, pk):
+    """
+    (updated_at, estimated delivery) of a visible order, or None. Shared by the
+    ETag and Last-Modified checks so a 304 costs one query, two while an ETA is shown.
+    """
+    if not hasattr(request, '_order_state'):
+        order = (
+            orders_visible_to(request.user).filter(pk=pk).select_related('restaurant')
+            .only('updated_at', 'status', 'created_at', 'ready_at', 'restaurant__delivery_time').first()
+        )
+        request._order_state = (order.updated_at, eta.order_delivery_at(order)) if order else None
+    return request._order_state
+
+
+def order_last_modified(request, pk):
+    state = order_state(request, pk)
+    # An order in progress shows an ETA that moves with time and the ETA stats, not with updated_at
+    if state is None or state[1] is not None:
+        return None
+    return state[0]
+
+
+def order_etag(request, pk):
+    state = order_state(request, pk)
+    if state is None:
+        return None
+    updated_at, estimate = state
+    return make_etag(pk, updated_at.isoformat(), *get_versions(Restaurant), estimate.isoformat() if estimate else '')
+
+
+TRACKED_STATUSES = ('assigned', 'picked_up', 'delivering')
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'admin':
-            return Order.objects.all()
-        elif user.role == 'manager':
-            return Order.objects.filter(restaurant__manager=user)
-        elif user.role == 'driver':
-            return Order.objects.filter(driver=user)
-        return Order.objects.filter(user=user)
+        return orders_visible_to(self.request.user).for_display()
+    
+    @method_decorator(condition(etag_func=order_etag, last_modified_func=order_last_modified))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    def create(self, request, *args, **kwargs):
+        return Response({'error': 'Orders are placed with create_from_cart'}, status=405)
+    
+    def perform_update(self, serializer):
+        # Status and driver are read-only here: they change through update_status
+        order_flow.update(serializer.instance, **serializer.validated_data)
+    
+    def destroy(self, request, *args, **kwargs):
+        return Response({'error': 'Orders cannot be deleted; cancel them instead'}, status=405)
     
     @action(detail=False, methods=['post'])
+    @method_decorator(idempotent)
     def create_from_cart(self, request):
-        """Create order from cart"""
+        """Check out the cart: one order per restaurant under a checkout"""
         serializer = CreateOrderSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        cart = Cart.objects.get(user=request.user)
-        if not cart.items.exists():
+        checkout = order_flow.create_from_cart(request.user, serializer.validated_data)
+        if checkout is None:
             return Response({'error': 'Cart is empty'}, status=400)
         
-        # Get restaurant from first item
-        first_item = cart.items.first()
-        restaurant = first_item.product.restaurant
-        
-        # Calculate total
-        total = sum(item.subtotal for item in cart.items.all())
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            restaurant=restaurant,
-            total=total,
-            delivery_fee=restaurant.delivery_fee,
-            delivery_address=serializer.validated_data['delivery_address'],
-            customer_name=serializer.validated_data['customer_name'],
-            customer_phone=serializer.validated_data['customer_phone'],
-            notes=serializer.validated_data.get('notes', '')
-        )
-        
-        # Create order items
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                product_name=cart_item.product.name,
-                product_price=cart_item.product.price,
-                quantity=cart_item.quantity
-            )
-        
-        # Clear cart
-        cart.items.all().delete()
-        
-        return Response(OrderSerializer(order, context={'request': request}).data, 
+        checkout = Checkout.objects.prefetch_related(
+            Prefetch('orders', queryset=Order.objects.for_display().order_by('pk'))
+        ).get(pk=checkout.pk)
+        return Response(CheckoutSerializer(checkout, context={'request': request}).data, 
                        status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'])
@@ -364,16 +657,35 @@ class OrderViewSet(viewsets.ModelViewSet):
         new_status = request.data.get('status')
         driver_id = request.data.get('driver_id')
         
-        if new_status:
-            order.status = new_status
+        if new_status and new_status not in order_flow.STATUSES:
+            return Response({'error': 'Invalid status'}, status=400)
+        
+        changes = {}
         if driver_id:
-            order.driver_id = driver_id
+            changes['driver_id'] = driver_id
             if not new_status:
-                order.status = 'assigned'
+                new_status = 'assigned'
         
-        order.save()
+        if driver_id and order.driver_id is None:
+            # First assignment: must not overwrite a driver who claimed it meanwhile
+            if not order_flow.assign(order, driver_id, new_status):
+                return Response({'error': 'The order was assigned or changed meanwhile'}, status=409)
+        else:
+            order_flow.set_status(order, new_status or order.status, **changes)
         return Response(OrderSerializer(order, context={'request': request}).data)
     
+    @action(detail=True, methods=['get'])
+    def driver_location(self, request, pk=None):
+        """Latest known position of the order's driver while it is being delivered"""
+        # Polled while waiting: one query, without what get_object prefetches for display
+        order = generics.get_object_or_404(orders_visible_to(request.user).only('driver_id', 'status'), pk=pk)
+        if order.driver_id is None or order.status not in TRACKED_STATUSES:
+            return Response({'error': 'No driver is on the way'}, status=404)
+        position = tracking.latest_position(order.driver_id)
+        if position is None:
+            return Response({'error': 'The driver has not shared a position yet'}, status=404)
+        return Response({'driver': order.driver_id, **position})
+    
     @action(detail=False, methods=['get'])
     def pending(self, request):
         """Get pending orders for manager"""
@@ -382,6 +694,55 @@ class OrderViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+ORDER_EVENTS_KEEPALIVE = 15
+
+
+def jwt_user(request):
+    """The user of a valid ``Authorization: Bearer`` token on a plain Django request, or None."""
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result else None
+
+
+async def order_events(request):
+    """
+    Server-Sent Events stream of changes to the orders the user may see, so
+    clients can stop polling. Each event names the order and its new status;
+    a comment line is sent every ORDER_EVENTS_KEEPALIVE seconds of silence.
+    """
+    user = await sync_to_async(jwt_user)(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server (runserver included) buffers the whole stream, so the client would just hang
+        return JsonResponse({'error': 'Live updates need the ASGI server (config.asgi)'}, status=501)
+    channels = await sync_to_async(events.channels_for)(user)
+    # Subscribed before returning so no event is missed while the stream starts
+    subscription = events.get_broker().subscribe(channels)
+    
+    async def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    message = await subscription.get(timeout=ORDER_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if message is None:
+                    return
+                yield f'event: order\ndata: {message}\n\n'
+        finally:
+            subscription.close()
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # ==================== DRIVER ====================
 
 class DriverScheduleViewSet(viewsets.ModelViewSet):
@@ -400,13 +761,13 @@ class DriverScheduleViewSet(viewsets.ModelViewSet):
         
         # If no schedule exists, create default
         if not schedules.exists():
-            days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-            for day in days:
-                DriverSchedule.objects.create(
-                    driver=request.user,
-                    day=day,
-                    is_enabled=day not in ['saturday', 'sunday']
-                )
+            with transaction.atomic():
+                DriverSchedule.objects.bulk_create([
+                    DriverSchedule(driver=request.user, day=day, is_enabled=day not in ['saturday', 'sunday'])
+                    for day in shifts.WEEKDAYS
+                ])
+                # bulk_create sends no signals
+                shifts.refresh([request.user.id])
             schedules = self.get_queryset()
         
         serializer = self.get_serializer(schedules, many=True)
@@ -422,15 +783,15 @@ class DriverScheduleViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def update_day(self, request):
         day = request.data.get('day')
-        updates = {k: v for k, v in request.data.items() if k != 'day'}
-        
-        schedule, _ = DriverSchedule.objects.get_or_create(
-            driver=request.user, day=day
-        )
+        if day not in shifts.WEEKDAYS:
+            return Response({'error': f'day must be one of {", ".join(shifts.WEEKDAYS)}'}, status=400)
         
-        for key, value in updates.items():
-            setattr(schedule, key, value)
-        schedule.save()
+        schedule = DriverSchedule.objects.filter(driver=request.user, day=day).first() or DriverSchedule(
+            driver=request.user, day=day)
+        # Partial even for a new day: fields left out keep their defaults
+        serializer = DriverScheduleSerializer(schedule, data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        schedule = serializer.save()
         
         return Response(DriverScheduleSerializer(schedule).data)
 
@@ -438,16 +799,127 @@ class DriverScheduleViewSet(viewsets.ModelViewSet):
 class DriverMissionsView(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         user = self.request.user
         # Get assigned orders or ready orders without driver
-        return Order.objects.filter(
+        return (Order.objects.filter(
             driver=user
         ) | Order.objects.filter(
             driver__isnull=True,
             status='ready'
-        )
+        )).for_display()
+    
+    def list(self, request, *args, **kwargs):
+        """The missions, plus the planned route through the driver's active orders"""
+        response = super().list(request, *args, **kwargs)
+        if request.user.role == 'driver':
+            response.data['route'] = routes.driver_route(request.user.id)
+        return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def claim_mission(request, pk):
+    """Take a ready, unassigned order; 409 when another driver claimed it first."""
+    if request.user.role != 'driver':
+        return Response({'error': 'Unauthorized'}, status=403)
+    
+    order = Order.objects.filter(pk=pk, status='ready', driver__isnull=True).first()
+    if order is None or not order_flow.assign(order, request.user.id):
+        return Response({'error': 'This mission is no longer available'}, status=409)
+    return Response(OrderSerializer(order, context={'request': request}).data)
+
+
+def parse_coordinate(value, limit):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if -limit <= value <= limit else None
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def driver_location(request):
+    """Report the driver's position: ``{latitude, longitude}``, every few seconds while on duty."""
+    if request.user.role != 'driver':
+        return Response({'error': 'Unauthorized'}, status=403)
+    
+    latitude = parse_coordinate(request.data.get('latitude'), 90)
+    longitude = parse_coordinate(request.data.get('longitude'), 180)
+    if latitude is None or longitude is None:
+        return Response({'error': 'latitude and longitude must be valid coordinates'}, status=400)
+    tracking.record(request.user.id, latitude, longitude)
+    return Response(status=204)
+
+
+# ==================== SYNC ====================
+
+MAX_SYNC_CHANGES = 500
+SYNC_KEYS = {
+    'order': 'orders', 'product': 'products', 'restaurant': 'restaurants',
+    'category': 'categories', 'banner': 'banners',
+}
+# The filters of the public catalog querysets, so a sync never sends what a full load hides
+SYNC_VISIBLE = {
+    'product': {'is_available': True}, 'restaurant': {'is_active': True},
+    'category': {'is_active': True}, 'banner': {'is_active': True},
+}
+
+
+def synced_orders(user):
+    """Orders a sync may send ``user``: the visible ones, plus the mission pool for drivers."""
+    orders = orders_visible_to(user)
+    if user.role == 'driver':
+        orders = orders | Order.objects.filter(driver__isnull=True, status='ready')
+    return orders
+
+
+def synced_data(request, kind, ids):
+    """The current representation of the objects of ``kind`` among ``ids``."""
+    if not ids:
+        return []
+    if kind == 'order':
+        orders = synced_orders(request.user).filter(pk__in=ids).for_display()
+        return OrderSerializer(orders, many=True, context={'request': request}).data
+    objects = sync.KIND_MODELS[kind].objects.filter(pk__in=ids, **SYNC_VISIBLE[kind])
+    if kind == 'banner':
+        return BannerSerializer(objects, many=True, context={'request': request}).data
+    rows = {'product': ProductRows, 'restaurant': RestaurantRows, 'category': CategoryRows}[kind](request)
+    return rows.serialize(rows.prepare(objects))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """
+    Orders and catalog objects changed after ``?since=<cursor>``, plus the ids
+    deleted or no longer visible (``removed``). Without ``since`` only the current
+    cursor is returned, to sync from after a full load. While ``more`` is true,
+    call again with the new cursor; 410 means the cursor is too old to sync from.
+    """
+    since = request.query_params.get('since')
+    if since is None:
+        return Response({'cursor': sync.current_cursor()})
+    try:
+        since = int(since)
+    except ValueError:
+        return Response({'error': 'since must be a cursor returned by this endpoint'}, status=400)
+    
+    result = sync.changes_since(request.user, since, MAX_SYNC_CHANGES)
+    if result is None:
+        return Response({'error': 'The cursor is too old, reload and sync again'}, status=410)
+    cursor, changes, more = result
+    
+    data = {'cursor': cursor, 'more': more, 'removed': {}}
+    for kind, key in SYNC_KEYS.items():
+        logged = changes.get(kind, {})
+        data[key] = synced_data(request, kind, [pk for pk, deleted in logged.items() if not deleted])
+        sent = {item['id'] for item in data[key]}
+        data['removed'][key] = sorted(set(logged) - sent)
+    return Response(data)
 
 
 # ==================== BANNERS & SETTINGS ====================
@@ -469,6 +941,17 @@ class BannerViewSet(viewsets.ModelViewSet):
                 return Banner.objects.filter(restaurant=restaurant)
         return Banner.objects.filter(is_active=True)
     
+    @method_decorator(condition(etag_func=catalog_etag(Banner, per_user=True)))
+    def list(self, request, *args, **kwargs):
+        # Managers see their own restaurant's banners, so only the public list is shared
+        if request.user.is_authenticated and request.user.role == 'manager':
+            return super().list(request, *args, **kwargs)
+        return self.public_list(request, *args, **kwargs)
+    
+    @method_decorator(catalog_cached(Banner))
+    def public_list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
     def perform_create(self, serializer):
         user = self.request.user
         if user.role == 'manager':
@@ -483,6 +966,8 @@ class BannerViewSet(viewsets.ModelViewSet):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@condition(etag_func=catalog_etag(AppSettings))
+@catalog_cached(AppSettings)
 def app_settings(request):
     settings = AppSettings.objects.all()
     data = {s.key: s.value for s in settings}
@@ -498,7 +983,7 @@ def manager_restaurant(request):
     if user.role not in ['manager', 'admin']:
         return Response({'error': 'Unauthorized'}, status=403)
     
-    restaurant = Restaurant.objects.filter(manager=user).first()
+    restaurant = Restaurant.objects.for_detail().filter(manager=user).first()
     if not restaurant:
         return Response({'error': 'No restaurant found'}, status=404)
     
@@ -513,19 +998,17 @@ def manager_dashboard(request):
         return Response({'error': 'Unauthorized'}, status=403)
     
     if user.role == 'manager':
-        orders = Order.objects.filter(restaurant__manager=user)
+        counters = rollups.dashboard(Restaurant.objects.filter(manager=user).values('id'))
         products = Product.objects.filter(restaurant__manager=user)
     else:
-        orders = Order.objects.all()
+        counters = rollups.dashboard()
         products = Product.objects.all()
     
-    today = timezone.now().date()
-    today_orders = orders.filter(created_at__date=today)
-    
+    # Order figures come from the daily rollups, not from scanning orders
     stats = {
-        'total_orders': orders.count(),
-        'pending_orders': orders.filter(status__in=['pending', 'accepted', 'preparing']).count(),
-        'today_revenue': today_orders.aggregate(Sum('total'))['total__sum'] or 0,
+        'total_orders': counters['all_time']['orders'],
+        'pending_orders': counters['all_time']['pending'],
+        'today_revenue': counters['today']['revenue'],
         'total_products': products.count(),
     }
     
@@ -552,6 +1035,104 @@ def driver_dashboard(request):
     return Response(DriverStatsSerializer(stats).data)
 
 
+# ==================== ANALYTICS ====================
+
+MAX_REPORT_DAYS = 366
+
+
+def report_scope(request):
+    """
+    (start, end, restaurant_ids) for an analytics report, or an error Response.
+    The period is ?start=&end= (ISO dates) or the last ?days (default 30);
+    managers see their restaurant, admins everything or ?restaurant_id.
+    """
+    user = request.user
+    if user.role == 'manager':
+        restaurant_ids = list(Restaurant.objects.filter(manager=user).values_list('id', flat=True))
+    elif user.role == 'admin':
+        restaurant_id = request.query_params.get('restaurant_id')
+        restaurant_ids = None
+        if restaurant_id:
+            if not restaurant_id.isdigit():
+                return Response({'error': 'Invalid restaurant_id'}, status=400)
+            restaurant_ids = [int(restaurant_id)]
+    else:
+        return Response({'error': 'Unauthorized'}, status=403)
+    
+    try:
+        end = rollups.local_date()
+        if request.query_params.get('end'):
+            end = date.fromisoformat(request.query_params['end'])
+        if request.query_params.get('start'):
+            start = date.fromisoformat(request.query_params['start'])
+        else:
+            days = int(request.query_params.get('days', 30))
+            # Checked before subtracting: a huge value would overflow timedelta
+            if not 1 <= days <= MAX_REPORT_DAYS:
+                return Response({'error': f'The period must cover 1 to {MAX_REPORT_DAYS} days'}, status=400)
+            start = end - timedelta(days=days - 1)
+    except ValueError:
+        return Response({'error': 'Use ISO dates for start/end and an integer for days'}, status=400)
+    except OverflowError:
+        return Response({'error': 'The period starts before the first supported date'}, status=400)
+    if start > end or (end - start).days >= MAX_REPORT_DAYS:
+        return Response({'error': f'The period must cover 1 to {MAX_REPORT_DAYS} days'}, status=400)
+    return start, end, restaurant_ids
+
+
+def report_response(scope, data):
+    start, end, _ = scope
+    return Response({'start': start, 'end': end, 'results': data})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def revenue_report(request):
+    """Revenue and orders per ?period=day (default) or week."""
+    scope = report_scope(request)
+    if isinstance(scope, Response):
+        return scope
+    period = request.query_params.get('period', 'day')
+    if period not in ('day', 'week'):
+        return Response({'error': 'period must be day or week'}, status=400)
+    return report_response(scope, rollups.revenue(*scope, period=period))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def orders_by_hour_report(request):
+    scope = report_scope(request)
+    if isinstance(scope, Response):
+        return scope
+    return report_response(scope, rollups.orders_by_hour(*scope))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def top_products_report(request):
+    """Best sellers ranked ?by=quantity (default) or revenue, ?limit (default 10)."""
+    scope = report_scope(request)
+    if isinstance(scope, Response):
+        return scope
+    by = request.query_params.get('by', 'quantity')
+    if by not in ('quantity', 'revenue'):
+        return Response({'error': 'by must be quantity or revenue'}, status=400)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=400)
+    return report_response(scope, rollups.top_products(*scope, by=by, limit=limit))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def basket_report(request):
+    scope = report_scope(request)
+    if isinstance(scope, Response):
+        return scope
+    return report_response(scope, rollups.basket(*scope))
+
+
 # ==================== TEAM MEMBERS ====================
 
 class TeamMemberViewSet(viewsets.ModelViewSet):
@@ -584,10 +1165,23 @@ class AdminUserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = UserKeysetPagination
     
     @action(detail=False, methods=['get'])
     def drivers(self, request):
+        """Drivers; ``?on_shift=now`` (or an ISO datetime) keeps those on shift then"""
         drivers = User.objects.filter(role='driver')
+        on_shift = request.query_params.get('on_shift')
+        if on_shift == 'now':
+            drivers = shifts.on_shift()
+        elif on_shift:
+            try:
+                when = parse_datetime(on_shift)
+            except ValueError:
+                when = None
+            if when is None:
+                return Response({'error': 'on_shift must be "now" or an ISO datetime'}, status=400)
+            drivers = shifts.on_shift(when if timezone.is_aware(when) else timezone.make_aware(when))
         serializer = self.get_serializer(drivers, many=True)
         return Response(serializer.data)
     
@@ -68,6 +68,19 @@ DATABASES = {
     }
 }
 
+# Cache
+# LocMemCache is per-process; point this at a shared backend (Redis, Memcached)
+# when running several workers so catalog invalidations reach all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benineats',
+    }
+}
+
+# Seconds a cached catalog response may live; writes invalidate it sooner
+CATALOG_CACHE_TIMEOUT = 300
+
 # Custom User Model
 AUTH_USER_MODEL = 'api.User'
 
@@ -93,6 +106,15 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Threads rendering resized image variants after uploads (0 = inline, after commit)
+IMAGE_WORKERS = 2
+
+# How long a replayable Idempotency-Key response is kept, in seconds
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Pub/sub behind the order event stream; LocalBroker only reaches clients of the same process
+ORDER_EVENTS_BROKER = 'api.events.LocalBroker'
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
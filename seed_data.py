@@ -35,6 +35,8 @@ restaurants_data = [
         'name': 'Chez Maman Aïcha',
         'description': 'Cuisine béninoise traditionnelle, plats faits maison avec amour',
         'address': 'Cotonou, Haie Vive, Rue 123',
+        'latitude': 6.3573,
+        'longitude': 2.392,
         'phone': '+229 97 00 00 01',
         'rating': 4.8,
         'rating_count': 234,
@@ -46,6 +48,8 @@ restaurants_data = [
         'name': 'Le Roi du Poisson',
         'description': 'Spécialités de poissons frais, grillés ou braisés',
         'address': 'Cotonou, Akpakpa, Boulevard Principal',
+        'latitude': 6.3622,
+        'longitude': 2.449,
         'phone': '+229 97 00 00 02',
         'rating': 4.5,
         'rating_count': 189,
@@ -57,6 +61,8 @@ restaurants_data = [
         'name': 'Fast Délice',
         'description': 'Burgers, pizzas et snacks rapides',
         'address': 'Cotonou, Ganhi',
+        'latitude': 6.3548,
+        'longitude': 2.4301,
         'phone': '+229 97 00 00 03',
         'rating': 4.2,
         'rating_count': 156,
@@ -68,6 +74,8 @@ restaurants_data = [
         'name': 'Saveurs du Bénin',
         'description': 'Le meilleur de la gastronomie béninoise',
         'address': 'Porto-Novo, Centre Ville',
+        'latitude': 6.4969,
+        'longitude': 2.6283,
         'phone': '+229 97 00 00 04',
         'rating': 4.7,
         'rating_count': 312,